@@ -0,0 +1,7 @@
+from django.contrib import admin
+from .models import FairShareWeight
+
+
+@admin.register(FairShareWeight)
+class FairShareWeightAdmin(admin.ModelAdmin):
+    list_display = ['user', 'group', 'weight', 'max_running_jobs']
@@ -0,0 +1,181 @@
+import asyncio
+import contextlib
+import os
+import re
+import tarfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .coadd_files import DES_BANDS
+from .log import get_logger
+logger = get_logger(__name__)
+
+ARCHIVE_FORMATS = ['tar', 'zip']
+# Number of objects requested from the object store ahead of the one being streamed
+ARCHIVE_PREFETCH = 4
+
+
+def filter_job_files(job_files, bands='', file_types=''):
+    '''Select job files by band and by file type.
+
+    "bands" and "file_types" are comma-separated lists such as "g,r" and "fits,png". The band of
+    a FITS cutout is the suffix of its name, "<thumbname>_<band>.fits", so selecting bands
+    excludes the other files. Returns the selected (path, size) pairs.
+    '''
+    bands = set([band for band in re.split(r'[\s,]+', bands) if band])
+    file_types = set([file_type.lower().lstrip('.') for file_type in re.split(r'[\s,]+', file_types) if file_type])
+    selected = []
+    for path, size in job_files:
+        name = os.path.basename(path)
+        if file_types and name.rsplit('.', 1)[-1].lower() not in file_types:
+            continue
+        if bands and not any([name.endswith(f'_{band}.fits') for band in bands.intersection(DES_BANDS)]):
+            continue
+        selected.append((path, size))
+    return selected
+
+
+def close_stream(stream):
+    '''Close an object stream, which returns its connection to the object store client pool.'''
+    if hasattr(stream, 'close'):
+        stream.close()
+
+
+def close_requested_stream(future):
+    if not future.cancelled() and future.exception() is None:
+        close_stream(future.result())
+
+
+def prefetch_streams(open_stream, paths):
+    '''Yield the path and the open stream of each object, requesting the next objects in the background.
+
+    Each stream is closed when the next one is requested. If the generator is closed early, as
+    when the client disconnects, the current stream and the streams requested ahead are closed.
+    '''
+    executor = ThreadPoolExecutor(max_workers=ARCHIVE_PREFETCH)
+    pending = deque()
+    stream = None
+    try:
+        paths = iter(paths)
+        for path in paths:
+            pending.append((path, executor.submit(open_stream, path)))
+            if len(pending) >= ARCHIVE_PREFETCH:
+                break
+        while pending:
+            path, future = pending.popleft()
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append((next_path, executor.submit(open_stream, next_path)))
+            stream = future.result()
+            yield path, stream
+            close_stream(stream)
+            stream = None
+    finally:
+        if stream is not None:
+            close_stream(stream)
+        # Requests that are still running close their stream when they complete
+        for path, future in pending:
+            future.cancel()
+            future.add_done_callback(close_requested_stream)
+        executor.shutdown(wait=False)
+
+
+async def async_stream(iterator):
+    '''Iterate over a synchronous iterator in a thread, one item at a time.
+
+    Under ASGI, Django reads synchronous streaming content in a single call, so an archive would
+    be assembled in memory before it is sent. The items are read in a thread of their own, which
+    also closes the iterator if the response is not sent to the end.
+    '''
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1)
+    end = object()
+    try:
+        while True:
+            item = await loop.run_in_executor(executor, next, iterator, end)
+            if item is end:
+                break
+            yield item
+    finally:
+        # The close runs after any pending read of the same thread
+        if hasattr(iterator, 'close'):
+            executor.submit(iterator.close)
+        executor.shutdown(wait=False)
+
+
+def tar_stream(entries, open_stream, mtime=0):
+    '''Generate a tar archive of objects without buffering them.
+
+    "entries" lists the (archive name, object path, size) of each file and "open_stream" returns
+    an iterator over the bytes of an object path. The sizes must match the objects, because each
+    member header is written before its content.
+    '''
+    sizes = {path: (name, size) for name, path, size in entries}
+    with contextlib.closing(prefetch_streams(open_stream, [path for name, path, size in entries])) as streams:
+        for path, stream in streams:
+            name, size = sizes[path]
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mtime = mtime
+            info.mode = 0o644
+            yield info.tobuf(format=tarfile.PAX_FORMAT)
+            written = 0
+            for chunk in stream:
+                written += len(chunk)
+                yield chunk
+            if written != size:
+                raise IOError(f'Object "{path}" has {written} bytes, not {size} bytes')
+            if size % tarfile.BLOCKSIZE:
+                yield tarfile.NUL * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE)
+    # End of archive marker
+    yield tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+
+
+class ZipBuffer:
+    '''Write-only file object that collects the bytes written by ZipFile until they are drained.'''
+
+    def __init__(self) -> None:
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def zip_stream(entries, open_stream, mtime=0):
+    '''Generate a zip archive of objects without buffering them.
+
+    The files are stored without compression, because FITS cutouts and images compress poorly
+    and the archive should stream as fast as the object store. The arguments are as for tar_stream.
+    '''
+    names = {path: name for name, path, size in entries}
+    # Zip timestamps start in 1980
+    date_time = time.gmtime(max(mtime, 315532800))[:6]
+    buffer = ZipBuffer()
+    streams = prefetch_streams(open_stream, [path for name, path, size in entries])
+    with contextlib.closing(streams), zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED,
+                                                      allowZip64=True) as archive:
+        for path, stream in streams:
+            info = zipfile.ZipInfo(names[path], date_time=date_time)
+            info.external_attr = 0o644 << 16
+            with archive.open(info, mode='w', force_zip64=True) as member:
+                for chunk in stream:
+                    member.write(chunk)
+                    yield buffer.drain()
+            yield buffer.drain()
+    # The central directory is written when the archive is closed
+    yield buffer.drain()
@@ -15,10 +15,13 @@ app = Celery(
     imports=[
         'cutout.tasks',
         'cutout.tasks_system',
+        'cutout.tasks_sync',
+        'cutout.reuse',
     ],
     task_default_queue='jobs',
     task_routes={
         'cutout.tasks_system.*': {'queue': 'api'},
+        'cutout.tasks_sync.*': {'queue': 'sync'},
     },
     result_expires=3600,
     task_track_started=True,
@@ -0,0 +1,109 @@
+import re
+import threading
+from collections import OrderedDict
+import duckdb
+import numpy as np
+from des_cutter import fitsfinder
+from django.conf import settings
+from .log import get_logger
+logger = get_logger(__name__)
+
+COADD_FILE_COLUMNS = ['TILENAME', 'PATH', 'FILENAME', 'COMPRESSION', 'BAND']
+DES_BANDS = ['g', 'r', 'i', 'z', 'Y']
+
+
+class CoaddFileResolver:
+    '''Per-process LRU cache of the coadd file records of each tile, resolved in batches.
+
+    The records (PATH, FILENAME, COMPRESSION, BAND) of all the tiles missing from the cache are
+    fetched with a single query on the coadd file table, named by CUTOUT_COADD_FILE_TABLE or
+    found automatically if there is exactly one table with those columns. Without such a
+    table, each missing tile is resolved with fitsfinder.get_coaddfiles_tilename. Cached records
+    already have the compression fixed and are keyed by tilename and bands.
+    '''
+
+    def __init__(self, table=None, max_entries=None) -> None:
+        self.table = settings.CUTOUT_COADD_FILE_TABLE if table is None else table
+        self.max_entries = settings.CUTOUT_COADD_FILE_CACHE_SIZE if max_entries is None else max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.table_checked = bool(self.table)
+
+    def bands_key(self, bands):
+        return bands if isinstance(bands, str) else tuple(bands)
+
+    def band_list(self, bands):
+        '''Return the requested bands as a list, or None for all bands.'''
+        if isinstance(bands, str):
+            if bands.strip().lower() == 'all':
+                return None
+            return [band for band in re.split(r'[\s,]+', bands) if band]
+        return list(bands)
+
+    def find_table(self, dbh):
+        if not self.table_checked:
+            self.table_checked = True
+            tables = dbh.execute(f'''
+                SELECT table_name FROM information_schema.columns
+                WHERE upper(column_name) IN ({', '.join([f"'{column}'" for column in COADD_FILE_COLUMNS])})
+                GROUP BY table_name HAVING count(DISTINCT upper(column_name)) = {len(COADD_FILE_COLUMNS)}
+            ''').fetchall()
+            if len(tables) == 1:
+                self.table = tables[0][0]
+                logger.info(f'Resolving coadd files with batched queries on "{self.table}".')
+            else:
+                logger.info('Resolving coadd files with a query per tile.')
+        return self.table
+
+    def query(self, tilenames, dbh, bands):
+        '''Fetch the coadd file records of several tiles with one query. Missing tiles map to False.'''
+        band_list = self.band_list(bands)
+        query = f'''
+            SELECT {', '.join(COADD_FILE_COLUMNS)} FROM {self.table}
+            WHERE TILENAME IN (SELECT unnest($tilenames))
+        '''
+        params = {'tilenames': list(tilenames)}
+        if band_list is not None:
+            query += ' AND BAND IN (SELECT unnest($bands))'
+            params['bands'] = band_list
+        # Order the records, so that the files of a tile are cut in the same order in every job
+        query += ' ORDER BY TILENAME, BAND'
+        rows = dbh.execute(query, params).fetchall()
+        records = {tilename: False for tilename in tilenames}
+        by_tile = {}
+        for row in rows:
+            by_tile.setdefault(row[0], []).append(row[1:])
+        for tilename, tile_rows in by_tile.items():
+            records[tilename] = np.rec.fromarrays(list(zip(*tile_rows)), names=COADD_FILE_COLUMNS[1:])
+        return records
+
+    def resolve(self, tilenames, dbh, bands='all'):
+        '''Return a dict mapping each tilename to its coadd file records, or False if it has none.'''
+        bands_key = self.bands_key(bands)
+        resolved = {}
+        with self.lock:
+            for tilename in tilenames:
+                key = (tilename, bands_key)
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    resolved[tilename] = self.entries[key]
+        missing = [tilename for tilename in dict.fromkeys(tilenames) if tilename not in resolved]
+        if missing:
+            records = None
+            if self.find_table(dbh):
+                try:
+                    records = self.query(missing, dbh, bands)
+                except duckdb.Error as err:
+                    logger.warning(f'Batched coadd file query failed, querying each tile: {err}')
+            if records is None:
+                records = {tilename: fitsfinder.get_coaddfiles_tilename(tilename, dbh, bands=bands)
+                           for tilename in missing}
+            with self.lock:
+                for tilename, filenames in records.items():
+                    # Fix compression for SV1/Y2A1/Y3A1 releases
+                    if filenames is not False:
+                        filenames = fitsfinder.fix_compression(filenames)
+                    resolved[tilename] = self.entries[(tilename, bands_key)] = filenames
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return resolved
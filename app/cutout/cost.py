@@ -0,0 +1,79 @@
+import duckdb
+import numpy as np
+from django.conf import settings
+from .coadd_files import DES_BANDS
+from .input_table import load_input_table
+from .tasks import s3, tile_index, coadd_file_resolver
+from .log import get_logger
+logger = get_logger(__name__)
+
+# Pixel scale of the DES coadd images in arcsec
+DES_PIXEL_SCALE = 0.263
+
+
+def job_queue(runtime):
+    '''Return the jobs queue for a job with the predicted runtime in seconds.'''
+    if runtime <= settings.CUTOUT_QUEUE_FAST_MAX_RUNTIME:
+        return settings.CUTOUT_QUEUE_FAST
+    if runtime >= settings.CUTOUT_QUEUE_BULK_MIN_RUNTIME:
+        return settings.CUTOUT_QUEUE_BULK
+    return settings.CUTOUT_QUEUE_STANDARD
+
+
+def estimate_job_cost(config, df=None):
+    '''Estimate the size and runtime of a cutout job from its processed config.
+
+    The positions are matched to tiles with the in-memory tile index, and every matched tile
+    is counted with a band file per selected band, so that the estimate does not query the
+    metadata database per position or per tile in the request. LookupError is raised if the
+    tile index is disabled or unavailable. The output pixels are the FITS cutout pixels of
+    every matched position in every band file of its tile. The runtime is predicted from
+    these counts with the CUTOUT_COST_* coefficients and selects the jobs queue. Returns a
+    dict with the "positions", "tiles", "band_files", "output_pixels", "runtime" (seconds)
+    and "queue".
+    '''
+    if not settings.CUTOUT_TILE_INDEX_ENABLED:
+        raise LookupError('The tile index is disabled')
+    if df is None:
+        df = load_input_table(s3, config)
+    positions = len(df)
+    # The database is only read once per process, to load the tile index
+    dbh = None if tile_index.loaded else duckdb.connect(settings.CUTOUT_DATA_DB_PATH_DES, read_only=True)
+    try:
+        tilenames, indices, tilenames_matched = tile_index.find_tilenames_radec(df.RA.values, df.DEC.values, dbh)
+    except duckdb.Error as err:
+        raise LookupError(f'The tile index is unavailable: {err}')
+    finally:
+        if dbh:
+            dbh.close()
+    band_list = coadd_file_resolver.band_list(config.get('bands', 'all'))
+    tile_bands = {tilename: len(band_list or DES_BANDS) for tilename in tilenames}
+
+    xsize = df.XSIZE.to_numpy(dtype=float) if 'XSIZE' in df else np.full(positions, float(config.get('xsize', 1)))
+    ysize = df.YSIZE.to_numpy(dtype=float) if 'YSIZE' in df else np.full(positions, float(config.get('ysize', 1)))
+    # Cutout sizes are in arcmin
+    pixels = (xsize * 60 / DES_PIXEL_SCALE) * (ysize * 60 / DES_PIXEL_SCALE)
+    output_pixels = sum([pixels[indices[tilename]].sum() * tile_bands[tilename] for tilename in tilenames])
+    band_files = sum(tile_bands.values())
+    matched = sum([len(indices[tilename]) for tilename in tilenames if tile_bands[tilename]])
+    runtime = (settings.CUTOUT_COST_SECONDS_OVERHEAD
+               + settings.CUTOUT_COST_SECONDS_PER_BAND_FILE * band_files
+               + settings.CUTOUT_COST_SECONDS_PER_MPIXEL * output_pixels / 1e6
+               + settings.CUTOUT_COST_SECONDS_PER_POSITION * matched)
+    return {
+        'positions': positions,
+        'tiles': len(tilenames),
+        'band_files': band_files,
+        'output_pixels': int(output_pixels),
+        'runtime': round(runtime, 1),
+        'queue': job_queue(runtime),
+    }
+
+
+def job_estimate(config, df=None):
+    '''Return the cost estimate of a job. If it cannot be estimated, the job uses the standard queue.'''
+    try:
+        return estimate_job_cost(config, df=df)
+    except Exception as err:
+        logger.warning(f'Unable to estimate the job cost: {err}')
+        return {'queue': settings.CUTOUT_QUEUE_STANDARD}
@@ -0,0 +1,94 @@
+import os
+import re
+import pandas
+from .coadd_files import DES_BANDS
+from .input_table import read_input_table, load_input_table, store_input_table
+from .input_table import validate_input_table, validate_cutout_size_from_table
+from .models import JobFile
+from .log import get_logger
+logger = get_logger(__name__)
+
+# Config keys that the config delta of a derived job may set
+DERIVE_CONFIG_KEYS = ['bands', 'input_csv']
+
+
+def band_set(bands):
+    '''Return the set of bands selected by a config "bands" value.'''
+    if isinstance(bands, str):
+        if bands.strip().lower() == 'all':
+            return set(DES_BANDS)
+        bands = [band for band in re.split(r'[\s,]+', bands) if band]
+    return set(bands)
+
+
+def derive_job_config(s3, parent, delta, job_id):
+    '''Return the config of a job derived from a finished parent job and a config delta.
+
+    The delta selects other bands with "bands" and appends positions with the CSV text in
+    "input_csv". Appended rows must follow the cutout size specification of the parent table,
+    either per-position XSIZE and YSIZE columns or the global sizes of the parent config. The
+    parent and appended rows are stored as the coordinate table of the job, and "derived_from"
+    records the parent job, its number of positions and its bands. Returns the config, an error
+    message, which is empty if valid, and the coordinate table of the job.
+    '''
+    config = {key: value for key, value in parent.config.items() if key != 'derived_from'}
+    if not isinstance(delta, dict):
+        return config, 'The config delta must be an object', None
+    unknown = [key for key in delta if key not in DERIVE_CONFIG_KEYS]
+    if unknown:
+        return config, (f'''Derived jobs can only change {', '.join(DERIVE_CONFIG_KEYS)}, '''
+                        f'''not {', '.join(unknown)}'''), None
+    if not delta.get('input_csv') and band_set(delta.get('bands', config['bands'])) == band_set(config['bands']):
+        return config, 'The config delta must change the bands or add positions', None
+    bands = delta.get('bands', config['bands'])
+    if not band_set(bands) or not band_set(bands).issubset(DES_BANDS):
+        return config, f'''Bands must be "all" or a list of the bands {', '.join(DES_BANDS)}''', None
+    if not JobFile.objects.filter(job=parent).exists():
+        return config, 'The output files of the parent job are no longer available', None
+    df = load_input_table(s3, parent.config)
+    positions = len(df)
+    # The parent table has per-position sizes if the processed config has no global sizes
+    columns = ['RA', 'DEC'] if 'xsize' in config else ['RA', 'DEC', 'XSIZE', 'YSIZE']
+    if delta.get('input_csv'):
+        try:
+            new_df = read_input_table(delta['input_csv'])
+        except Exception as err:
+            return config, f'Coordinate table parsing error: {err}', None
+        err_msg = validate_input_table(new_df)
+        if err_msg:
+            return config, err_msg, None
+        if (validate_cutout_size_from_table(new_df) == '') != ('xsize' not in config):
+            return config, 'Appended positions must have the same cutout size specification as the parent job', None
+        df = pandas.concat([df[columns], new_df[columns]], ignore_index=True)
+    config.update({
+        'bands': bands,
+        'input_csv': '',
+        'input_table': store_input_table(s3, job_id, df[columns]),
+        'derived_from': {
+            'job': str(parent.uuid),
+            'positions': positions,
+            'bands': parent.config['bands'],
+        },
+    })
+    return config, '', df[columns]
+
+
+def parent_output_copies(parent_paths, thumbnames, bands, colors, src_root_path, dst_root_path):
+    '''Select the output files of a parent job that apply to a derived job.
+
+    The output files of a position begin with its thumbnail base name. FITS cutouts, named
+    "<thumbname>_<band>.fits", apply if their band is selected, and the other files, the color
+    images, apply if "colors" is set. Returns the (source path, destination path) pairs to copy.
+    '''
+    thumbnames = set(thumbnames)
+    name_lengths = set([len(thumbname) for thumbname in thumbnames])
+    copies = []
+    for path in parent_paths:
+        name = os.path.basename(path)
+        if not any([name[:name_length] in thumbnames for name_length in name_lengths]):
+            continue
+        band = [band for band in DES_BANDS if name.endswith(f'_{band}.fits')]
+        if (band and band[0] in bands) or (not band and colors):
+            rel_path = path.strip('/')
+            copies.append((os.path.join(src_root_path, rel_path), os.path.join(dst_root_path, rel_path)))
+    return copies
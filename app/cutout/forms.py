@@ -1,22 +1,21 @@
 from django import forms
 from django.core.exceptions import ValidationError
-import pandas
-import io
+from .input_table import read_input_table, validate_input_table
 from .log import get_logger
 logger = get_logger(__name__)
 
 
 def validate_csv(value):
+    '''Parse and validate the coordinate table text and return the parsed table.'''
     try:
-        df = pandas.read_csv(io.StringIO(value), comment='#', skipinitialspace=True)
-        df.to_csv(index=False)
-        assert len(df.RA.values)
-        assert len(df.DEC.values)
-        assert len(df.RA.values) == len(df.DEC.values)
-        return True
+        df = read_input_table(value)
+        err_msg = validate_input_table(df)
     except Exception as err:
-        logger.error(err)
-        raise ValidationError(str(err))
+        err_msg = str(err)
+    if err_msg:
+        logger.error(err_msg)
+        raise ValidationError(err_msg)
+    return df
 
 
 class CutoutForm(forms.Form):
@@ -54,7 +53,12 @@ class CutoutForm(forms.Form):
                                     'placeholder': 'RA,DEC,XSIZE,YSIZE,ID\n',
                                     'style': 'width: 300px;',
                                     'class': 'form-control'}),
-                                validators=[validate_csv],
                                 initial=('''RA,DEC,XSIZE,YSIZE,ID\n'''
                                          '''0.29782658,0.029086056,3,3,1111\n'''
                                          '''1.0319154,0.026711725,3,3,1111\n'''))
+
+    def clean_input_csv(self):
+        input_csv = self.cleaned_data['input_csv'].replace('\r\n', '\n')
+        # Keep the parsed table, so that the job config is processed without parsing it again
+        self.cleaned_data['input_df'] = validate_csv(input_csv)
+        return input_csv
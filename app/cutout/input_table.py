@@ -0,0 +1,209 @@
+import hashlib
+import io
+import os
+import tempfile
+import numpy as np
+import pandas
+import pyarrow.parquet as pq
+from django.conf import settings
+from .models import InputTable
+from .log import get_logger
+logger = get_logger(__name__)
+
+INPUT_TABLE_FILENAME = 'input.parquet'
+
+
+def read_input_table(text):
+    '''Parse the CSV text of a coordinate table into a DataFrame.'''
+    return pandas.read_csv(io.StringIO(text.replace('\r\n', '\n')), comment='#', skipinitialspace=True)
+
+
+def validate_cutout_size_from_table(df):
+    '''Determine if the cutout size spec, if present, in the input DataFrame is valid.'''
+    # If cutout size is not specified in table, it is valid
+    if 'XSIZE' not in df or 'YSIZE' not in df:
+        return 'no size spec'
+    sizes = df[['XSIZE', 'YSIZE']]
+    if not all([pandas.api.types.is_numeric_dtype(dtype) for dtype in sizes.dtypes]):
+        return 'Non-numeric value'
+    sizes = sizes.to_numpy(dtype=float)
+    if np.isnan(sizes).any():
+        return 'NaN detected'
+    if (sizes <= 0).any():
+        return 'Value must be greater than zero'
+    return ''
+
+
+def validate_input_table(df):
+    '''Validate the coordinate table. Return empty string if valid; return error message if not.'''
+    if 'RA' not in df or 'DEC' not in df or not len(df):
+        return 'Coordinate table must have one or more RA and DEC values'
+    coords = df[['RA', 'DEC']]
+    if (not all([pandas.api.types.is_numeric_dtype(dtype) for dtype in coords.dtypes])
+            or not np.isfinite(coords.to_numpy(dtype=float)).all()):
+        return 'Coordinate table RA and DEC values must be numeric values'
+    if (df.DEC.abs() > 90).any():
+        return 'Coordinate table DEC values must be between -90 and 90'
+    err_msg = validate_cutout_size_from_table(df)
+    if err_msg and err_msg != 'no size spec':
+        return f'Invalid cutout size specification in coordinate table: {err_msg}'
+    return ''
+
+
+def input_table_path(job_id):
+    return os.path.join(settings.S3_BASE_DIR, f'''jobs/{job_id}''', INPUT_TABLE_FILENAME)
+
+
+def store_input_table(s3, job_id, df):
+    '''Write the coordinate table to the job folder as a Parquet file and return a reference to it.'''
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    path = input_table_path(job_id)
+    s3.put_object(path=path, data=buffer.getvalue())
+    return {'path': path, 'rows': len(df)}
+
+
+def read_input_file(file_path, table_format):
+    '''Read a CSV, FITS or Parquet coordinate table file into a DataFrame.'''
+    if table_format == InputTable.TableFormat.PARQUET:
+        return pandas.read_parquet(file_path)
+    if table_format == InputTable.TableFormat.FITS:
+        from astropy.table import Table
+        return Table.read(file_path, format='fits').to_pandas()
+    return pandas.read_csv(file_path, comment='#', skipinitialspace=True)
+
+
+def table_format_from_name(name):
+    '''Return the table format implied by a file name extension, defaulting to CSV.'''
+    name = name.lower()
+    if name.endswith(('.parquet', '.pq')):
+        return InputTable.TableFormat.PARQUET
+    if name.endswith(('.fits', '.fit', '.fits.gz', '.fit.gz')):
+        return InputTable.TableFormat.FITS
+    return InputTable.TableFormat.CSV
+
+
+def uploaded_table_path(table_id):
+    return os.path.join(settings.S3_BASE_DIR, 'tables', str(table_id))
+
+
+def uploaded_table_file_path(table_id):
+    return os.path.join(uploaded_table_path(table_id), INPUT_TABLE_FILENAME)
+
+
+def upload_part_path(table_id, offset):
+    return os.path.join(uploaded_table_path(table_id), 'parts', f'{offset:015d}')
+
+
+def complete_table_upload(s3, table, checksum=''):
+    '''Assemble the uploaded parts of a table, validate it and store it as a Parquet file.
+
+    The parts are concatenated in offset order into a temporary file, which is parsed once.
+    The number of rows and the SHA-256 checksum of the uploaded file are recorded, and the
+    upload fails if an expected checksum is given and does not match. Returns an error
+    message, which is empty if the table is ready for use.
+    '''
+    root_path = uploaded_table_path(table.uuid)
+    parts = sorted([obj.object_name for obj in s3.list_objects(f'{root_path}/parts/')])
+    digest = hashlib.sha256()
+    err_msg = ''
+    with tempfile.NamedTemporaryFile(dir=settings.INPUT_TABLE_UPLOAD_DIR or None) as upload_file:
+        for part in parts:
+            for chunk in s3.stream_object(part):
+                digest.update(chunk)
+                upload_file.write(chunk)
+        upload_file.flush()
+        table.checksum = digest.hexdigest()
+        if checksum and checksum.lower() != table.checksum:
+            err_msg = f'Checksum mismatch: expected {checksum}, received {table.checksum}'
+        else:
+            try:
+                df = read_input_file(upload_file.name, table.format)
+                err_msg = validate_input_table(df)
+            except Exception as err:
+                err_msg = f'Coordinate table parsing error: {err}'
+    if err_msg:
+        table.status = InputTable.TableStatus.FAILURE
+        table.error_info = err_msg
+    else:
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        s3.put_object(path=uploaded_table_file_path(table.uuid), data=buffer.getvalue())
+        table.rows = len(df)
+        table.status = InputTable.TableStatus.READY
+    table.save()
+    if parts:
+        s3.delete_objects(parts)
+    return err_msg
+
+
+def attach_uploaded_table(s3, table, job_id):
+    '''Copy an uploaded table into the job folder and return a reference to it.'''
+    path = input_table_path(job_id)
+    s3.copy_object(uploaded_table_file_path(table.uuid), path)
+    return {'path': path, 'rows': table.rows, 'checksum': table.checksum}
+
+
+def read_stored_table(s3, path):
+    return pandas.read_parquet(io.BytesIO(s3.get_object(path)))
+
+
+class StoredObjectFile(io.RawIOBase):
+    '''Seekable read-only file of an object in the object store, read with ranged requests.'''
+
+    def __init__(self, s3, path) -> None:
+        self.s3 = s3
+        self.path = path
+        self.size = s3.stat_object(path).size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self.size - self.position)
+        if length <= 0:
+            return 0
+        data = b''.join(self.s3.stream_object(self.path, offset=self.position, length=length))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def read_table_preview(s3, path, rows):
+    '''Return the first "rows" rows of a stored Parquet table and the number of rows of the table.
+
+    Only the footer and the row groups of the returned rows are downloaded.
+    '''
+    parquet_file = pq.ParquetFile(StoredObjectFile(s3, path))
+    metadata = parquet_file.metadata
+    row_groups = []
+    group_rows = 0
+    for idx in range(metadata.num_row_groups):
+        if group_rows >= rows:
+            break
+        row_groups.append(idx)
+        group_rows += metadata.row_group(idx).num_rows
+    table = parquet_file.read_row_groups(row_groups) if row_groups else parquet_file.schema_arrow.empty_table()
+    return table.slice(0, rows).to_pandas(), metadata.num_rows
+
+
+def load_input_table(s3, config):
+    '''Return the coordinate table of a job config from its Parquet reference or its CSV text.'''
+    if config.get('input_table'):
+        return read_stored_table(s3, config['input_table']['path'])
+    return read_input_table(config['input_csv'])
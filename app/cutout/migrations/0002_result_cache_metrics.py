@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cutout', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheMetric',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time_collected', models.DateTimeField(auto_now_add=True, verbose_name='Time Collected')),
+                ('hits', models.IntegerField(default=0)),
+                ('misses', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='metric',
+            name='result_cache_hits',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='metric',
+            name='result_cache_misses',
+            field=models.IntegerField(default=0),
+        ),
+    ]
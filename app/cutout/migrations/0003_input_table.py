@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:53
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cutout', '0002_result_cache_metrics'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InputTable',
+            fields=[
+                ('uuid', models.UUIDField(db_index=True, default=uuid.uuid4, primary_key=True, serialize=False, unique=True)),
+                ('name', models.TextField(blank=True, default='')),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('fits', 'FITS'), ('parquet', 'Parquet')], default='csv', max_length=7)),
+                ('status', models.CharField(choices=[('UPLOADING', 'Uploading'), ('READY', 'Ready'), ('FAILURE', 'Failure')], default='UPLOADING', max_length=10)),
+                ('error_info', models.TextField(blank=True, default='')),
+                ('size', models.BigIntegerField(default=0)),
+                ('rows', models.BigIntegerField(default=0)),
+                ('checksum', models.CharField(blank=True, default='', max_length=64)),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Time Created')),
+                ('modified', models.DateTimeField(auto_now=True, verbose_name='Last Modified')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+    ]
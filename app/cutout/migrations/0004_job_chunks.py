@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cutout', '0003_input_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='chunks_done',
+            field=models.IntegerField(blank=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='chunks_total',
+            field=models.IntegerField(blank=True, default=0),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cutout', '0004_job_chunks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='resume_count',
+            field=models.IntegerField(blank=True, default=0),
+        ),
+        migrations.CreateModel(
+            name='TileCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tilename', models.CharField(max_length=64)),
+                ('files_used', models.JSONField(blank=True, default=list)),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Time Created')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cutout.job')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('job', 'tilename'), name='unique_job_tile_checkpoint')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cutout', '0005_tile_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='estimate',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
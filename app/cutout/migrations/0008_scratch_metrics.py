@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cutout', '0007_fair_share'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='metric',
+            name='scratch_capacity',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='metric',
+            name='scratch_reservations',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='metric',
+            name='scratch_reserved',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='metric',
+            name='scratch_used',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cutout', '0009_job_config_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='jobfile',
+            index=models.Index(fields=['job', 'id'], name='jobfile_job_id_idx'),
+        ),
+    ]
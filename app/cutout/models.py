@@ -1,7 +1,7 @@
 from django.db import models
 import uuid
 from django.utils.translation import gettext_lazy as _
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, Group
 
 from .log import get_logger
 logger = get_logger(__name__)
@@ -36,6 +36,17 @@ class Job(models.Model):
     created = models.DateTimeField(auto_now_add=True, verbose_name='Time Created', null=False)
     modified = models.DateTimeField(auto_now=True, verbose_name='Last Modified', null=False)
     task_ids = models.JSONField(null=False, blank=True, default=list)
+    chunks_total = models.IntegerField(null=False, blank=True, default=0)
+    chunks_done = models.IntegerField(null=False, blank=True, default=0)
+    # Hash of the processed config and data versions, which identifies jobs with identical outputs
+    config_hash = models.CharField(max_length=64, blank=True, null=False, default='', db_index=True)
+    # Predicted size and runtime of the job, and the jobs queue it was sent to
+    estimate = models.JSONField(null=False, blank=True, default=dict)
+    # Number of times the job was resumed after a failure
+    resume_count = models.IntegerField(null=False, blank=True, default=0)
+    # Times the job was queued for the fair-share dispatcher and its workflow was started
+    queued = models.DateTimeField(null=True, blank=True)
+    started = models.DateTimeField(null=True, blank=True)
     uuid = models.UUIDField(
         default=uuid.uuid4,
         unique=True,
@@ -57,12 +68,86 @@ class Job(models.Model):
 
 
 class JobFile(models.Model):
+    class Meta:
+        # The files of a job are listed in pages ordered by id
+        indexes = [
+            models.Index(fields=['job', 'id'], name='jobfile_job_id_idx'),
+        ]
+
     job = models.ForeignKey(Job, on_delete=models.CASCADE)
     path = models.CharField(max_length=None, default='')
     # Size of the stored file in bytes
     size = models.BigIntegerField(null=False, blank=False, default=0)
 
 
+class FairShareWeight(models.Model):
+    '''Fair-share scheduling weight and running job limit of a user or of a group of users.
+
+    A user's own weight takes precedence over the weights of their groups, of which the
+    highest applies. A max_running_jobs of zero uses the CUTOUT_FAIR_SHARE_USER_MAX_RUNNING default.
+    '''
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=(models.Q(user__isnull=False, group__isnull=True)
+                           | models.Q(user__isnull=True, group__isnull=False)),
+                name='fair_share_weight_user_or_group'),
+        ]
+
+    user = models.OneToOneField(User, null=True, blank=True, on_delete=models.CASCADE)
+    group = models.OneToOneField(Group, null=True, blank=True, on_delete=models.CASCADE)
+    weight = models.FloatField(null=False, blank=False, default=1.0)
+    max_running_jobs = models.IntegerField(null=False, blank=True, default=0)
+
+    def __str__(self):
+        return f'fair share weight: {self.user or self.group}, weight: {self.weight}'
+
+
+class TileCheckpoint(models.Model):
+    '''Tile whose outputs have all been uploaded and registered, which a resumed job skips.'''
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['job', 'tilename'], name='unique_job_tile_checkpoint')]
+
+    job = models.ForeignKey(Job, on_delete=models.CASCADE)
+    tilename = models.CharField(max_length=64, null=False, blank=False)
+    # Coadd files used to cut the tile, restored to "files_used.csv" when the job is resumed
+    files_used = models.JSONField(null=False, blank=True, default=list)
+    created = models.DateTimeField(auto_now_add=True, verbose_name='Time Created', null=False)
+
+
+class InputTable(models.Model):
+    '''Coordinate table uploaded to the object store for use by cutout jobs.'''
+    class Meta:
+        ordering = ['-created']
+
+    class TableFormat(models.TextChoices):
+        CSV = 'csv', _('CSV')
+        FITS = 'fits', _('FITS')
+        PARQUET = 'parquet', _('Parquet')
+
+    class TableStatus(models.TextChoices):
+        UPLOADING = 'UPLOADING', _('Uploading')
+        READY = 'READY', _('Ready')
+        FAILURE = 'FAILURE', _('Failure')
+
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True, db_index=True, primary_key=True)
+    owner = models.ForeignKey(User, null=False, blank=False, on_delete=models.CASCADE)
+    name = models.TextField(blank=True, null=False, default='')
+    format = models.CharField(max_length=7, choices=TableFormat.choices, default=TableFormat.CSV)
+    status = models.CharField(max_length=10, choices=TableStatus.choices, default=TableStatus.UPLOADING)
+    error_info = models.TextField(blank=True, null=False, default='')
+    # Number of bytes received so far, which is the offset from which an interrupted upload resumes
+    size = models.BigIntegerField(null=False, blank=False, default=0)
+    # Number of rows and SHA-256 checksum of the uploaded file, known once the upload is complete
+    rows = models.BigIntegerField(null=False, blank=False, default=0)
+    checksum = models.CharField(max_length=64, blank=True, null=False, default='')
+    created = models.DateTimeField(auto_now_add=True, verbose_name='Time Created', null=False)
+    modified = models.DateTimeField(auto_now=True, verbose_name='Last Modified', null=False)
+
+    def __str__(self):
+        return f'input table: {self.uuid}, owner: {self.owner}, status: {self.status}, rows: {self.rows}'
+
+
 def update_job_state(job_id, state, error_info=''):
     logger.debug(f'''Updating job "{job_id}" state to: "{state}"...''')
     job = Job.objects.get(uuid__exact=job_id)
@@ -97,6 +182,16 @@ class FileMetric(models.Model):
         return f'file metric: {self.time_collected}, {self.file_type}, {self.size}, {self.owner}'
 
 
+class CacheMetric(models.Model):
+    time_collected = models.DateTimeField(auto_now_add=True, verbose_name='Time Collected')
+    # Number of positions restored from and missing in the cutout result cache
+    hits = models.IntegerField(null=False, blank=False, default=0)
+    misses = models.IntegerField(null=False, blank=False, default=0)
+
+    def __str__(self):
+        return f'cache metric: {self.time_collected}, hits: {self.hits}, misses: {self.misses}'
+
+
 class Metric(models.Model):
     time_collected = models.DateTimeField(auto_now_add=True, verbose_name='Time Collected')
     jobs_run = models.IntegerField(null=False, blank=False, default=0)
@@ -108,6 +203,13 @@ class Metric(models.Model):
     job_files_size = models.BigIntegerField(null=False, blank=False, default=0)
     job_files_added = models.IntegerField(null=False, blank=False, default=0)
     job_files_added_size = models.BigIntegerField(null=False, blank=False, default=0)
+    result_cache_hits = models.IntegerField(null=False, blank=False, default=0)
+    result_cache_misses = models.IntegerField(null=False, blank=False, default=0)
+    # Scratch volume capacity, usage and space reserved by running jobs in bytes
+    scratch_capacity = models.BigIntegerField(null=False, blank=False, default=0)
+    scratch_used = models.BigIntegerField(null=False, blank=False, default=0)
+    scratch_reserved = models.BigIntegerField(null=False, blank=False, default=0)
+    scratch_reservations = models.IntegerField(null=False, blank=False, default=0)
 
     def __str__(self):
         return (
@@ -121,4 +223,10 @@ class Metric(models.Model):
             f'job_files_size: {self.job_files_size}, '
             f'job_files_added: {self.job_files_added}, '
             f'job_files_added_size: {self.job_files_added_size}, '
+            f'result_cache_hits: {self.result_cache_hits}, '
+            f'result_cache_misses: {self.result_cache_misses}, '
+            f'scratch_capacity: {self.scratch_capacity}, '
+            f'scratch_used: {self.scratch_used}, '
+            f'scratch_reserved: {self.scratch_reserved}, '
+            f'scratch_reservations: {self.scratch_reservations}, '
         )
@@ -1,6 +1,11 @@
 from minio import Minio
 from minio.commonconfig import CopySource
 from minio.deleteobjects import DeleteObject
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import certifi
+import urllib3
+import urllib.parse
 import io
 import os
 import json
@@ -8,18 +13,56 @@ from .log import get_logger
 logger = get_logger(__name__)
 
 
+class ObjectStream:
+    '''Iterator over the chunks of an object, which returns its connection to the pool when closed.
+
+    Closing the stream before the end, as when a client disconnects from a download, releases the
+    connection instead of leaving it open until the response is garbage collected.
+    '''
+
+    def __init__(self, response, chunk_size) -> None:
+        self.response = response
+        self.chunks = response.stream(chunk_size)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        self.response.close()
+        self.response.release_conn()
+
+
 class ObjectStore:
     def __init__(self) -> None:
         '''Initialize S3 client'''
         self.config = {
             'endpoint-url': os.getenv("S3_ENDPOINT_URL", ""),
+            # Endpoint of the presigned URLs given to clients, if the S3_ENDPOINT_URL host is internal
+            'external-endpoint-url': os.getenv("S3_EXTERNAL_ENDPOINT_URL", ""),
             'region-name': os.getenv("S3_REGION_NAME", ""),
             'aws_access_key_id': os.getenv("AWS_S3_ACCESS_KEY_ID"),
             'aws_secret_access_key': os.getenv("AWS_S3_SECRET_ACCESS_KEY"),
             'bucket': os.getenv("S3_BUCKET", "app"),
+            # Number of concurrent uploads, which is also the size of the client connection pool
+            'upload_concurrency': int(os.getenv("S3_UPLOAD_CONCURRENCY", "8")),
+            # Multipart upload part size (minimum 5 MiB)
+            'part_size': int(os.getenv("S3_PART_SIZE", str(10 * 1024 * 1024))),
+            # Chunk size of objects streamed through the API server
+            'stream_chunk_size': int(os.getenv("S3_STREAM_CHUNK_SIZE", str(1024 * 1024))),
         }
         self.bucket = self.config['bucket']
+        self.upload_concurrency = max(1, self.config['upload_concurrency'])
+        self.part_size = self.config['part_size']
+        self.stream_chunk_size = self.config['stream_chunk_size']
         self.client = None
+        self.external_client = None
         # If endpoint URL is empty, do not attempt to initialize a client
         if not self.config['endpoint-url']:
             return
@@ -33,15 +76,36 @@ class ObjectStore:
             logger.error('endpoint URL must begin with http:// or https://')
             return
 
+        # Size the connection pool of the single client for the concurrent uploads of store_folder, each
+        # of which may upload upload_concurrency parallel parts of a multipart upload, so that no request
+        # waits for or discards a connection. The other settings match the default Minio client.
+        timeout = 300
+        http_client = urllib3.PoolManager(
+            timeout=urllib3.util.Timeout(connect=timeout, read=timeout),
+            maxsize=max(10, self.upload_concurrency * (self.upload_concurrency + 1)),
+            cert_reqs='CERT_REQUIRED',
+            ca_certs=os.environ.get('SSL_CERT_FILE') or certifi.where(),
+            retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+        )
         self.client = Minio(
             endpoint=endpoint,
             access_key=self.config['aws_access_key_id'],
             secret_key=self.config['aws_secret_access_key'],
             region=self.config['region-name'],
             secure=secure,
+            http_client=http_client,
         )
+        if self.config['external-endpoint-url']:
+            # Presigning is done locally, so this client does not connect to the external endpoint
+            external_url = urllib.parse.urlsplit(self.config['external-endpoint-url'])
+            self.external_client = Minio(
+                endpoint=external_url.netloc,
+                access_key=self.config['aws_access_key_id'],
+                secret_key=self.config['aws_secret_access_key'],
+                region=self.config['region-name'] or 'us-east-1',
+                secure=external_url.scheme == 'https',
+            )
         self.initialize_bucket()
-        self.part_size = 10 * 1024 * 1024
 
     def initialize_bucket(self):
         bucket_name = self.bucket
@@ -49,30 +113,61 @@ class ObjectStore:
         if not found:
             self.client.make_bucket(bucket_name)
 
-    def store_folder(self, src_dir="", bucket_root_path=""):
+    def store_folder(self, src_dir="", bucket_root_path="", max_workers=None):
+        '''Upload all files in a folder concurrently.
+
+        Returns a manifest listing the key, size and ETag of each uploaded object.
+        '''
+        uploads = []
         for dirpath, dirnames, filenames in os.walk(src_dir):
             for filename in filenames:
-                self.put_object(
-                    path=os.path.join(bucket_root_path, dirpath.replace(src_dir, '').strip('/'), filename),
-                    file_path=os.path.join(dirpath, filename),
-                )
+                uploads.append((
+                    os.path.join(bucket_root_path, dirpath.replace(src_dir, '').strip('/'), filename),
+                    os.path.join(dirpath, filename),
+                ))
+
+        def upload(path, file_path):
+            file_size = os.path.getsize(file_path)
+            result = self.put_object(path=path, file_path=file_path)
+            return {'path': path, 'size': file_size, 'etag': result.etag}
+
+        with ThreadPoolExecutor(max_workers=max_workers or self.upload_concurrency) as executor:
+            return list(executor.map(lambda args: upload(*args), uploads))
 
     def put_object(self, path="", data="", file_path="", json_output=True):
         if data:
             logger.debug(f'''Uploading data object to object store: "{path}"''')
-            if json_output:
-                body = json.dumps(data, indent=2)
-            else:
+            if isinstance(data, bytes):
                 body = data
-            self.client.put_object(
+            elif json_output:
+                body = json.dumps(data, indent=2).encode('utf-8')
+            else:
+                body = data.encode('utf-8')
+            return self.client.put_object(
                 bucket_name=self.bucket,
                 object_name=path,
-                data=io.BytesIO(body.encode('utf-8')),
+                data=io.BytesIO(body),
                 length=-1,
                 part_size=self.part_size)
         elif file_path:
             logger.debug(f'''Uploading file to object store: "{path}"''')
-            self.client.fput_object(bucket_name=self.bucket, object_name=path, file_path=file_path)
+            # Files larger than the part size are uploaded as multipart uploads with parallel parts
+            return self.client.fput_object(
+                bucket_name=self.bucket,
+                object_name=path,
+                file_path=file_path,
+                part_size=self.part_size,
+                num_parallel_uploads=self.upload_concurrency)
+
+    def put_stream(self, path, stream, length=-1):
+        '''Upload an object from a file-like stream without reading it into memory.'''
+        logger.debug(f'''Uploading stream to object store: "{path}"''')
+        return self.client.put_object(
+            bucket_name=self.bucket,
+            object_name=path,
+            data=stream,
+            length=length,
+            part_size=self.part_size)
 
     def get_object(self, path=""):
         try:
@@ -86,12 +181,37 @@ class ObjectStore:
             response.release_conn()
         return obj
 
-    def stream_object(self, path=""):
+    def stream_object(self, path="", offset=0, length=0):
+        '''Stream an object, or the "length" bytes from "offset" if a length is given.'''
         key = path.strip('/')
         response = self.client.get_object(
             bucket_name=self.bucket,
-            object_name=key)
-        return response.stream(32 * 1024)
+            object_name=key,
+            offset=offset,
+            length=length)
+        return ObjectStream(response, self.stream_chunk_size)
+
+    def stat_object(self, path=""):
+        '''Return the metadata of an object, including its size, ETag and last modified time.'''
+        return self.client.stat_object(
+            bucket_name=self.bucket,
+            object_name=path.strip('/'))
+
+    def presigned_get_url(self, path="", expires=300, filename="", external=False):
+        '''Return a presigned URL that downloads an object for "expires" seconds.
+
+        If a filename is given, the object is downloaded as an attachment with that name. If
+        external is set, the URL is signed for the S3_EXTERNAL_ENDPOINT_URL endpoint if there is one.
+        '''
+        client = self.external_client if external and self.external_client else self.client
+        response_headers = None
+        if filename:
+            response_headers = {'response-content-disposition': f'attachment; filename="{filename}"'}
+        return client.presigned_get_object(
+            bucket_name=self.bucket,
+            object_name=path.strip('/'),
+            expires=timedelta(seconds=expires),
+            response_headers=response_headers)
 
     def download_object(self, path="", file_path=""):
         self.client.fget_object(
@@ -115,12 +235,22 @@ class ObjectStore:
             logger.error("Error deleting object: ", error)
 
     def list_directory(self, root_path, recursive=True):
-        objects = self.client.list_objects(
+        return [obj.object_name for obj in self.list_objects(root_path, recursive=recursive)]
+
+    def list_objects(self, root_path, recursive=True):
+        '''List the objects under a path, including their size, ETag and modification time.'''
+        return list(self.client.list_objects(
             bucket_name=self.bucket,
             prefix=root_path,
             recursive=recursive,
-        )
-        return [obj.object_name for obj in objects]
+        ))
+
+    def delete_objects(self, paths):
+        errors = self.client.remove_objects(
+            bucket_name=self.bucket,
+            delete_object_list=[DeleteObject(path) for path in paths])
+        for error in errors:
+            logger.error(f"Error deleting object: {error}")
 
     def object_info(self, path):
         try:
@@ -138,19 +268,35 @@ class ObjectStore:
         else:
             return False
 
-    def copy_directory(self, src_path, dst_root_path):
+    def copy_directory(self, src_path, dst_root_path, max_workers=None):
+        '''Copy all objects under a path concurrently with server-side copies.
+
+        Returns the number of objects copied.
+        '''
         objects = self.client.list_objects(
             bucket_name=self.bucket,
             prefix=src_path,
             recursive=True)
+        copies = []
         for obj in objects:
             object_name = obj.object_name
-            logger.debug(object_name)
             dst_rel_path = object_name.replace(src_path, '').strip('/')
-            dst_path = os.path.join(dst_root_path, dst_rel_path)
-            logger.debug(f'dst_path: {dst_path}')
-            result = self.client.copy_object(
-                bucket_name=self.bucket,
-                object_name=dst_path,
-                source=CopySource(self.bucket, object_name))
-            logger.debug(f'''Copied object "{result.object_name}" ({result.version_id})''')
+            copies.append((object_name, os.path.join(dst_root_path, dst_rel_path)))
+        return self.copy_objects(copies, max_workers=max_workers)
+
+    def copy_objects(self, copies, max_workers=None):
+        '''Run server-side copies concurrently. "copies" is a list of (source path, destination path) pairs.
+
+        Returns the number of objects copied.
+        '''
+        with ThreadPoolExecutor(max_workers=max_workers or self.upload_concurrency) as executor:
+            list(executor.map(lambda copy: self.copy_object(*copy), copies))
+        return len(copies)
+
+    def copy_object(self, src_path, dst_path):
+        '''Copy an object within the bucket using a server-side copy.'''
+        result = self.client.copy_object(
+            bucket_name=self.bucket,
+            object_name=dst_path,
+            source=CopySource(self.bucket, src_path))
+        logger.debug(f'''Copied object "{result.object_name}" ({result.version_id})''')
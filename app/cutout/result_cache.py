@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from importlib.metadata import version, PackageNotFoundError
+from django.conf import settings
+from .log import get_logger
+logger = get_logger(__name__)
+
+# Object written to a cache entry on every hit, whose time stamp keeps the entry from expiring
+ACCESS_MARKER = '.accessed'
+
+
+def cutter_version():
+    try:
+        return version('des_cutter')
+    except PackageNotFoundError:
+        return 'unknown'
+
+
+class ResultCache:
+    '''Content-addressed cache of cutout results in the object store, shared by all jobs.
+
+    Each entry holds the FITS and color image files of one position, stored under a key
+    derived from the tile, position, cutout size, bands, prefix, color set and cutter version.
+    Entries not written or hit for CUTOUT_RESULT_CACHE_TTL days are ignored and pruned periodically.
+    '''
+
+    def __init__(self, s3) -> None:
+        self.s3 = s3
+        self.root_path = os.path.join(settings.S3_BASE_DIR, 'cache', 'cutouts')
+        self.ttl = timedelta(days=settings.CUTOUT_RESULT_CACHE_TTL)
+
+    @property
+    def enabled(self):
+        return settings.CUTOUT_RESULT_CACHE_ENABLED
+
+    def key(self, tilename, ra, dec, xsize, ysize, config):
+        spec = {
+            'tilename': tilename,
+            'ra': round(float(ra), 8),
+            'dec': round(float(dec), 8),
+            'xsize': float(xsize),
+            'ysize': float(ysize),
+            'bands': config['bands'],
+            'prefix': config['prefix'],
+            'colorset': list(config['colorset']),
+            'cutter_version': cutter_version(),
+        }
+        return hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.root_path, key[:2], key)
+
+    def is_expired(self, objects):
+        '''Return True if the newest object of a cache entry is older than the TTL.'''
+        return max([obj.last_modified for obj in objects]) < datetime.now(timezone.utc) - self.ttl
+
+    def lookup(self, key):
+        '''Return the object paths of a cache entry, or an empty list if it is missing or expired.
+
+        A hit rewrites the access marker of the entry, so that entries in use do not expire.
+        '''
+        objects = self.s3.list_objects(f'{self.entry_path(key)}/')
+        object_paths = [obj.object_name for obj in objects if os.path.basename(obj.object_name) != ACCESS_MARKER]
+        if not object_paths or self.is_expired(objects):
+            return []
+        self.s3.put_object(path=os.path.join(self.entry_path(key), ACCESS_MARKER),
+                           data={'accessed': datetime.now(timezone.utc).isoformat()})
+        return object_paths
+
+    def lookup_many(self, keys):
+        '''Look up several cache entries concurrently. Returns a dict mapping each key to its object paths.'''
+        with ThreadPoolExecutor(max_workers=settings.CUTOUT_RESULT_CACHE_WORKERS) as executor:
+            return dict(zip(keys, executor.map(self.lookup, keys)))
+
+    def restore(self, object_paths, dst_root_path):
+        '''Copy the objects of cache entries into a job folder with server-side copies.'''
+        with ThreadPoolExecutor(max_workers=settings.CUTOUT_RESULT_CACHE_WORKERS) as executor:
+            list(executor.map(
+                lambda path: self.s3.copy_object(path, os.path.join(dst_root_path, os.path.basename(path))),
+                object_paths))
+
+    def store(self, entries):
+        '''Copy job output objects into the cache. "entries" maps each key to a list of object paths.'''
+        copies = [(path, os.path.join(self.entry_path(key), os.path.basename(path)))
+                  for key, object_paths in entries.items() for path in object_paths]
+        with ThreadPoolExecutor(max_workers=settings.CUTOUT_RESULT_CACHE_WORKERS) as executor:
+            list(executor.map(lambda copy: self.s3.copy_object(*copy), copies))
+
+    def prune(self):
+        '''Delete expired cache entries. Returns the number of deleted objects.'''
+        entries = {}
+        for obj in self.s3.list_objects(f'{self.root_path}/'):
+            entries.setdefault(os.path.dirname(obj.object_name), []).append(obj)
+        expired = [obj.object_name for objects in entries.values() if self.is_expired(objects) for obj in objects]
+        if expired:
+            self.s3.delete_objects(expired)
+        logger.info(f'Pruned {len(expired)} expired objects from the cutout result cache.')
+        return len(expired)
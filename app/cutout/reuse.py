@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import re
+import numpy as np
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Job, JobFile, JobMetric, FileMetric
+from .models import update_job_state
+from .cost import job_estimate
+from .input_table import load_input_table
+from .result_cache import cutter_version
+from .tasks import s3
+from .workflows import launch_workflow, write_job_metadata
+from .log import get_logger
+logger = get_logger(__name__)
+
+
+def data_version():
+    '''Return a signature of the DES metadata database, which changes when the data release is updated.'''
+    try:
+        stat = os.stat(settings.CUTOUT_DATA_DB_PATH_DES)
+        return f'{stat.st_size}-{int(stat.st_mtime)}'
+    except OSError:
+        return ''
+
+
+def job_config_hash(config, df):
+    '''Return the canonical hash of a processed job config and its coordinate table.
+
+    The hash covers the positions and cutout sizes in table order, rounded as in the result
+    cache keys, the bands, color set and prefix, and the versions of the service, the cutter
+    and the data, so that jobs with the same hash produce the same outputs.
+    '''
+    positions = len(df)
+    xsize = df.XSIZE.to_numpy(dtype=float) if 'XSIZE' in df else np.full(positions, float(config.get('xsize', 1)))
+    ysize = df.YSIZE.to_numpy(dtype=float) if 'YSIZE' in df else np.full(positions, float(config.get('ysize', 1)))
+    table = np.stack([
+        np.round(df.RA.to_numpy(dtype=float), 8),
+        np.round(df.DEC.to_numpy(dtype=float), 8),
+        xsize,
+        ysize,
+    ], axis=1)
+    bands = config.get('bands', 'all')
+    if isinstance(bands, str):
+        bands = 'all' if bands.strip().lower() == 'all' else [band for band in re.split(r'[\s,]+', bands) if band]
+    spec = {
+        'bands': bands if bands == 'all' else sorted(bands),
+        'colorset': list(config.get('colorset', [])),
+        'prefix': config.get('prefix', ''),
+        'app_version': settings.APP_VERSION,
+        'cutter_version': cutter_version(),
+        'data_version': data_version(),
+    }
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8'))
+    digest.update(np.ascontiguousarray(table).tobytes())
+    return digest.hexdigest()
+
+
+def prepare_job(job, config, df=None):
+    '''Set the cost estimate and the config hash of a new job.
+
+    "df" is the coordinate table parsed when the config was processed. Without it, the table is
+    read from the job folder.
+    '''
+    if df is None:
+        try:
+            df = load_input_table(s3, config)
+        except Exception as err:
+            logger.warning(f'Unable to read the coordinate table of job "{job.uuid}": {err}')
+    job.estimate = job_estimate(config, df) if df is not None else job_estimate(config)
+    job.config_hash = job_config_hash(config, df) if df is not None else ''
+
+
+def reuse_job_results(job):
+    '''Complete a job with the outputs of an earlier successful job with the same config hash.
+
+    The outputs are copied by the copy_job_results task, so the job completes without running
+    the workflow. Returns True if the job reuses the outputs of an earlier job.
+    '''
+    if not settings.CUTOUT_JOB_REUSE_ENABLED or not job.config_hash:
+        return False
+    src_job = Job.objects.filter(
+        config_hash=job.config_hash, status=Job.JobStatus.SUCCESS,
+    ).exclude(uuid=job.uuid).order_by('-created').first()
+    if not src_job:
+        return False
+    job_id = str(job.uuid)
+    logger.info(f'''Completing job "{job_id}" with the outputs of identical job "{src_job.uuid}"...''')
+    update_job_state(job_id, Job.JobStatus.STARTED)
+    task = copy_job_results.apply_async(args=[job_id, str(src_job.uuid)], queue=settings.CUTOUT_QUEUE_FAST)
+    # Record the task ID so that the task is revoked if the job is deleted
+    Job.objects.filter(uuid__exact=job_id).update(task_ids=[task.id], started=timezone.now())
+    job.status = Job.JobStatus.STARTED
+    return True
+
+
+@shared_task(name='Copy Job Results')
+def copy_job_results(job_id, src_job_id):
+    '''Copy the outputs of a successful job into the folder of an identical job and complete it.
+
+    The job folder is copied with server-side copies and the JobFile records are copied in bulk.
+    If the outputs cannot be copied, the workflow of the job is launched instead.
+    '''
+    job = Job.objects.filter(uuid__exact=job_id).first()
+    if not job:
+        return
+    try:
+        s3.copy_directory(
+            src_path=os.path.join(settings.S3_BASE_DIR, f'''jobs/{src_job_id}/'''),
+            dst_root_path=os.path.join(settings.S3_BASE_DIR, f'''jobs/{job_id}'''),
+        )
+        write_job_metadata(job_id, job.config)
+    except Exception as err:
+        logger.warning(f'''Unable to copy the outputs of job "{src_job_id}": {err}''')
+        launch_workflow(job_id, job.config)
+        return
+    files = list(JobFile.objects.filter(job__uuid__exact=src_job_id).values_list('path', 'size'))
+    with transaction.atomic():
+        JobFile.objects.filter(job=job).delete()
+        JobFile.objects.bulk_create([
+            JobFile(job=job, path=path, size=file_size) for path, file_size in files
+        ], batch_size=settings.JOB_FILE_BATCH_SIZE)
+        # Record the job file metadata for metrics collection
+        if job.owner:
+            FileMetric.objects.bulk_create([
+                FileMetric(size=file_size, owner=job.owner, file_type=FileMetric.FileType.JOB)
+                for path, file_size in files
+            ], batch_size=settings.JOB_FILE_BATCH_SIZE)
+            JobMetric.objects.create(status=Job.JobStatus.SUCCESS, owner=job.owner, config=job.config)
+        update_job_state(job_id, Job.JobStatus.SUCCESS)
@@ -0,0 +1,114 @@
+import heapq
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .models import Job, FairShareWeight
+from .workflows import launch_workflow
+from .log import get_logger
+logger = get_logger(__name__)
+
+DISPATCH_LOCK_KEY = 'cutout-fair-share-dispatch'
+
+
+def job_cost(estimate):
+    '''Return the predicted runtime of a job in seconds, counting at least one second per job.'''
+    return max(1.0, float((estimate or {}).get('runtime', 0)))
+
+
+def user_shares(owner_ids):
+    '''Return the fair-share weight and running job limit of each owner.'''
+    shares = {owner_id: (1.0, settings.CUTOUT_FAIR_SHARE_USER_MAX_RUNNING) for owner_id in owner_ids}
+    user_weights = {}
+    group_weights = defaultdict(list)
+    for share in FairShareWeight.objects.filter(user__in=owner_ids):
+        user_weights[share.user_id] = share
+    for share in FairShareWeight.objects.filter(group__user__in=owner_ids).values(
+            'group__user', 'weight', 'max_running_jobs'):
+        group_weights[share['group__user']].append((share['weight'], share['max_running_jobs']))
+    for owner_id in owner_ids:
+        if owner_id in user_weights:
+            weight, max_running = user_weights[owner_id].weight, user_weights[owner_id].max_running_jobs
+        elif group_weights[owner_id]:
+            weight, max_running = max(group_weights[owner_id])
+        else:
+            continue
+        shares[owner_id] = (weight, max_running or settings.CUTOUT_FAIR_SHARE_USER_MAX_RUNNING)
+    return shares
+
+
+def select_jobs(now=None):
+    '''Select the queued jobs to start now, in order.
+
+    Each owner's usage is the predicted runtime of their jobs started within the last
+    CUTOUT_FAIR_SHARE_WINDOW seconds. The next job is always the oldest queued job of the
+    owner with the lowest usage divided by weight, among the owners below their running job
+    limit, so that users who have used little of the cluster recently are served first.
+    Started jobs that were not updated for CUTOUT_FAIR_SHARE_STALE_AFTER seconds are assumed to
+    have lost their workflow and are not counted as running.
+    '''
+    now = now or timezone.now()
+    queued = defaultdict(list)
+    for job in Job.objects.filter(status=Job.JobStatus.PENDING, queued__isnull=False).order_by('queued').values(
+            'uuid', 'owner', 'estimate', 'queued'):
+        queued[job['owner']].append(job)
+    if not queued:
+        return []
+    running_jobs = Job.objects.filter(status=Job.JobStatus.STARTED)
+    if settings.CUTOUT_FAIR_SHARE_STALE_AFTER:
+        running_jobs = running_jobs.filter(
+            modified__gte=now - timedelta(seconds=settings.CUTOUT_FAIR_SHARE_STALE_AFTER))
+    running = Counter(running_jobs.values_list('owner', flat=True))
+    capacity = sum([len(jobs) for jobs in queued.values()])
+    if settings.CUTOUT_FAIR_SHARE_MAX_RUNNING:
+        capacity = settings.CUTOUT_FAIR_SHARE_MAX_RUNNING - sum(running.values())
+    usage = Counter()
+    for owner_id, estimate in Job.objects.filter(
+            owner__in=list(queued), started__gte=now - timedelta(seconds=settings.CUTOUT_FAIR_SHARE_WINDOW),
+    ).values_list('owner', 'estimate'):
+        usage[owner_id] += job_cost(estimate)
+    shares = user_shares([owner_id for owner_id in queued if owner_id is not None])
+    default_share = (1.0, settings.CUTOUT_FAIR_SHARE_USER_MAX_RUNNING)
+
+    heap = []
+    for owner_id, jobs in queued.items():
+        weight = max(shares.get(owner_id, default_share)[0], 1e-6)
+        heapq.heappush(heap, (usage[owner_id] / weight, jobs[0]['queued'], str(owner_id), owner_id))
+    selected = []
+    while heap and capacity > 0:
+        priority, queued_time, key, owner_id = heapq.heappop(heap)
+        weight, max_running = shares.get(owner_id, default_share)
+        if running[owner_id] >= max_running:
+            continue
+        job = queued[owner_id].pop(0)
+        selected.append(job['uuid'])
+        capacity -= 1
+        running[owner_id] += 1
+        usage[owner_id] += job_cost(job['estimate'])
+        if queued[owner_id]:
+            heapq.heappush(heap, (usage[owner_id] / max(weight, 1e-6), queued[owner_id][0]['queued'], key, owner_id))
+    return selected
+
+
+def dispatch_jobs():
+    '''Start the queued jobs selected by the fair-share policy. Returns the number of jobs started.'''
+    # Only one dispatcher selects jobs at a time
+    if not cache.add(DISPATCH_LOCK_KEY, 1, timeout=300):
+        logger.debug('Fair-share dispatch already in progress.')
+        return 0
+    started = 0
+    try:
+        for job_id in select_jobs():
+            # Claim the job, so that a job deleted or started meanwhile is skipped
+            claimed = Job.objects.filter(uuid=job_id, status=Job.JobStatus.PENDING).update(
+                status=Job.JobStatus.STARTED, started=timezone.now(), modified=timezone.now())
+            if not claimed:
+                continue
+            job = Job.objects.get(uuid=job_id)
+            logger.info(f'''Starting queued job "{job_id}" of user "{job.owner}"...''')
+            launch_workflow(str(job_id), job.config, dispatch=True)
+            started += 1
+    finally:
+        cache.delete(DISPATCH_LOCK_KEY)
+    return started
@@ -0,0 +1,210 @@
+import fcntl
+import os
+import shutil
+from contextlib import contextmanager
+from django.conf import settings
+from django.utils import timezone
+from .models import Job
+from .log import get_logger
+logger = get_logger(__name__)
+
+RESERVATIONS_DIR = '.reservations'
+
+
+class ScratchFull(Exception):
+    '''The scratch volume does not have space for the job output.'''
+
+
+def directory_size(path):
+    '''Return the total size in bytes of the files in a directory tree.'''
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames[:] = [dirname for dirname in dirnames if dirname != RESERVATIONS_DIR]
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                # The file was removed meanwhile, e.g. by the background uploader
+                pass
+    return size
+
+
+def job_scratch_dir(job_id, *names):
+    '''Return the scratch folder of a job, or of the named task output folders in it.'''
+    return os.path.join(settings.JOB_SCRATCH_DIR, str(job_id), *names)
+
+
+def estimate_scratch_size(estimate, positions=None):
+    '''Return the scratch space in bytes needed by a job with the given cost estimate, up to the per-job cap.
+
+    If "positions" is given, return the share of a task that writes the output of that many positions.
+    '''
+    size = (settings.JOB_SCRATCH_BYTES_PER_PIXEL * estimate.get('output_pixels', 0)
+            + settings.JOB_SCRATCH_BYTES_PER_POSITION * estimate.get('positions', 0))
+    if positions is not None and estimate.get('positions'):
+        size *= min(1.0, positions / estimate['positions'])
+    if settings.JOB_SCRATCH_JOB_MAX_SIZE:
+        size = min(size, settings.JOB_SCRATCH_JOB_MAX_SIZE)
+    return int(size)
+
+
+class ScratchSpace:
+    '''Reservations of space for job output on the scratch volume.
+
+    The reservations are files in the ".reservations" folder of the volume, so they are shared
+    by all workers that mount it and survive a worker restart. A reservation is made by the
+    task that writes the output, for the job folder or for a named task output folder in it,
+    because the tasks of a job may run on nodes with different scratch volumes. It is admitted
+    if it fits in the free space, less the JOB_SCRATCH_FREE_SPACE margin and the part of the
+    other reservations that is not written yet. The capacity is JOB_SCRATCH_MAX_SIZE, or the
+    size of the volume if it is zero. Reservations of jobs that are no longer running are removed.
+    '''
+
+    def __init__(self, root=None) -> None:
+        self.root = root or settings.JOB_SCRATCH_DIR
+        self.reservations_dir = os.path.join(self.root, RESERVATIONS_DIR)
+
+    @contextmanager
+    def lock(self):
+        os.makedirs(self.reservations_dir, exist_ok=True)
+        with open(os.path.join(self.reservations_dir, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def usage(self):
+        '''Return the capacity, the used space and the free space of the scratch volume in bytes.'''
+        disk_usage = shutil.disk_usage(self.root)
+        if settings.JOB_SCRATCH_MAX_SIZE:
+            capacity = settings.JOB_SCRATCH_MAX_SIZE
+            used = directory_size(self.root)
+        else:
+            capacity = disk_usage.total
+            used = disk_usage.total - disk_usage.free
+        return capacity, used, min(capacity - used, disk_usage.free)
+
+    @staticmethod
+    def reservation_key(job_id, name=''):
+        # The reservation of a task output folder is named "<job id>.<folder>"
+        return f'{job_id}.{name}' if name else str(job_id)
+
+    def reservation_dir(self, key):
+        '''Return the output folder of a reservation.'''
+        return os.path.join(self.root, *key.split('.', 1))
+
+    def reservations(self):
+        '''Return the reserved bytes of each reservation, removing the reservations of jobs that are not running.'''
+        reservations = {}
+        if not os.path.isdir(self.reservations_dir):
+            return reservations
+        for key in os.listdir(self.reservations_dir):
+            if key.startswith('.'):
+                continue
+            try:
+                with open(os.path.join(self.reservations_dir, key)) as reservation_file:
+                    reservations[key] = int(reservation_file.read() or 0)
+            except (OSError, ValueError):
+                continue
+        job_ids = set([key.split('.', 1)[0] for key in reservations])
+        active = set([str(job_id) for job_id in Job.objects.filter(
+            uuid__in=list(job_ids), status__in=[Job.JobStatus.PENDING, Job.JobStatus.STARTED],
+        ).values_list('uuid', flat=True)])
+        for key in list(reservations):
+            if key.split('.', 1)[0] not in active:
+                logger.info(f'''Removing the stale scratch reservation "{key}".''')
+                self.remove_reservation(key)
+                reservations.pop(key)
+        return reservations
+
+    def available(self, reservations=None):
+        '''Return the bytes that can be reserved.'''
+        reservations = self.reservations() if reservations is None else reservations
+        capacity, used, free = self.usage()
+        # Only the part of a reservation that the job has not written yet is still committed
+        committed = sum([max(0, size - directory_size(self.reservation_dir(key)))
+                         for key, size in reservations.items()])
+        return free - committed - settings.JOB_SCRATCH_FREE_SPACE
+
+    def reserve(self, job_id, size, name=''):
+        '''Reserve scratch space for a job, or for the task output folder "name" of a job.
+
+        Returns False if there is not enough free space.
+        '''
+        key = self.reservation_key(job_id, name)
+        with self.lock():
+            reservations = self.reservations()
+            reservations.pop(key, None)
+            available = self.available(reservations)
+            if size > available:
+                logger.info(f'''Insufficient scratch space for "{key}": '''
+                            f'''{size} bytes requested, {available} bytes available.''')
+                return False
+            with open(os.path.join(self.reservations_dir, key), 'w') as reservation_file:
+                reservation_file.write(str(size))
+        logger.debug(f'''Reserved {size} bytes of scratch space for "{key}".''')
+        return True
+
+    def remove_reservation(self, key):
+        try:
+            os.remove(os.path.join(self.reservations_dir, key))
+        except FileNotFoundError:
+            pass
+
+    def release(self, job_id, name=''):
+        self.remove_reservation(self.reservation_key(job_id, name))
+
+    def cleanup(self, job_id):
+        '''Remove the scratch folder of a job and release all its reservations.'''
+        shutil.rmtree(os.path.join(self.root, str(job_id)), ignore_errors=True)
+        if os.path.isdir(self.reservations_dir):
+            for key in os.listdir(self.reservations_dir):
+                if key.split('.', 1)[0] == str(job_id):
+                    self.remove_reservation(key)
+
+    def stats(self):
+        '''Return the scratch capacity, usage and reservations for metrics collection.'''
+        with self.lock():
+            reservations = self.reservations()
+        capacity, used, free = self.usage()
+        return {
+            'capacity': capacity,
+            'used': used,
+            'reserved': sum(reservations.values()),
+            'reservations': len(reservations),
+        }
+
+
+def check_job_scratch(outdir):
+    '''Raise ScratchFull if the local output of a job exceeds the per-job scratch cap.'''
+    if settings.JOB_SCRATCH_JOB_MAX_SIZE:
+        size = directory_size(outdir)
+        if size > settings.JOB_SCRATCH_JOB_MAX_SIZE:
+            raise ScratchFull(f'Job output of {size} bytes exceeds the scratch limit of '
+                              f'{settings.JOB_SCRATCH_JOB_MAX_SIZE} bytes per job')
+
+
+def admit_task(task, job_id, name='', positions=None):
+    '''Reserve scratch space on this node for the output that a task writes, retrying the task until it fits.
+
+    "name" is the task output folder in the job folder, and "positions" the number of positions
+    it cuts, if the task writes only part of the job output. While a task that writes the whole
+    job output waits for space, the job is PENDING without a queue time, so that it neither takes
+    a running slot of its owner nor is started again by the fair-share dispatcher.
+    '''
+    job = Job.objects.get(uuid__exact=job_id)
+    if ScratchSpace().reserve(job_id, estimate_scratch_size(job.estimate, positions), name=name):
+        if not name:
+            Job.objects.filter(uuid__exact=job_id, status=Job.JobStatus.PENDING).update(
+                status=Job.JobStatus.STARTED, modified=timezone.now())
+        return
+    if not name:
+        Job.objects.filter(uuid__exact=job_id, status=Job.JobStatus.STARTED).update(
+            status=Job.JobStatus.PENDING, queued=None)
+    logger.info(f'''Waiting for scratch space to start "{ScratchSpace.reservation_key(job_id, name)}"...''')
+    raise task.retry(
+        countdown=settings.JOB_SCRATCH_ADMISSION_DELAY,
+        max_retries=settings.JOB_SCRATCH_ADMISSION_RETRIES,
+        exc=ScratchFull('Insufficient scratch space to start the job'),
+    )
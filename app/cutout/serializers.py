@@ -1,5 +1,7 @@
-from .models import Job, JobFile
+from .models import Job, JobFile, InputTable
 from django.contrib.auth.models import User
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from rest_framework import serializers
 from .log import get_logger
 logger = get_logger(__name__)
@@ -13,16 +15,57 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
         fields = ['url', 'username', 'email', 'groups']
 
 
+def annotate_file_summary(queryset):
+    '''Annotate jobs with the number and total size of their files.
+
+    The summaries are correlated subqueries, which the database evaluates only for the jobs
+    of the returned page, so listing jobs takes a single query however many files they have.
+    '''
+    files = JobFile.objects.filter(job=OuterRef('pk')).order_by().values('job')
+    return queryset.annotate(
+        file_count=Coalesce(Subquery(files.annotate(count=Count('id')).values('count')), 0),
+        total_size=Coalesce(Subquery(files.annotate(total=Sum('size')).values('total')), 0),
+    )
+
+
 class JobSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Job
-        read_only_fields = ['owner', 'created', 'uuid', 'error_info', 'status', 'modified', 'files', 'task_ids']
-        fields = read_only_fields + ['name', 'description', 'files', 'config']
-    files = serializers.SerializerMethodField()
+        read_only_fields = ['owner', 'created', 'uuid', 'error_info', 'status', 'modified', 'files', 'task_ids',
+                            'chunks_total', 'chunks_done', 'resume_count',
+                            'estimate', 'queued', 'started', 'file_count', 'total_size']
+        fields = read_only_fields + ['name', 'description', 'config']
+    # The files are listed in pages by the job files endpoint
+    files = serializers.HyperlinkedIdentityField(view_name='job-files')
+    file_count = serializers.SerializerMethodField()
+    total_size = serializers.SerializerMethodField()
     config = serializers.JSONField(initial={
         'input_csv': 'RA,DEC,XSIZE,YSIZE\n#0.29782658,0.029086056,3,3\n49.9208333333,-19.4166666667,6.6,6.6\n'
     })
 
-    def get_files(self, job):
-        jobfiles = JobFile.objects.filter(job__exact=job)
-        return [{'path': jobfile.path, 'size': jobfile.size} for jobfile in jobfiles]
+    def file_summary(self, job):
+        # Jobs that were not fetched with annotate_file_summary are summarized with one query
+        if not hasattr(job, 'file_count'):
+            summary = JobFile.objects.filter(job=job).aggregate(file_count=Count('id'), total_size=Sum('size'))
+            job.file_count, job.total_size = summary['file_count'], summary['total_size'] or 0
+        return job.file_count, job.total_size
+
+    def get_file_count(self, job):
+        return self.file_summary(job)[0]
+
+    def get_total_size(self, job):
+        return self.file_summary(job)[1]
+
+
+class JobFileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = JobFile
+        fields = ['path', 'size']
+
+
+class InputTableSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = InputTable
+        read_only_fields = ['uuid', 'owner', 'status', 'error_info', 'size', 'rows', 'checksum', 'created', 'modified']
+        fields = read_only_fields + ['name', 'format']
+    owner = serializers.ReadOnlyField(source='owner.username')
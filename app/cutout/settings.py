@@ -38,7 +38,99 @@ else:
 # Set JOB_SCRATCH_MAX_SIZE to 0 to determine scratch volume capacity using os.statvfs
 JOB_SCRATCH_MAX_SIZE = int(float(os.getenv('JOB_SCRATCH_MAX_SIZE', str(0 * 1024**3))))  # 0 GiB
 JOB_SCRATCH_FREE_SPACE = int(float(os.getenv('JOB_SCRATCH_FREE_SPACE', str(5 * 1024**3))))  # 5 GiB
+JOB_SCRATCH_DIR = os.getenv('JOB_SCRATCH_DIR', '/scratch')
+# Scratch admission control: a task that writes job output starts once the scratch space estimated from
+# its output pixels and positions can be reserved in JOB_SCRATCH_DIR, retrying every
+# JOB_SCRATCH_ADMISSION_DELAY seconds up to JOB_SCRATCH_ADMISSION_RETRIES times. If JOB_SCRATCH_JOB_MAX_SIZE
+# is set, a job fails if its local output exceeds it, and it also caps the reservation (0 is unlimited).
+JOB_SCRATCH_JOB_MAX_SIZE = int(float(os.getenv('JOB_SCRATCH_JOB_MAX_SIZE', '0')))
+JOB_SCRATCH_BYTES_PER_PIXEL = float(os.getenv('JOB_SCRATCH_BYTES_PER_PIXEL', '4'))
+JOB_SCRATCH_BYTES_PER_POSITION = float(os.getenv('JOB_SCRATCH_BYTES_PER_POSITION', str(1024**2)))
+JOB_SCRATCH_ADMISSION_DELAY = int(os.getenv('JOB_SCRATCH_ADMISSION_DELAY', '60'))
+JOB_SCRATCH_ADMISSION_RETRIES = int(os.getenv('JOB_SCRATCH_ADMISSION_RETRIES', '60'))
 COLLECT_METRICS_INTERVAL = int(os.getenv('COLLECT_METRICS_INTERVAL', 300))
+# Cutout workflow mode: "serial" processes every tile in a single task, while "fanout"
+# dispatches batches of CUTOUT_TILES_PER_TASK tiles as parallel tasks on the jobs queue.
+CUTOUT_WORKFLOW_MODE = os.getenv('CUTOUT_WORKFLOW_MODE', 'serial')
+CUTOUT_TILES_PER_TASK = int(os.getenv('CUTOUT_TILES_PER_TASK', '1'))
+# Coordinate tables with more rows are split into chunks of whole tiles of about this many rows,
+# processed as parallel tasks. Set to zero to disable chunked execution.
+CUTOUT_CHUNK_ROWS = int(os.getenv('CUTOUT_CHUNK_ROWS', '100000'))
+# Number of times a failed job is resumed automatically, skipping its checkpointed tiles, and the
+# delay in seconds before each automatic resume
+CUTOUT_JOB_AUTO_RESUMES = int(os.getenv('CUTOUT_JOB_AUTO_RESUMES', '2'))
+CUTOUT_JOB_RESUME_DELAY = int(os.getenv('CUTOUT_JOB_RESUME_DELAY', '60'))
+# Complete a job by copying the outputs of an earlier successful job with an identical config
+CUTOUT_JOB_REUSE_ENABLED = os.getenv('CUTOUT_JOB_REUSE_ENABLED', 'true').lower() == 'true'
+# Job cost model: the predicted runtime in seconds is the overhead plus the cost of each coadd band
+# file read, each million output pixels and each matched position (color images).
+CUTOUT_COST_SECONDS_OVERHEAD = float(os.getenv('CUTOUT_COST_SECONDS_OVERHEAD', '5'))
+CUTOUT_COST_SECONDS_PER_BAND_FILE = float(os.getenv('CUTOUT_COST_SECONDS_PER_BAND_FILE', '1.5'))
+CUTOUT_COST_SECONDS_PER_MPIXEL = float(os.getenv('CUTOUT_COST_SECONDS_PER_MPIXEL', '0.05'))
+CUTOUT_COST_SECONDS_PER_POSITION = float(os.getenv('CUTOUT_COST_SECONDS_PER_POSITION', '0.5'))
+# Jobs are routed by predicted runtime to the fast, standard or bulk jobs queue, each consumed by
+# its own worker pool. Set the queue names to "jobs" to use a single queue.
+CUTOUT_QUEUE_FAST = os.getenv('CUTOUT_QUEUE_FAST', 'jobs-fast')
+CUTOUT_QUEUE_STANDARD = os.getenv('CUTOUT_QUEUE_STANDARD', 'jobs')
+CUTOUT_QUEUE_BULK = os.getenv('CUTOUT_QUEUE_BULK', 'jobs-bulk')
+CUTOUT_QUEUE_FAST_MAX_RUNTIME = float(os.getenv('CUTOUT_QUEUE_FAST_MAX_RUNTIME', '60'))
+CUTOUT_QUEUE_BULK_MIN_RUNTIME = float(os.getenv('CUTOUT_QUEUE_BULK_MIN_RUNTIME', '3600'))
+# Fair-share dispatching: submitted jobs wait in the PENDING state until the dispatcher, which runs on
+# the "api" queue, starts them. Each user runs at most CUTOUT_FAIR_SHARE_USER_MAX_RUNNING jobs and at most
+# CUTOUT_FAIR_SHARE_MAX_RUNNING jobs run in total (0 is unlimited). Queued jobs are started in order of the
+# users' predicted runtime of jobs started in the last CUTOUT_FAIR_SHARE_WINDOW seconds, divided by their
+# weight. Started jobs not updated for CUTOUT_FAIR_SHARE_STALE_AFTER seconds no longer take a running slot.
+CUTOUT_FAIR_SHARE_ENABLED = os.getenv('CUTOUT_FAIR_SHARE_ENABLED', 'false').lower() == 'true'
+CUTOUT_FAIR_SHARE_USER_MAX_RUNNING = int(os.getenv('CUTOUT_FAIR_SHARE_USER_MAX_RUNNING', '4'))
+CUTOUT_FAIR_SHARE_MAX_RUNNING = int(os.getenv('CUTOUT_FAIR_SHARE_MAX_RUNNING', '0'))
+CUTOUT_FAIR_SHARE_WINDOW = int(os.getenv('CUTOUT_FAIR_SHARE_WINDOW', str(24 * 3600)))
+CUTOUT_FAIR_SHARE_INTERVAL = int(os.getenv('CUTOUT_FAIR_SHARE_INTERVAL', '30'))
+CUTOUT_FAIR_SHARE_STALE_AFTER = int(os.getenv('CUTOUT_FAIR_SHARE_STALE_AFTER', str(6 * 3600)))
+# Number of processes in the worker-lifetime FITS cutter pool used when the job config enables "MP"
+CUTOUT_CUTTER_POOL_SIZE = int(os.getenv('CUTOUT_CUTTER_POOL_SIZE', '4'))
+# Number of color images (STIFF runs) created concurrently per job. The STIFF threads of a tile
+# are divided among them. Enable CUTOUT_COLOR_PIPELINE to create the color images of a tile
+# while the next tile is being cut.
+CUTOUT_COLOR_WORKERS = int(os.getenv('CUTOUT_COLOR_WORKERS', '2'))
+CUTOUT_COLOR_PIPELINE = os.getenv('CUTOUT_COLOR_PIPELINE', 'false').lower() == 'true'
+# Node-local LRU cache of coadd tile files. Leave TILE_CACHE_DIR empty to read directly from the archive.
+TILE_CACHE_DIR = os.getenv('TILE_CACHE_DIR', '')
+TILE_CACHE_MAX_SIZE = int(float(os.getenv('TILE_CACHE_MAX_SIZE', str(50 * 1024**3))))  # 50 GiB
+# Cutout result cache in the object store, shared by all jobs
+CUTOUT_RESULT_CACHE_ENABLED = os.getenv('CUTOUT_RESULT_CACHE_ENABLED', 'false').lower() == 'true'
+CUTOUT_RESULT_CACHE_TTL = int(os.getenv('CUTOUT_RESULT_CACHE_TTL', '30'))  # days
+CUTOUT_RESULT_CACHE_PRUNE_INTERVAL = int(os.getenv('CUTOUT_RESULT_CACHE_PRUNE_INTERVAL', str(24 * 3600)))
+CUTOUT_RESULT_CACHE_WORKERS = int(os.getenv('CUTOUT_RESULT_CACHE_WORKERS', '16'))
+# Synchronous single cutouts of at most CUTOUT_SYNC_MAX_SIZE arcmin, cut by the workers of the "sync"
+# queue. Larger requests, or all requests if disabled (the default), are submitted as jobs. The API server
+# polls the result backend for the cutout every CUTOUT_SYNC_POLL_INTERVAL seconds.
+CUTOUT_SYNC_ENABLED = os.getenv('CUTOUT_SYNC_ENABLED', 'false').lower() == 'true'
+CUTOUT_SYNC_MAX_SIZE = float(os.getenv('CUTOUT_SYNC_MAX_SIZE', '2.0'))  # arcmin
+CUTOUT_SYNC_TIMEOUT = float(os.getenv('CUTOUT_SYNC_TIMEOUT', '10'))  # seconds
+CUTOUT_SYNC_POLL_INTERVAL = float(os.getenv('CUTOUT_SYNC_POLL_INTERVAL', '0.25'))  # seconds
+CUTOUT_SYNC_CACHE_TTL = int(os.getenv('CUTOUT_SYNC_CACHE_TTL', '3600'))  # seconds
+# Upload the cutouts of each tile in the background as soon as the tile is complete
+CUTOUT_STREAMING_UPLOAD = os.getenv('CUTOUT_STREAMING_UPLOAD', 'true').lower() == 'true'
+CUTOUT_UPLOAD_WORKERS = int(os.getenv('CUTOUT_UPLOAD_WORKERS', '8'))
+# Number of JobFile records inserted per database query
+JOB_FILE_BATCH_SIZE = int(os.getenv('JOB_FILE_BATCH_SIZE', '1000'))
+# Default and maximum number of files per page of the job file listing API
+JOB_FILE_PAGE_SIZE = int(os.getenv('JOB_FILE_PAGE_SIZE', '1000'))
+JOB_FILE_MAX_PAGE_SIZE = int(os.getenv('JOB_FILE_MAX_PAGE_SIZE', '10000'))
+# Match positions to tiles with an in-memory index of the tile footprints instead of a query per position.
+# The footprint table is found automatically unless CUTOUT_TILE_GEOM_TABLE is set.
+CUTOUT_TILE_INDEX_ENABLED = os.getenv('CUTOUT_TILE_INDEX_ENABLED', 'true').lower() == 'true'
+CUTOUT_TILE_GEOM_TABLE = os.getenv('CUTOUT_TILE_GEOM_TABLE', '')
+# Resolve the coadd files of all tiles in a job with one query on this table, which is found automatically
+# if unset, and cache up to CUTOUT_COADD_FILE_CACHE_SIZE tiles per worker process
+CUTOUT_COADD_FILE_TABLE = os.getenv('CUTOUT_COADD_FILE_TABLE', '')
+CUTOUT_COADD_FILE_CACHE_SIZE = int(os.getenv('CUTOUT_COADD_FILE_CACHE_SIZE', '10000'))
+# Number of coordinate table rows and of files shown on the job detail page
+JOB_DETAIL_MAX_COORDS = int(os.getenv('JOB_DETAIL_MAX_COORDS', '1000'))
+JOB_DETAIL_MAX_FILES = int(os.getenv('JOB_DETAIL_MAX_FILES', '1000'))
+# Uploaded coordinate tables: maximum size in bytes and the directory where uploads are assembled
+INPUT_TABLE_MAX_SIZE = int(float(os.getenv('INPUT_TABLE_MAX_SIZE', str(2 * 1024**3))))  # 2 GiB
+INPUT_TABLE_UPLOAD_DIR = os.getenv('INPUT_TABLE_UPLOAD_DIR', '')
 
 # Email for support requests
 SUPPORT_EMAIL = os.getenv('SUPPORT_EMAIL', "devnull@example.com")
@@ -228,6 +320,13 @@ CACHES = {
 API_RATE_LIMIT_ANON = int(os.getenv('API_RATE_LIMIT_ANON', '30'))
 API_RATE_LIMIT_USER = int(os.getenv('API_RATE_LIMIT_USER', '30'))
 API_RATE_LIMIT_DOWNLOAD = int(os.getenv('API_RATE_LIMIT_DOWNLOAD', '30'))
+# Job file downloads are streamed through the API server ("stream"), served by the proxy from the
+# object store after an X-Accel-Redirect to a presigned URL ("accel"), or redirected to a presigned URL
+# ("presigned") that expires after JOB_FILE_DOWNLOAD_URL_EXPIRES seconds.
+JOB_FILE_DOWNLOAD_MODE = os.getenv('JOB_FILE_DOWNLOAD_MODE', 'stream')
+JOB_FILE_DOWNLOAD_URL_EXPIRES = int(os.getenv('JOB_FILE_DOWNLOAD_URL_EXPIRES', '300'))
+# Internal proxy location that serves objects from the object store
+JOB_FILE_ACCEL_LOCATION = '/_object_store'
 
 REST_FRAMEWORK = {
     'DEFAULT_METADATA_CLASS': 'rest_framework.metadata.SimpleMetadata',
@@ -1,121 +1,100 @@
-from celery import shared_task
+from celery import shared_task, chord
 from dotmap import DotMap
 import numpy as np
 import pandas
 import duckdb
 import os
-import math
 import time
 import multiprocessing as mp
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from des_cutter import fitsfinder
 from des_cutter import thumbslib
 from des_cutter import color_radec
 import logging
 import json
 import io
+import shutil
+from uuid import uuid4
 from .object_store import ObjectStore
-from .models import Job, JobFile, JobMetric, FileMetric
+from .tile_cache import TileCache
+from .input_table import read_input_table, load_input_table, store_input_table
+from .input_table import read_stored_table, uploaded_table_file_path, attach_uploaded_table
+from .input_table import validate_input_table, validate_cutout_size_from_table
+from .tile_index import TileIndex
+from .coadd_files import CoaddFileResolver
+from .result_cache import ResultCache
+from .uploader import JobFileUploader
+from .scratch import ScratchFull, ScratchSpace, admit_task, check_job_scratch, job_scratch_dir
+from .derive import band_set, parent_output_copies
+from .models import Job, JobFile, JobMetric, FileMetric, CacheMetric, InputTable, TileCheckpoint
 from .models import update_job_state
 from django.conf import settings
-from celery.signals import task_failure
+from django.db.models import F
+from django.utils import timezone
+from celery.signals import task_failure, worker_process_shutdown
 # from celery.signals import task_postrun
 # from celery.signals import task_revoked
 from .log import get_logger
 logger = get_logger(__name__)
 
 s3 = ObjectStore()
+tile_cache = TileCache()
+tile_index = TileIndex()
+coadd_file_resolver = CoaddFileResolver()
+result_cache = ResultCache(s3)
 
+# Column holding the original row number of each position in the chunks of a table
+CHUNK_ROW_COLUMN = '_ROW'
 
-def create_job_file_objects(job_id):
-    # logger.debug('Creating JobFile database records...')
+
+def create_job_file_objects(job_id, objects=None):
+    '''Create the missing JobFile database records of the job files in the object store.
+
+    The file sizes are taken from a single listing of the job folder, or from "objects", a list
+    of dicts with the "path" and "size" of each object such as the manifest returned by
+    store_folder. Existing records are found with one query and new records are bulk created.
+    '''
     s3_basepath = os.path.join(settings.S3_BASE_DIR, f'''jobs/{job_id}''')
-    paths = s3.list_directory(s3_basepath)
-    for path in paths:
-        file_size = s3.object_info(path).size
-        if not JobFile.objects.filter(
-            job=Job.objects.get(uuid__exact=job_id),
-            path=path.replace(s3_basepath, '', 1),
-        ):
-            job = Job.objects.get(uuid__exact=job_id)
-            JobFile.objects.create(
-                job=job,
-                path=path.replace(s3_basepath, '', 1),
-                size=file_size,
-            )
-            # Record the job file metadata for metrics collection
-            FileMetric.objects.create(
-                size=file_size,
-                owner=job.owner,
-                file_type=FileMetric.FileType.JOB,
-            )
+    if objects is None:
+        objects = [{'path': obj.object_name, 'size': obj.size} for obj in s3.list_objects(f'{s3_basepath}/')]
+    job = Job.objects.get(uuid__exact=job_id)
+    existing_paths = set(JobFile.objects.filter(job=job).values_list('path', flat=True))
+    new_files = {}
+    for obj in objects:
+        path = obj['path'].replace(s3_basepath, '', 1)
+        if path not in existing_paths:
+            new_files[path] = obj['size']
+    JobFile.objects.bulk_create([
+        JobFile(job=job, path=path, size=file_size) for path, file_size in new_files.items()
+    ], batch_size=settings.JOB_FILE_BATCH_SIZE)
+    # Record the job file metadata for metrics collection
+    if job.owner:
+        FileMetric.objects.bulk_create([
+            FileMetric(size=file_size, owner=job.owner, file_type=FileMetric.FileType.JOB)
+            for file_size in new_files.values()
+        ], batch_size=settings.JOB_FILE_BATCH_SIZE)
+    logger.debug(f'''Registered {len(new_files)} job files for job "{job_id}"''')
 
 
 def upload_job_files(job_id):
     # Upload all job output files
     s3_basepath = os.path.join(settings.S3_BASE_DIR, f'''jobs/{job_id}''')
-    src_dir = os.path.join('/scratch', job_id)
-    s3.store_folder(
+    src_dir = job_scratch_dir(job_id)
+    return s3.store_folder(
         src_dir=src_dir,
         bucket_root_path=s3_basepath,
     )
 
 
-def validate_cutout_size_from_table(df):
-    '''Determine if the cutout size spec, if present, in the input DataFrame is valid.'''
-    err_msg = ''
-    try:
-        # If cutout size is not specified in table, it is valid
-        if 'XSIZE' not in df or 'YSIZE' not in df:
-            return 'no size spec'
-        if ('XSIZE' in df and 'YSIZE' not in df) or ('YSIZE' in df and 'XSIZE' not in df):
-            return 'only one size spec'
-        xsizes = df.XSIZE.values
-        ysizes = df.YSIZE.values
-        err_msg = 'Unequal number of cutout size values'
-        assert len(xsizes) == len(ysizes)
-        err_msg = 'Non-numeric value'
-        assert np.issubdtype(xsizes.dtype, np.number)
-        assert np.issubdtype(ysizes.dtype, np.number)
-        for val in np.concatenate((xsizes, ysizes)):
-            err_msg = 'NaN detected'
-            assert not math.isnan(val)
-            err_msg = 'Value must be greater than zero'
-            assert val > 0
-        err_msg = ''
-    except Exception as err:
-        logger.warning(f'Invalid cutout size specification: {err}, {err_msg}')
-    return err_msg
-
-
-def validate_config(config):
+def validate_config(config, df):
     '''Validate configuration. Return empty string if valid; return error message if not.'''
-    try:
-        assert config['input_csv']
-    except Exception:
+    if df is None:
         return 'Coordinate table cannot be empty'
-    try:
-        df = pandas.read_csv(io.StringIO(config['input_csv']), comment='#', skipinitialspace=True)
-        df.to_csv(index=False)
-        logger.debug(df)
-    except Exception as err:
-        return f'Coordinate table parsing error: {err}'
-    try:
-        logger.debug(df.RA)
-        logger.debug(df.DEC)
-        assert len(df.RA.values)
-        assert len(df.DEC.values)
-    except Exception as err:
-        return f'Coordinate table must have one or more RA and DEC values: {err}'
-    try:
-        assert len(df.RA.values) == len(df.DEC.values)
-    except Exception as err:
-        return f'Coordinate table must have the same number of RA and DEC values: {err}'
-    try:
-        for val in df.RA.values + df.DEC.values:
-            assert isinstance(val, float)
-            assert not math.isnan(val)
-    except Exception as err:
-        return f'Coordinate table RA and DEC values must be numeric values: {err}'
+    err_msg = validate_input_table(df)
+    if err_msg:
+        return err_msg
     for param in ['xsize', 'ysize']:
         if param in config:
             try:
@@ -126,14 +105,20 @@ def validate_config(config):
                 assert config[param] > 0
             except Exception:
                 return f'{param} must be greater than zero'
-    err_msg = validate_cutout_size_from_table(df)
-    if err_msg and err_msg != 'no size spec':
-        return f'Invalid cutout size specification in coordinate table: {err_msg}'
     # TODO: Complete the validation logic for other config parameters.
     return ''
 
 
-def process_config(config):
+def process_config(config, job_id=None, owner=None, df=None):
+    '''Apply the default config values and validate the config and its coordinate table.
+
+    The coordinate table is either the CSV text in "input_csv" or, in "input_table", the ID of
+    a table uploaded by the owner. The CSV text is parsed unless the caller already parsed it
+    and passes the table in "df". If a job ID is given, the table is
+    stored in the job folder as a Parquet file and the processed config references it instead
+    of including the table. Returns the processed config, an error message, which is empty if
+    valid, and the parsed table, so that the caller does not read it again.
+    '''
     default_config = settings.DEFAULT_CONFIG
     processed_config = {}
     for key, value in default_config.items():
@@ -141,17 +126,28 @@ def process_config(config):
             processed_config[key] = config[key]
         else:
             processed_config[key] = value
-    if processed_config['input_csv']:
-        df = pandas.read_csv(io.StringIO(processed_config['input_csv']), comment='#', skipinitialspace=True)
-        processed_config['coords'] = df.to_csv(index=False)
-    else:
+    processed_config.pop('coords', None)
+    table = None
+    if config.get('input_table'):
+        try:
+            table = InputTable.objects.get(uuid__exact=config['input_table'], owner=owner,
+                                           status=InputTable.TableStatus.READY)
+            df = read_stored_table(s3, uploaded_table_file_path(table.uuid))
+        except Exception as err:
+            logger.error(f'Invalid config: Input table not available: {err}')
+            return processed_config, f'Input table "{config["input_table"]}" is not available', None
+    elif df is None and processed_config['input_csv']:
+        try:
+            df = read_input_table(processed_config['input_csv'])
+        except Exception as err:
+            logger.error(f'Invalid config: Coordinate table parsing error: {err}')
+            return processed_config, f'Coordinate table parsing error: {err}', None
+    elif df is None:
         logger.warning('No input coordinates provided.')
-        return processed_config
 
     # If the cutout size parameters are provided per-coordinate in the CSV text,
     # validate the values and ignore the global values.
-    err_msg = validate_cutout_size_from_table(df)
-    if not err_msg or err_msg == 'no size spec':
+    if df is not None and validate_cutout_size_from_table(df) in ['', 'no size spec']:
         # Remove the size overrides
         processed_config.pop('xsize')
         processed_config.pop('ysize')
@@ -160,22 +156,20 @@ def process_config(config):
             logger.info('Ignoring global cutout size parameters because per-coordinate sizes are specified.')
     else:
         logger.info('Using global cutout size parameters.')
-    err_msg = validate_config(processed_config)
+    err_msg = validate_config(processed_config, df)
     if err_msg:
         logger.error(f'Invalid config: {err_msg}')
-    return processed_config, err_msg
-
-
-@shared_task(name="Generate cutouts")
-def generate_cutouts(job_id, config={}):
-    config = DotMap(config)
+    elif job_id and s3.client:
+        if table:
+            processed_config['input_table'] = attach_uploaded_table(s3, table, job_id)
+        else:
+            processed_config['input_table'] = store_input_table(s3, job_id, df)
+        processed_config['input_csv'] = ''
+    return processed_config, err_msg, df
 
-    # Make sure that outdir exists
-    config.outdir = f'/scratch/{job_id}'
-    config.logfile = os.path.join(config.outdir, 'cutout.log')
-    os.makedirs(config.outdir, exist_ok=True)
 
-    # Configure logging
+def configure_cutter_logging(config):
+    '''Configure the "cutter" logger to write to the console and to the job log file.'''
     cutter_log = logging.getLogger('cutter')
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(logging.Formatter(fmt='%(asctime)s [%(name)s] %(levelname)-8s %(message)s'))
@@ -189,17 +183,81 @@ def generate_cutouts(job_id, config={}):
         thumbslib.SOUT = sout
     else:
         file_handler.setLevel(os.getenv('LOG_LEVEL', logging.INFO))
+    for handler in cutter_log.handlers:
+        handler.close()
     cutter_log.handlers.clear()
     cutter_log.addHandler(stream_handler)
     cutter_log.addHandler(file_handler)
     cutter_log.propagate = False
+    return cutter_log
 
-    # Print processed config
-    cutter_log.debug(json.dumps(config.toDict(), indent=2))
 
-    # Read in CSV file with pandas
-    df = pandas.read_csv(io.StringIO(config.input_csv), comment='#', skipinitialspace=True)
-    cutter_log.debug(f'''Input table DataFrame:\n{df}''')
+# The process pool is created on first use and lives as long as the Celery worker process,
+# so that the fork and import costs are paid once rather than for every coadd file.
+cutter_pool = None
+cutter_pool_logfile = ''
+
+
+def get_cutter_pool():
+    '''Return the worker-lifetime process pool used to run the FITS cutter.'''
+    global cutter_pool
+    if cutter_pool is None:
+        logger.info(f'Starting FITS cutter process pool with {settings.CUTOUT_CUTTER_POOL_SIZE} processes...')
+        cutter_pool = ProcessPoolExecutor(
+            max_workers=settings.CUTOUT_CUTTER_POOL_SIZE,
+            mp_context=mp.get_context('fork'),
+        )
+        # Fork the pool processes now, before the task starts any color or upload threads
+        cutter_pool.submit(os.getpid).result()
+    return cutter_pool
+
+
+def reset_cutter_pool():
+    '''Shut down the FITS cutter process pool so that a new one is created on next use.'''
+    global cutter_pool
+    if cutter_pool is not None:
+        cutter_pool.shutdown(wait=False, cancel_futures=True)
+        cutter_pool = None
+
+
+@worker_process_shutdown.connect
+def shutdown_cutter_pool(**kwargs):
+    reset_cutter_pool()
+
+
+def run_fitscutter(filename, ra, dec, log_config=None, **kwargs):
+    '''Run the FITS cutter on a single coadd file and return the elapsed time in seconds.
+
+    Pool processes outlive individual jobs, so the cutter logging is pointed at the log file
+    of the job that submitted the work item before cutting. The coadd file is read through
+    the node-local tile cache if it is enabled.
+    '''
+    global cutter_pool_logfile
+    if log_config and log_config['logfile'] != cutter_pool_logfile:
+        configure_cutter_logging(DotMap(log_config))
+        cutter_pool_logfile = log_config['logfile']
+    t0 = time.time()
+    with tile_cache.pinned(filename) as local_filename:
+        thumbslib.fitscutter(local_filename, ra, dec, **kwargs)
+    return time.time() - t0
+
+
+def find_tilenames_radec(ra, dec, dbh):
+    '''Match positions to tiles with the worker tile index, falling back to a database query per position.'''
+    if settings.CUTOUT_TILE_INDEX_ENABLED:
+        try:
+            return tile_index.find_tilenames_radec(ra, dec, dbh)
+        except (duckdb.Error, LookupError) as err:
+            logger.warning(f'Tile index unavailable, querying the database per position: {err}')
+    return fitsfinder.find_tilenames_radec(ra, dec, dbh)
+
+
+def match_tilenames(df, config, dbh, matched_list=''):
+    '''Find the tilename for each input position and write the matched table to "matched.csv".
+
+    The matched table is written to "matched_list" instead, if given.
+    '''
+    cutter_log = logging.getLogger('cutter')
     ra = df.RA.values  # if you only want the values otherwise use df.RA
     dec = df.DEC.values
     assert len(ra) == len(dec)
@@ -211,101 +269,748 @@ def generate_cutouts(job_id, config={}):
 
     # Check the xsize and ysizes
     xsize, ysize = fitsfinder.check_xysize(df, config, nobj)
-    # connect to the DuckDB database -- via filename
-    dbh = duckdb.connect(settings.CUTOUT_DATA_DB_PATH_DES, read_only=True)
-
-    # Get archive_root
-    archive_root = fitsfinder.get_archive_root(verb=False)
 
     cutter_log.debug('Finding tilename for each input position...')
-    tilenames, indices, tilenames_matched = fitsfinder.find_tilenames_radec(ra, dec, dbh)
+    tilenames, indices, tilenames_matched = find_tilenames_radec(ra, dec, dbh)
 
     # Add them back to pandas dataframe and write a file
     df['TILENAME'] = tilenames_matched
     # Get the thumbname base names and the them the pandas dataframe too
     df['THUMBNAME'] = thumbslib.get_base_names(tilenames_matched, ra, dec, prefix=config.prefix)
-    matched_list = os.path.join(config.outdir, 'matched.csv')
+    matched_list = matched_list or os.path.join(config.outdir, 'matched.csv')
     cutter_log.debug(f'''Matched tilenames DataFrame:\n{df}''')
     df.to_csv(matched_list, index=False)
     cutter_log.info(f"Wrote matched tilenames list to: {matched_list}")
+    return tilenames, indices, xsize, ysize
 
-    # Store the files used
-    files_used = []
 
-    # Loop over all of the tilenames
+def build_tiles(df, tilenames, indices, xsize, ysize):
+    '''Return the positions of each matched tile as the tile dicts processed by cut_tiles.'''
+    ra = df.RA.values
+    dec = df.DEC.values
+    thumbnames = df.THUMBNAME.values
+    return [{
+        'tilename': tilename,
+        'ra': ra[indices[tilename]],
+        'dec': dec[indices[tilename]],
+        'xsize': xsize[indices[tilename]],
+        'ysize': ysize[indices[tilename]],
+        'thumbname': thumbnames[indices[tilename]],
+    } for tilename in tilenames]
+
+
+def split_table_chunks(tilenames_matched, chunk_rows):
+    '''Split the rows of a table into chunks of about chunk_rows rows that do not share tiles.
+
+    Rows are grouped by their matched tile, and whole tiles are packed into each chunk in
+    tilename order. A tile with more than chunk_rows rows forms a chunk on its own. Rows
+    without a tile are placed in the first chunk. Returns the row indices of each chunk.
+    '''
+    tilenames_matched = np.array([tilename or '' for tilename in tilenames_matched])
+    order = np.argsort(tilenames_matched, kind='stable')
+    group_start = np.flatnonzero(np.r_[True, tilenames_matched[order][1:] != tilenames_matched[order][:-1]])
+    group_end = np.r_[group_start[1:], len(order)]
+    chunks = []
+    chunk_start = 0
+    for start, end in zip(group_start, group_end):
+        if start > chunk_start and end - chunk_start > chunk_rows:
+            chunks.append(order[chunk_start:start])
+            chunk_start = start
+    if len(order):
+        chunks.append(order[chunk_start:])
+    return chunks
+
+
+def chunk_table_path(job_id, chunk_id):
+    return os.path.join(settings.S3_BASE_DIR, f'''jobs/{job_id}''', 'chunks', f'chunk-{chunk_id:05d}.parquet')
+
+
+def merge_matched_tables(job_id):
+    '''Merge the matched tables of all chunks into "matched.csv" in the original row order.'''
+    s3_basepath = os.path.join(settings.S3_BASE_DIR, f'''jobs/{job_id}''')
+    paths = sorted([obj.object_name for obj in s3.list_objects(f'{s3_basepath}/logs/matched-')])
+    if not paths:
+        return
+    df = pandas.concat([pandas.read_csv(io.BytesIO(s3.get_object(path))) for path in paths])
+    df = df.sort_values(CHUNK_ROW_COLUMN).drop(columns=CHUNK_ROW_COLUMN)
+    s3.put_object(data=df.to_csv(index=False), path=os.path.join(s3_basepath, 'matched.csv'), json_output=False)
+    s3.delete_objects(paths + [obj.object_name for obj in s3.list_objects(f'{s3_basepath}/chunks/')])
+
+
+def coadd_file_paths(filenames, archive_root):
+    '''Return the full path of each coadd file, including the COMPRESSION suffix if present.'''
+    cutter_log = logging.getLogger('cutter')
+    paths = []
+    for k in range(len(filenames.BAND)):
+        # Rebuild the full filename with COMPRESSION if present
+        filename = os.path.join(archive_root, filenames.PATH[k])
+        cutter_log.debug(f''' full filename before COMPRESSION check: "{filename}"''')
+        if 'COMPRESSION' in filenames.dtype.names:
+            filename = os.path.join(filename, f'{filenames.FILENAME[k]}{filenames.COMPRESSION[k]}')
+        cutter_log.debug(f''' full filename: "{filename}"''')
+        paths.append(filename)
+    return paths
+
+
+def tile_output_files(tile, outdir):
+    '''Return the paths of the output files in outdir whose names begin with a thumbnail base name of the tile.'''
+    thumbnames = set(tile['thumbname'])
+    name_lengths = set([len(thumbname) for thumbname in thumbnames])
+    file_paths = []
+    for entry in os.scandir(outdir):
+        if entry.is_file() and any([entry.name[:name_length] in thumbnames for name_length in name_lengths]):
+            file_paths.append(entry.path)
+    return file_paths
+
+
+def local_file_paths(outdir):
+    '''Return the paths of all files in outdir relative to outdir.'''
+    rel_paths = []
+    for dirpath, dirnames, filenames in os.walk(outdir):
+        for filename in filenames:
+            rel_paths.append(os.path.relpath(os.path.join(dirpath, filename), outdir))
+    return rel_paths
+
+
+def run_color_radec(ra, dec, avail_bands, **kwargs):
+    '''Create the color images for a single position and return the elapsed time in seconds.'''
     t0 = time.time()
-    Ntile = 0
-    for tilename in tilenames:
+    color_radec(ra, dec, avail_bands, **kwargs)
+    return time.time() - t0
+
+
+def cut_tiles(tiles, config, dbh, archive_root, uploader=None, color=True, checkpoint_prefix=''):
+    '''Create the FITS and color cutouts for a list of tiles.
+
+    Each item in "tiles" is a dict with the "tilename" and the "ra", "dec", "xsize" and
+    "ysize" arrays of the positions matched to that tile. If config.MP is set, the FITS cutter
+    work items of all tiles are queued on the worker process pool up front, so the bands of
+    the next tile start as soon as a pool slot is free.
+
+    The color images of a tile are created concurrently across its positions by
+    CUTOUT_COLOR_WORKERS threads, each running STIFF with an equal share of the threads that
+    a single STIFF run used to get. If CUTOUT_COLOR_PIPELINE is enabled, the color images of
+    a tile are created while the next tile is being cut. No color images are created if
+    "color" is not set. If an uploader is given, the output
+    files of each tile are handed to it as soon as the tile is complete, and the tiles without
+    failed work items are checkpointed once their files are uploaded. The checkpoint names are
+    the tilenames with "checkpoint_prefix", which tells apart the passes of a job that cut the
+    same tiles. ScratchFull is raised if
+    the local output exceeds JOB_SCRATCH_JOB_MAX_SIZE before a tile is cut. The timing and status
+    of every work item is written to config.reportfile. Returns the list of coadd files used
+    and the report DataFrame.
+    '''
+    cutter_log = logging.getLogger('cutter')
+    pool = get_cutter_pool() if config.MP else None
+    log_config = {'logfile': config.logfile, 'verbose': config.verbose}
+    color_workers = max(1, settings.CUTOUT_COLOR_WORKERS)
+    files_used = []
+    report = []
+    failed_tiles = set()
+    color_items = deque()
+    # Resolve the coadd files of all tiles up front
+    coadd_files = coadd_file_resolver.resolve([tile['tilename'] for tile in tiles], dbh, bands=config.bands)
+
+    def collect(stage, tilename, work_items):
+        for name, work_item in work_items.items():
+            try:
+                elapsed = work_item.result()
+                cutter_log.debug(f'''Finished {stage} work item "{name}" in {elapsed:.2f} seconds''')
+                report.append([stage, tilename, name, 'SUCCESS', round(elapsed, 3), ''])
+            except Exception as err:
+                cutter_log.error(f'''The {stage} work item "{name}" failed: {err}''')
+                report.append([stage, tilename, name, 'FAILURE', '', str(err)])
+                failed_tiles.add(tilename)
+                if isinstance(err, BrokenProcessPool):
+                    reset_cutter_pool()
+
+    def check_scratch():
+        try:
+            check_job_scratch(config.outdir)
+        except ScratchFull:
+            if not uploader:
+                raise
+            # The uploader deletes the local copy of each uploaded file
+            cutter_log.info('Waiting for the background uploads to free scratch space...')
+            uploader.flush()
+            check_job_scratch(config.outdir)
+
+    def tile_done(tile):
+        if uploader:
+            tilename = tile['tilename']
+            checkpoint = None
+            if tilename not in failed_tiles:
+                checkpoint = (f'{checkpoint_prefix}{tilename}', coadd_file_paths(coadd_files[tilename], archive_root))
+            uploader.submit(tile_output_files(tile, config.outdir), checkpoint=checkpoint)
+            uploader.register()
+
+    def collect_color(tile, tile_color_items):
+        collect('color', tile['tilename'], tile_color_items)
+        tile_done(tile)
+
+    def finish_tile(color_pool, tile, avail_bands, work_items):
         t1 = time.time()
-        Ntile = Ntile + 1
-        cutter_log.info("# ----------------------------------------------------")
-        cutter_log.info(f"# Processing: {tilename} [{Ntile}/{len(tilenames)}]")
-        cutter_log.info("# ----------------------------------------------------")
-
-        # 1. Get all of the filenames for a given tilename
-        filenames = fitsfinder.get_coaddfiles_tilename(tilename, dbh, bands=config.bands)
-
-        if filenames is False:
-            cutter_log.info(f"# Skipping: {tilename} -- not in TABLE ")
-            continue
-        # Fix compression for SV1/Y2A1/Y3A1 releases
+        tilename = tile['tilename']
+        # Collect the pipelined color images that are already complete
+        while color_items and all([item.done() for item in color_items[0][1].values()]):
+            collect_color(*color_items.popleft())
+        # Wait for the FITS cutouts of this tile before creating the color images
+        collect('fits', tilename, work_items)
+        if not color:
+            tile_done(tile)
+            return
+
+        # 3. Create color images using stiff for each ra,dec and loop over (ra,dec)
+        NP = len(avail_bands) if config.MP else 1
+        tile_color_items = {}
+        for k in range(len(tile['ra'])):
+            tile_color_items[f'''{tile['ra'][k]},{tile['dec'][k]}'''] = color_pool.submit(
+                run_color_radec, tile['ra'][k], tile['dec'][k], avail_bands,
+                prefix=config.prefix,
+                colorset=config.colorset,
+                outdir=config.outdir,
+                verb=config.verb,
+                stiff_parameters={'NTHREADS': max(1, NP // color_workers)})
+        if settings.CUTOUT_COLOR_PIPELINE:
+            color_items.append((tile, tile_color_items))
         else:
-            filenames = fitsfinder.fix_compression(filenames)
+            collect_color(tile, tile_color_items)
+        cutter_log.debug(f"# Time {tilename}: {thumbslib.elapsed_time(t1)}")
 
-        indx = indices[tilename]
+    with ThreadPoolExecutor(max_workers=color_workers) as color_pool:
+        pending = deque()
+        for Ntile, tile in enumerate(tiles, start=1):
+            tilename = tile['tilename']
+            cutter_log.info("# ----------------------------------------------------")
+            cutter_log.info(f"# Processing: {tilename} [{Ntile}/{len(tiles)}]")
+            cutter_log.info("# ----------------------------------------------------")
+
+            # 1. Get all of the filenames for a given tilename
+            filenames = coadd_files[tilename]
+
+            if filenames is False:
+                cutter_log.info(f"# Skipping: {tilename} -- not in TABLE ")
+                continue
+            check_scratch()
+
+            # 2. Submit a FITS cutter work item for each coadd file
+            work_items = {}
+            for filename in coadd_file_paths(filenames, archive_root):
+                # Write them to a file
+                files_used.append(filename)
+                ar = (filename, tile['ra'], tile['dec'])
+                kw = {'xsize': tile['xsize'], 'ysize': tile['ysize'],
+                      'units': 'arcmin', 'prefix': config.prefix, 'outdir': config.outdir,
+                      'tilename': tilename, 'verb': config.verb}
+                if config.verb:
+                    thumbslib.SOUT.write(f"# Cutting: {filename}")
+                if pool:
+                    work_items[filename] = pool.submit(run_fitscutter, *ar, log_config=log_config, **kw)
+                else:
+                    # Run the cutter inline and wrap the outcome so that it is handled like a pool result
+                    work_items[filename] = Future()
+                    try:
+                        work_items[filename].set_result(run_fitscutter(*ar, **kw))
+                    except Exception as err:
+                        work_items[filename].set_exception(err)
+            pending.append((tile, filenames.BAND, work_items))
+            # Without the process pool the cutouts are already done, so the color
+            # images can be started before cutting the next tile.
+            if not pool:
+                finish_tile(color_pool, *pending.popleft())
+        while pending:
+            finish_tile(color_pool, *pending.popleft())
+        while color_items:
+            collect_color(*color_items.popleft())
+
+    if tile_cache.enabled:
+        cutter_log.info(f'Tile cache stats: {tile_cache.stats()}')
+    report = pandas.DataFrame(report, columns=['STAGE', 'TILENAME', 'ITEM', 'STATUS', 'ELAPSED', 'ERROR'])
+    report.to_csv(config.reportfile, index=False)
+    failures = report[report.STATUS == 'FAILURE']
+    if len(failures):
+        cutter_log.warning(f'''{len(failures)} of {len(report)} cutout work items failed. '''
+                           f'''See "{os.path.basename(config.reportfile)}" for details.''')
+    return files_used, report
+
+
+def skip_completed_tiles(job_id, tiles, checkpoint_prefix=''):
+    '''Remove the tiles checkpointed by an earlier run of the job.
 
-        avail_bands = filenames.BAND
-
-        # 2. Loop over all of the filename -- We could use multi-processing
-        p = {}
-        n_filenames = len(avail_bands)
-        for k in range(n_filenames):
-
-            # Rebuild the full filename with COMPRESSION if present
-            filename = os.path.join(archive_root, filenames.PATH[k])
-            cutter_log.debug(f''' full filename before COMPRESSION check: "{filename}"''')
-            if 'COMPRESSION' in filenames.dtype.names:
-                filename = os.path.join(filename, f'{filenames.FILENAME[k]}{filenames.COMPRESSION[k]}')
-            cutter_log.debug(f''' full filename: "{filename}"''')
-            # Write them to a file
-            files_used.append(filename)
-
-            ar = (filename, ra[indx], dec[indx])
-            kw = {'xsize': xsize[indx], 'ysize': ysize[indx],
-                  'units': 'arcmin', 'prefix': config.prefix, 'outdir': config.outdir,
-                  'tilename': tilename, 'verb': config.verb}
-            if config.verb:
-                sout.write(f"# Cutting: {filename}")
-            if config.MP:
-                NP = len(avail_bands)
-                p[filename] = mp.Process(target=thumbslib.fitscutter, args=ar, kwargs=kw)
-                p[filename].start()
+    "checkpoint_prefix" selects the checkpoints of a pass, as given to cut_tiles. Returns the
+    tiles that still need to be cut and the coadd files used by the completed tiles.
+    '''
+    checkpoints = dict(TileCheckpoint.objects.filter(
+        job__uuid=job_id, tilename__in=[f'''{checkpoint_prefix}{tile['tilename']}''' for tile in tiles]
+    ).values_list('tilename', 'files_used'))
+    if not checkpoints:
+        return tiles, []
+    logging.getLogger('cutter').info(f'Skipping {len(checkpoints)} tiles completed by an earlier run.')
+    files_used = [filename for tile_files in checkpoints.values() for filename in tile_files]
+    return [tile for tile in tiles if f'''{checkpoint_prefix}{tile['tilename']}''' not in checkpoints], files_used
+
+
+def restore_cached_results(job_id, tiles, config):
+    '''Copy the positions found in the cutout result cache into the job folder.
+
+    Returns the tiles restricted to the positions that still need to be cut, and a dict
+    mapping the cache key of each of those positions to its tilename and thumbnail base name.
+    '''
+    if not result_cache.enabled:
+        return tiles, {}
+    cutter_log = logging.getLogger('cutter')
+    tile_keys = [[result_cache.key(tile['tilename'], tile['ra'][k], tile['dec'][k],
+                                   tile['xsize'][k], tile['ysize'][k], config)
+                  for k in range(len(tile['ra']))] for tile in tiles]
+    cached = result_cache.lookup_many([key for keys in tile_keys for key in keys])
+    cached_paths = []
+    missed = {}
+    remaining_tiles = []
+    for tile, keys in zip(tiles, tile_keys):
+        missed_idx = []
+        for k, key in enumerate(keys):
+            if cached[key]:
+                cached_paths.extend(cached[key])
             else:
-                NP = 1
-                thumbslib.fitscutter(*ar, **kw)
+                missed_idx.append(k)
+                missed[key] = (tile['tilename'], tile['thumbname'][k])
+        if missed_idx:
+            remaining_tiles.append({name: values if name == 'tilename' else np.asarray(values)[missed_idx]
+                                    for name, values in tile.items()})
+    result_cache.restore(cached_paths, os.path.join(settings.S3_BASE_DIR, f'''jobs/{job_id}'''))
+    hits = len(cached) - len(missed)
+    CacheMetric.objects.create(hits=hits, misses=len(missed))
+    cutter_log.info(f'Restored {hits} of {len(cached)} positions from the cutout result cache.')
+    return remaining_tiles, missed
 
-        # Make sure all process are closed before proceeding
-        if config.MP:
-            for filename, value in p.items():
-                value.join()
 
-        # 3. Create color images using stiff for each ra,dec and loop over (ra,dec)
-        for k in range(len(ra[indx])):
-            color_radec(ra[indx][k], dec[indx][k], avail_bands,
-                        prefix=config.prefix,
-                        colorset=config.colorset,
-                        outdir=config.outdir,
-                        verb=config.verb,
-                        stiff_parameters={'NTHREADS': NP})
+def store_cached_results(job_id, missed, report, rel_paths):
+    '''Copy the uploaded output files of newly cut positions into the cutout result cache.
 
-        cutter_log.debug(f"# Time {tilename}: {thumbslib.elapsed_time(t1)}")
+    The output files of a position are the uploaded files, given as paths relative to the job
+    folder, whose names begin with the thumbnail base name. Positions in tiles with failed
+    work items are not cached.
+    '''
+    if not result_cache.enabled or not missed:
+        return
+    failed_tiles = set(report[report.STATUS == 'FAILURE'].TILENAME)
+    keys_by_thumbname = {thumbname: key for key, (tilename, thumbname) in missed.items()
+                         if tilename not in failed_tiles}
+    name_lengths = set([len(thumbname) for thumbname in keys_by_thumbname])
+    s3_basepath = os.path.join(settings.S3_BASE_DIR, f'''jobs/{job_id}''')
+    entries = {}
+    for rel_path in rel_paths:
+        for name_length in name_lengths:
+            key = keys_by_thumbname.get(os.path.basename(rel_path)[:name_length])
+            if key:
+                entries.setdefault(key, []).append(os.path.join(s3_basepath, rel_path))
+                break
+    result_cache.store(entries)
+
+
+@shared_task(name="Generate cutouts", bind=True)
+def generate_cutouts(self, job_id, config={}):
+    config = DotMap(config)
+    # Wait until the job output fits in the scratch space of this node
+    admit_task(self, job_id)
+
+    # Make sure that outdir exists
+    config.outdir = job_scratch_dir(job_id)
+    config.logfile = os.path.join(config.outdir, 'cutout.log')
+    config.reportfile = os.path.join(config.outdir, 'cutter_report.csv')
+    os.makedirs(config.outdir, exist_ok=True)
+
+    # Configure logging
+    cutter_log = configure_cutter_logging(config)
+
+    # Print processed config
+    cutter_log.debug(json.dumps(config.toDict(), indent=2))
+
+    # Read in the coordinate table
+    df = load_input_table(s3, config)
+    cutter_log.debug(f'''Input table DataFrame:\n{df}''')
+
+    # connect to the DuckDB database -- via filename
+    dbh = duckdb.connect(settings.CUTOUT_DATA_DB_PATH_DES, read_only=True)
+
+    # Get archive_root
+    archive_root = fitsfinder.get_archive_root(verb=False)
+
+    tilenames, indices, xsize, ysize = match_tilenames(df, config, dbh)
+    tiles = build_tiles(df, tilenames, indices, xsize, ysize)
+    # Skip the tiles completed before the job was interrupted
+    tiles, files_done = skip_completed_tiles(job_id, tiles)
+    # Only cut the positions that are not in the result cache
+    tiles, missed = restore_cached_results(job_id, tiles, config)
+
+    # Loop over all of the tilenames, uploading the cutouts of each tile as it completes
+    uploader = JobFileUploader(s3, job_id, config.outdir) if settings.CUTOUT_STREAMING_UPLOAD else None
+    t0 = time.time()
+    files_used, report = cut_tiles(tiles, config, dbh, archive_root, uploader=uploader)
+    files_used = files_done + files_used
     cutter_log.debug(f"\n*** Grand Total time:{thumbslib.elapsed_time(t0)} ***")
 
     with open(os.path.join(config.outdir, 'files_used.csv'), 'w') as used_files:
         used_files.write('\n'.join(files_used))
 
-    # Upload all job files to the object store
+    # Upload the remaining job files to the object store
+    rel_paths = local_file_paths(config.outdir)
+    if uploader:
+        uploader.close()
+        rel_paths += uploader.uploaded_paths()
+    upload_job_files(job_id)
+    store_cached_results(job_id, missed, report, rel_paths)
+    # Remove the local output once it is uploaded
+    shutil.rmtree(config.outdir, ignore_errors=True)
+    ScratchSpace().release(job_id)
+    # Update the known job files in the database
+    create_job_file_objects(job_id)
+
+
+# Prefix of the checkpoints of the tiles whose added bands are cut for the parent positions of a derived job
+DERIVED_BANDS_CHECKPOINT = 'bands:'
+
+
+@shared_task(name="Generate derived cutouts", bind=True)
+def generate_derived_cutouts(self, job_id, config={}):
+    '''Create the cutouts of a job derived from a parent job with other bands or added positions.
+
+    The parent positions keep the tiles assigned in the parent "matched.csv" and only the added
+    positions are matched to tiles. The parent outputs that still apply are copied into the job
+    folder with server-side copies: the FITS cutouts in the selected bands, and the color images
+    if the selected bands of the color set are unchanged. Then only the added bands of the parent
+    positions, without color images, and all bands of the added positions are cut. If the color
+    set bands changed, the parent positions are cut again in all bands.
+    '''
+    config = DotMap(config)
+    admit_task(self, job_id)
+    config.outdir = job_scratch_dir(job_id)
+    config.logfile = os.path.join(config.outdir, 'cutout.log')
+    config.reportfile = os.path.join(config.outdir, 'cutter_report.csv')
+    os.makedirs(config.outdir, exist_ok=True)
+    cutter_log = configure_cutter_logging(config)
+    cutter_log.debug(json.dumps(config.toDict(), indent=2))
+
+    parent = config.derived_from
+    df = load_input_table(s3, config)
+    ra = df.RA.values
+    dec = df.DEC.values
+    parent_basepath = os.path.join(settings.S3_BASE_DIR, f'''jobs/{parent.job}''')
+    matched = pandas.read_csv(io.BytesIO(s3.get_object(os.path.join(parent_basepath, 'matched.csv'))),
+                              dtype={'TILENAME': str}, keep_default_na=False)
+    if len(matched) != parent.positions:
+        raise ValueError(f'''The matched table of parent job "{parent.job}" does not match its coordinate table''')
+    tilenames_matched = [tilename if tilename not in ['', 'False'] else False for tilename in matched.TILENAME]
+    dbh = duckdb.connect(settings.CUTOUT_DATA_DB_PATH_DES, read_only=True)
+    archive_root = fitsfinder.get_archive_root(verb=False)
+    # Only the added positions are matched to tiles
+    if len(df) > parent.positions:
+        cutter_log.debug(f'''Finding tilename for {len(df) - parent.positions} added positions...''')
+        tilenames_matched += list(find_tilenames_radec(ra[parent.positions:], dec[parent.positions:], dbh)[2])
+    df['TILENAME'] = tilenames_matched
+    df['THUMBNAME'] = thumbslib.get_base_names(tilenames_matched, ra, dec, prefix=config.prefix)
+    df.to_csv(os.path.join(config.outdir, 'matched.csv'), index=False)
+    xsize, ysize = fitsfinder.check_xysize(df, config, len(df))
+    indices = {}
+    for idx, tilename in enumerate(tilenames_matched):
+        if tilename:
+            indices.setdefault(tilename, []).append(idx)
+    indices = {tilename: np.array(indx) for tilename, indx in indices.items()}
+
+    def select_tiles(rows):
+        # Restrict the tiles to the positions in the selected rows
+        tile_indices = {tilename: indx[rows[indx]] for tilename, indx in indices.items() if rows[indx].any()}
+        return build_tiles(df, list(tile_indices), tile_indices, xsize, ysize)
+
+    parent_rows = np.arange(len(df)) < parent.positions
+    bands = band_set(config.bands)
+    added_bands = bands - band_set(parent.bands)
+    colorset = set(config.colorset)
+    colors = colorset & band_set(parent.bands) == colorset & bands
+    # Copy the parent outputs that still apply
+    if colors:
+        copies = parent_output_copies(
+            JobFile.objects.filter(job__uuid=parent.job).values_list('path', flat=True),
+            df.THUMBNAME.values[parent_rows], bands, colors,
+            parent_basepath, os.path.join(settings.S3_BASE_DIR, f'''jobs/{job_id}'''))
+        s3.copy_objects(copies)
+        cutter_log.info(f'Copied {len(copies)} output files of parent job "{parent.job}".')
+    band_tiles = select_tiles(parent_rows) if colors and added_bands else []
+    # Skip the tiles completed before the job was interrupted. The added bands of the parent
+    # positions are cut in a pass of their own, which is checkpointed separately.
+    band_tiles, files_done = skip_completed_tiles(job_id, band_tiles, checkpoint_prefix=DERIVED_BANDS_CHECKPOINT)
+    cut_rows = ~parent_rows if colors else np.ones(len(df), dtype=bool)
+    tiles, tile_files_done = skip_completed_tiles(job_id, select_tiles(cut_rows))
+    files_done += tile_files_done
+    # Only cut the positions that are not in the result cache
+    tiles, missed = restore_cached_results(job_id, tiles, config)
+
+    uploader = JobFileUploader(s3, job_id, config.outdir) if settings.CUTOUT_STREAMING_UPLOAD else None
+    t0 = time.time()
+    files_used = files_done
+    reports = []
+    if band_tiles:
+        cutter_log.info(f'''Cutting the added bands {', '.join(sorted(added_bands))} of the parent positions...''')
+        band_config = DotMap(config.toDict())
+        band_config.bands = sorted(added_bands)
+        band_files_used, report = cut_tiles(band_tiles, band_config, dbh, archive_root, uploader=uploader, color=False,
+                                            checkpoint_prefix=DERIVED_BANDS_CHECKPOINT)
+        files_used += band_files_used
+        reports.append(report)
+    tile_files_used, report = cut_tiles(tiles, config, dbh, archive_root, uploader=uploader)
+    files_used += tile_files_used
+    reports.append(report)
+    report = pandas.concat(reports, ignore_index=True)
+    report.to_csv(config.reportfile, index=False)
+    dbh.close()
+    cutter_log.debug(f"\n*** Grand Total time:{thumbslib.elapsed_time(t0)} ***")
+
+    with open(os.path.join(config.outdir, 'files_used.csv'), 'w') as used_files:
+        used_files.write('\n'.join(files_used))
+    rel_paths = local_file_paths(config.outdir)
+    if uploader:
+        uploader.close()
+        rel_paths += uploader.uploaded_paths()
+    upload_job_files(job_id)
+    store_cached_results(job_id, missed, report, rel_paths)
+    shutil.rmtree(config.outdir, ignore_errors=True)
+    ScratchSpace().release(job_id)
+    create_job_file_objects(job_id)
+
+
+@shared_task(name="Plan cutouts", bind=True)
+def plan_cutouts(self, job_id, config={}):
+    '''Match the input positions to tiles and fan out the tiles as parallel cutout tasks.
+
+    The tiles are split into batches of CUTOUT_TILES_PER_TASK tiles and each batch is sent
+    to the jobs queue as a "Generate tile cutouts" task. The "Finalize cutouts" task runs
+    as the chord callback once every batch is complete.
+    '''
+    config = DotMap(config)
+    config.outdir = job_scratch_dir(job_id)
+    config.logfile = os.path.join(config.outdir, 'cutout.log')
+    os.makedirs(config.outdir, exist_ok=True)
+    cutter_log = configure_cutter_logging(config)
+    cutter_log.debug(json.dumps(config.toDict(), indent=2))
+
+    df = load_input_table(s3, config)
+    cutter_log.debug(f'''Input table DataFrame:\n{df}''')
+    ra = df.RA.values
+    dec = df.DEC.values
+    dbh = duckdb.connect(settings.CUTOUT_DATA_DB_PATH_DES, read_only=True)
+    tilenames, indices, xsize, ysize = match_tilenames(df, config, dbh)
+    thumbnames = df.THUMBNAME.values
+    dbh.close()
+
+    # Only the positions of each tile are sent to the batch tasks, not the full coordinate table.
+    batch_config = {key: value for key, value in config.toDict().items()
+                    if key not in ['input_csv', 'input_table', 'coords', 'outdir', 'logfile']}
+    tiles = []
+    for tilename in tilenames:
+        indx = indices[tilename]
+        tiles.append({
+            'tilename': tilename,
+            'ra': ra[indx].tolist(),
+            'dec': dec[indx].tolist(),
+            'xsize': np.asarray(xsize[indx]).tolist(),
+            'ysize': np.asarray(ysize[indx]).tolist(),
+            'thumbname': thumbnames[indx].tolist(),
+        })
+    batch_size = max(1, settings.CUTOUT_TILES_PER_TASK)
+    batches = [tiles[idx:idx + batch_size] for idx in range(0, len(tiles), batch_size)]
+    cutter_log.info(f'Dispatching {len(tiles)} tiles in {len(batches)} batches...')
+
+    # Upload the matched table and planning log now, because the batch tasks may
+    # run on other worker nodes that do not share this scratch volume.
     upload_job_files(job_id)
+    shutil.rmtree(config.outdir, ignore_errors=True)
+
+    if not batches:
+        return finalize_cutouts([], job_id=job_id, config=batch_config)
+    # Run the subtasks on the jobs queue selected by the job cost estimate
+    job = Job.objects.get(uuid__exact=job_id)
+    queue = job.estimate.get('queue', settings.CUTOUT_QUEUE_STANDARD)
+    header = [
+        generate_tile_cutouts.si(
+            job_id=job_id, config=batch_config, batch_id=batch_id, tiles=batch,
+        ).set(task_id=str(uuid4()), queue=queue)
+        for batch_id, batch in enumerate(batches)
+    ]
+    callback = finalize_cutouts.s(job_id=job_id, config=batch_config).set(task_id=str(uuid4()), queue=queue)
+    # Store the dynamically generated task IDs with the job so they can be revoked.
+    job.task_ids = job.task_ids + [sig.id for sig in header] + [callback.id]
+    job.save()
+    # Replace this task with the chord so that the parent workflow chain
+    # only resumes after the callback completes.
+    return self.replace(chord(header, callback))
+
+
+@shared_task(name="Generate tile cutouts", bind=True)
+def generate_tile_cutouts(self, job_id, config={}, batch_id=0, tiles=[]):
+    '''Create the cutouts for a batch of tiles and upload them to the job folder.
+
+    Each item in "tiles" is a dict with the "tilename" and the "ra", "dec", "xsize", "ysize"
+    and "thumbname" lists of the positions matched to that tile. Returns the list of coadd
+    files used.
+    '''
+    config = DotMap(config)
+    batch_name = f'batch-{batch_id:05d}'
+    admit_task(self, job_id, name=batch_name, positions=sum([len(tile['ra']) for tile in tiles]))
+    config.outdir = job_scratch_dir(job_id, batch_name)
+    config.logfile = os.path.join(config.outdir, 'logs', f'cutout-{batch_id:05d}.log')
+    config.reportfile = os.path.join(config.outdir, 'logs', f'cutter_report-{batch_id:05d}.csv')
+    os.makedirs(os.path.dirname(config.logfile), exist_ok=True)
+    cutter_log = configure_cutter_logging(config)
+
+    dbh = duckdb.connect(settings.CUTOUT_DATA_DB_PATH_DES, read_only=True)
+    archive_root = fitsfinder.get_archive_root(verb=False)
+    for tile in tiles:
+        for key in ['ra', 'dec', 'xsize', 'ysize', 'thumbname']:
+            tile[key] = np.array(tile[key])
+    tiles, files_done = skip_completed_tiles(job_id, tiles)
+    # Only cut the positions that are not in the result cache
+    tiles, missed = restore_cached_results(job_id, tiles, config)
+    uploader = JobFileUploader(s3, job_id, config.outdir) if settings.CUTOUT_STREAMING_UPLOAD else None
+    t0 = time.time()
+    files_used, report = cut_tiles(tiles, config, dbh, archive_root, uploader=uploader)
+    files_used = files_done + files_used
+    cutter_log.debug(f"# Batch {batch_id} total time: {thumbslib.elapsed_time(t0)}")
+    dbh.close()
+
+    # Upload the remaining batch output to the job root folder
+    rel_paths = local_file_paths(config.outdir)
+    if uploader:
+        uploader.close()
+        rel_paths += uploader.uploaded_paths()
+    s3.store_folder(
+        src_dir=config.outdir,
+        bucket_root_path=os.path.join(settings.S3_BASE_DIR, f'''jobs/{job_id}'''),
+    )
+    store_cached_results(job_id, missed, report, rel_paths)
+    shutil.rmtree(config.outdir, ignore_errors=True)
+    ScratchSpace().release(job_id, name=batch_name)
+    # Show the fair-share dispatcher that the job is alive
+    Job.objects.filter(uuid__exact=job_id).update(modified=timezone.now())
+    return files_used
+
+
+@shared_task(name="Plan cutout chunks", bind=True)
+def plan_cutout_chunks(self, job_id, config={}):
+    '''Split a large coordinate table into chunks of whole tiles and process them as parallel tasks.
+
+    The positions are matched to tiles and the table is split into chunks of about
+    CUTOUT_CHUNK_ROWS rows that do not share tiles. Each chunk is stored in the job folder
+    and processed by a "Generate chunk cutouts" task, so that no task holds the full table
+    while cutting. The "Finalize cutouts" task merges the matched tables of the chunks.
+    '''
+    config = DotMap(config)
+    config.outdir = job_scratch_dir(job_id)
+    config.logfile = os.path.join(config.outdir, 'cutout.log')
+    os.makedirs(config.outdir, exist_ok=True)
+    cutter_log = configure_cutter_logging(config)
+    cutter_log.debug(json.dumps(config.toDict(), indent=2))
+
+    df = load_input_table(s3, config)
+    df[CHUNK_ROW_COLUMN] = np.arange(len(df))
+    dbh = duckdb.connect(settings.CUTOUT_DATA_DB_PATH_DES, read_only=True)
+    tilenames_matched = find_tilenames_radec(df.RA.values, df.DEC.values, dbh)[2]
+    dbh.close()
+    chunks = split_table_chunks(tilenames_matched, max(1, settings.CUTOUT_CHUNK_ROWS))
+    for chunk_id, rows in enumerate(chunks):
+        buffer = io.BytesIO()
+        df.iloc[rows].to_parquet(buffer, index=False)
+        s3.put_object(path=chunk_table_path(job_id, chunk_id), data=buffer.getvalue())
+    cutter_log.info(f'Dispatching {len(df)} positions in {len(chunks)} chunks...')
+    del df
+    upload_job_files(job_id)
+    shutil.rmtree(config.outdir, ignore_errors=True)
+
+    chunk_config = {key: value for key, value in config.toDict().items()
+                    if key not in ['input_csv', 'input_table', 'coords', 'outdir', 'logfile']}
+    # Run the subtasks on the jobs queue selected by the job cost estimate
+    job = Job.objects.get(uuid__exact=job_id)
+    queue = job.estimate.get('queue', settings.CUTOUT_QUEUE_STANDARD)
+    header = [
+        generate_chunk_cutouts.si(
+            job_id=job_id, config=chunk_config, chunk_id=chunk_id,
+        ).set(task_id=str(uuid4()), queue=queue)
+        for chunk_id in range(len(chunks))
+    ]
+    callback = finalize_cutouts.s(
+        job_id=job_id, config=chunk_config, merge_matched=True,
+    ).set(task_id=str(uuid4()), queue=queue)
+    # Store the dynamically generated task IDs with the job so they can be revoked.
+    job.task_ids = job.task_ids + [sig.id for sig in header] + [callback.id]
+    job.chunks_total = len(chunks)
+    job.chunks_done = 0
+    job.save()
+    if not header:
+        return finalize_cutouts([], job_id=job_id, config=chunk_config)
+    return self.replace(chord(header, callback))
+
+
+@shared_task(name="Generate chunk cutouts", bind=True)
+def generate_chunk_cutouts(self, job_id, config={}, chunk_id=0):
+    '''Create the cutouts for one chunk of the coordinate table and upload them to the job folder.
+
+    The matched table of the chunk is uploaded as "logs/matched-NNNNN.csv". Returns the list
+    of coadd files used.
+    '''
+    config = DotMap(config)
+    df = read_stored_table(s3, chunk_table_path(job_id, chunk_id))
+    chunk_name = f'chunk-{chunk_id:05d}'
+    admit_task(self, job_id, name=chunk_name, positions=len(df))
+    config.outdir = job_scratch_dir(job_id, chunk_name)
+    config.logfile = os.path.join(config.outdir, 'logs', f'cutout-{chunk_id:05d}.log')
+    config.reportfile = os.path.join(config.outdir, 'logs', f'cutter_report-{chunk_id:05d}.csv')
+    os.makedirs(os.path.dirname(config.logfile), exist_ok=True)
+    cutter_log = configure_cutter_logging(config)
+
+    dbh = duckdb.connect(settings.CUTOUT_DATA_DB_PATH_DES, read_only=True)
+    archive_root = fitsfinder.get_archive_root(verb=False)
+    matched_list = os.path.join(config.outdir, 'logs', f'matched-{chunk_id:05d}.csv')
+    tilenames, indices, xsize, ysize = match_tilenames(df, config, dbh, matched_list=matched_list)
+    tiles = build_tiles(df, tilenames, indices, xsize, ysize)
+    del df
+    tiles, files_done = skip_completed_tiles(job_id, tiles)
+    # Only cut the positions that are not in the result cache
+    tiles, missed = restore_cached_results(job_id, tiles, config)
+    uploader = JobFileUploader(s3, job_id, config.outdir) if settings.CUTOUT_STREAMING_UPLOAD else None
+    t0 = time.time()
+    files_used, report = cut_tiles(tiles, config, dbh, archive_root, uploader=uploader)
+    files_used = files_done + files_used
+    cutter_log.debug(f"# Chunk {chunk_id} total time: {thumbslib.elapsed_time(t0)}")
+    dbh.close()
+
+    # Upload the remaining chunk output to the job root folder
+    rel_paths = local_file_paths(config.outdir)
+    if uploader:
+        uploader.close()
+        rel_paths += uploader.uploaded_paths()
+    s3.store_folder(
+        src_dir=config.outdir,
+        bucket_root_path=os.path.join(settings.S3_BASE_DIR, f'''jobs/{job_id}'''),
+    )
+    store_cached_results(job_id, missed, report, rel_paths)
+    shutil.rmtree(config.outdir, ignore_errors=True)
+    ScratchSpace().release(job_id, name=chunk_name)
+    # Record the progress, which also shows the fair-share dispatcher that the job is alive
+    Job.objects.filter(uuid__exact=job_id).update(chunks_done=F('chunks_done') + 1, modified=timezone.now())
+    return files_used
+
+
+@shared_task(name="Finalize cutouts")
+def finalize_cutouts(results, job_id='', config={}, merge_matched=False):
+    '''Record the coadd files used by all tile batches and register the job files.
+
+    If merge_matched is set, the matched tables of the table chunks are merged first.
+    '''
+    if merge_matched:
+        merge_matched_tables(job_id)
+    files_used = [filename for batch_files in results for filename in batch_files]
+    s3.put_object(data='\n'.join(files_used),
+                  path=os.path.join(settings.S3_BASE_DIR, f'''jobs/{job_id}''', 'files_used.csv'),
+                  json_output=False)
     # Update the known job files in the database
     create_job_file_objects(job_id)
 
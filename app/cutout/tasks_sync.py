@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+import duckdb
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from des_cutter import fitsfinder
+from des_cutter import thumbslib
+from des_cutter import color_radec
+from .tasks import find_tilenames_radec, coadd_file_resolver, coadd_file_paths, run_fitscutter
+from .result_cache import cutter_version
+from .log import get_logger
+logger = get_logger(__name__)
+
+# The metadata database connection is kept open between requests by each worker process
+sync_dbh = None
+
+
+def sync_cutout_key(ra, dec, size, bands, image_format):
+    '''Return the cache key of a single cutout, with the position rounded as in the result cache keys.'''
+    spec = [round(float(ra), 8), round(float(dec), 8), round(float(size), 4), list(bands), image_format,
+            settings.DEFAULT_CONFIG['prefix'], cutter_version()]
+    return f'sync-cutout:{hashlib.sha256(json.dumps(spec).encode("utf-8")).hexdigest()}'
+
+
+def get_sync_dbh():
+    global sync_dbh
+    if sync_dbh is None:
+        sync_dbh = duckdb.connect(settings.CUTOUT_DATA_DB_PATH_DES, read_only=True)
+    return sync_dbh
+
+
+@shared_task
+def cut_position(key, ra, dec, size, bands, image_format='fits'):
+    '''Create a single cutout in the worker process and store it in the cache under "key".
+
+    The position is matched with the warm tile index of the worker and the coadd files of its
+    tile are resolved with the coadd file cache. A FITS cutout is cut from the coadd file of
+    the single band in "bands", and a color image from the coadd files of the bands, which are
+    ordered like the config "colorset". The cutout is stored in the cache for
+    CUTOUT_SYNC_CACHE_TTL seconds as a (filename, content) pair. Returns an error message,
+    which is empty if the cutout was created.
+    '''
+    dbh = get_sync_dbh()
+    tilenames, indices, tilenames_matched = find_tilenames_radec(np.array([ra]), np.array([dec]), dbh)
+    if not tilenames:
+        return f'No tile covers the position RA={ra}, DEC={dec}'
+    tilename = tilenames[0]
+    filenames = coadd_file_resolver.resolve([tilename], dbh, bands=bands)[tilename]
+    if filenames is False or not len(filenames.BAND):
+        return f'''Tile {tilename} has no coadd files in the bands {', '.join(bands)}'''
+    prefix = settings.DEFAULT_CONFIG['prefix']
+    archive_root = fitsfinder.get_archive_root(verb=False)
+    with tempfile.TemporaryDirectory() as outdir:
+        for filename in coadd_file_paths(filenames, archive_root):
+            run_fitscutter(filename, np.array([ra]), np.array([dec]), xsize=np.array([size]), ysize=np.array([size]),
+                           units='arcmin', prefix=prefix, outdir=outdir, tilename=tilename, verb=False)
+        if image_format == 'png':
+            color_radec(ra, dec, filenames.BAND, prefix=prefix, colorset=bands,
+                        outdir=outdir, verb=False, stiff_parameters={'NTHREADS': 1})
+        thumbname = thumbslib.get_base_names([tilename], np.array([ra]), np.array([dec]), prefix=prefix)[0]
+        names = sorted([name for name in os.listdir(outdir)
+                        if name.startswith(thumbname) and name.endswith(f'.{image_format}')])
+        if not names:
+            return f'The cutter did not create a {image_format.upper()} cutout'
+        with open(os.path.join(outdir, names[0]), 'rb') as cutout_file:
+            content = cutout_file.read()
+    cache.set(key, (names[0], content), timeout=settings.CUTOUT_SYNC_CACHE_TTL)
+    return ''
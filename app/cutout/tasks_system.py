@@ -1,7 +1,11 @@
 from django.conf import settings
 from django.contrib.auth.models import User
 from celery import shared_task
-from .models import Job, JobFile, JobMetric, FileMetric, Metric
+from .models import Job, JobFile, JobMetric, FileMetric, CacheMetric, Metric
+from .object_store import ObjectStore
+from .result_cache import ResultCache
+from .scratch import ScratchSpace
+from . import scheduler
 from .log import get_logger
 logger = get_logger(__name__)
 
@@ -38,6 +42,12 @@ class CollectMetrics():
         recent_jobs_success = recent_jobs.filter(status__exact=Job.JobStatus.SUCCESS)
         recent_jobs_failure = recent_jobs.filter(status__exact=Job.JobStatus.FAILURE)
         recent_job_files = FileMetric.objects.filter(file_type__exact=FileMetric.FileType.JOB)
+        recent_cache_lookups = CacheMetric.objects.all()
+        try:
+            scratch = ScratchSpace().stats()
+        except OSError as err:
+            logger.warning(f'Unable to collect scratch space metrics: {err}')
+            scratch = {}
         # Count number of unique users who ran jobs
         job_owners = []
         for job in recent_jobs:
@@ -54,12 +64,19 @@ class CollectMetrics():
             job_files_added_size=sum([job_file.size for job_file in recent_job_files]),
             job_files_total=len(all_job_files),
             job_files_size=sum([job_file.size for job_file in all_job_files]),
+            result_cache_hits=sum([cache_metric.hits for cache_metric in recent_cache_lookups]),
+            result_cache_misses=sum([cache_metric.misses for cache_metric in recent_cache_lookups]),
+            scratch_capacity=scratch.get('capacity', 0),
+            scratch_used=scratch.get('used', 0),
+            scratch_reserved=scratch.get('reserved', 0),
+            scratch_reservations=scratch.get('reservations', 0),
         )
         metric.save()
         logger.debug(f'Collected metrics object: {metric}')
         # Delete all cached metrics
         JobMetric.objects.all().delete()
         FileMetric.objects.all().delete()
+        CacheMetric.objects.all().delete()
 
 
 @shared_task
@@ -67,6 +84,72 @@ def collect_metrics():
     CollectMetrics().run_task()
 
 
+class PruneResultCache():
+
+    @property
+    def task_name(self):
+        return "Prune result cache"
+
+    @property
+    def task_handle(self):
+        return self.task_func
+
+    @property
+    def task_frequency_seconds(self):
+        return settings.CUTOUT_RESULT_CACHE_PRUNE_INTERVAL
+
+    @property
+    def task_initially_enabled(self):
+        return settings.CUTOUT_RESULT_CACHE_ENABLED
+
+    def __init__(self, task_func='') -> None:
+        self.task_func = task_func
+
+    def run_task(self):
+        logger.info(f'Running periodic task "{self.task_name}"...')
+        ResultCache(ObjectStore()).prune()
+
+
+@shared_task
+def prune_result_cache():
+    PruneResultCache().run_task()
+
+
+class DispatchJobs():
+
+    @property
+    def task_name(self):
+        return "Dispatch queued jobs"
+
+    @property
+    def task_handle(self):
+        return self.task_func
+
+    @property
+    def task_frequency_seconds(self):
+        return settings.CUTOUT_FAIR_SHARE_INTERVAL
+
+    @property
+    def task_initially_enabled(self):
+        return settings.CUTOUT_FAIR_SHARE_ENABLED
+
+    def __init__(self, task_func='') -> None:
+        self.task_func = task_func
+
+    def run_task(self):
+        logger.debug(f'Running periodic task "{self.task_name}"...')
+        started = scheduler.dispatch_jobs()
+        if started:
+            logger.info(f'Started {started} queued jobs.')
+
+
+@shared_task
+def dispatch_jobs():
+    DispatchJobs().run_task()
+
+
 periodic_tasks = [
     CollectMetrics(task_func='collect_metrics'),
+    PruneResultCache(task_func='prune_result_cache'),
+    DispatchJobs(task_func='dispatch_jobs'),
 ]
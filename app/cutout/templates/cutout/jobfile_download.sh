@@ -1,6 +1,8 @@
-{% for file in file_info %}
-mkdir -p $(dirname "./{{ job_id }}/{{ file.path }}")
-wget --output-document "./{{ job_id }}/{{ file.path }}" \
-    "{{ file.url }}"
-{% endfor %}
-echo "Job files downloaded."
+{% if file_paths %}while read -r path; do
+    mkdir -p "$(dirname "./{{ job_id }}/${path}")"
+    wget --output-document "./{{ job_id }}/${path}" "{{ download_url }}/${path}"
+done <<'JOB_FILES'
+{% for path in file_paths %}{{ path }}
+{% endfor %}JOB_FILES
+{% else %}wget --output-document - "{{ download_url }}.tar" | tar -x
+{% endif %}echo "Job files downloaded to ./{{ job_id }}."
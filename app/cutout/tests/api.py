@@ -117,6 +117,25 @@ class CutoutApi():
             url = response_data['next']
         return jobs
 
+    def job_files(self, uuid):
+        '''Return the paths and sizes of the files of a job, fetching every page of the listing.'''
+        files = []
+        url = f'''{self.conf['api_url_base']}/job/{uuid}/files/'''
+        while url:
+            while True:
+                response = requests.get(
+                    url,
+                    headers=self.json_headers,
+                )
+                if not self.rate_limiter(response):
+                    break
+            if response.status_code not in range(200, 300):
+                return response
+            response_data = response.json()
+            files += response_data['results']
+            url = response_data['next']
+        return files
+
     def job_create(self, name='', description="", config={}):
         if not name:
             name = f'''test-{random.randrange(10000, 99999)}'''
@@ -156,3 +175,42 @@ class CutoutApi():
                 if not self.rate_limiter(response):
                     break
             self.display_response(response, parse_json=False)
+
+    def table_upload(self, file_path, chunk_size=16 * 1024 * 1024, table_id=''):
+        '''Upload a coordinate table file in chunks, resuming the upload "table_id" if given.'''
+        headers = {'Authorization': self.json_headers['Authorization']}
+        total = os.path.getsize(file_path)
+        if not table_id:
+            while True:
+                response = requests.post(
+                    f'''{self.conf['api_url_base']}/table/''',
+                    json={'name': os.path.basename(file_path)},
+                    headers=self.json_headers,
+                )
+                if not self.rate_limiter(response):
+                    break
+            table_id = self.display_response(response)['uuid']
+        url = f'''{self.conf['api_url_base']}/table/{table_id}/'''
+        table = self.display_response(requests.get(url, headers=headers))
+        with open(file_path, 'rb') as table_file:
+            while table['status'] == 'UPLOADING':
+                # Resume from the number of bytes already received
+                offset = table['size']
+                table_file.seek(offset)
+                chunk = table_file.read(chunk_size)
+                response = requests.put(
+                    url,
+                    data=chunk,
+                    headers={
+                        **headers,
+                        'Content-Type': 'application/octet-stream',
+                        'Content-Range': f'''bytes {offset}-{offset + len(chunk) - 1}/{total}''',
+                    },
+                )
+                if self.rate_limiter(response):
+                    continue
+                if response.status_code in [200, 201, 409]:
+                    table = response.json()
+                else:
+                    return self.display_response(response)
+        return table
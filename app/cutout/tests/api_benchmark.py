@@ -0,0 +1,211 @@
+'''Query-count and latency benchmark of the hot API endpoints and web pages.
+
+The endpoints run against the configured database with an in-memory object store and without
+Celery, so the measurements reflect the database cost of the request handling. The test suite
+runs them with small data volumes, and "scripts/benchmark_api.py" with realistic volumes.
+'''
+import contextlib
+import hashlib
+import io
+import json
+import os
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from ..models import Job, JobFile
+from ..log import get_logger
+logger = get_logger(__name__)
+
+# Upper bounds on the SQL queries of each endpoint, which must not depend on the number of jobs or files
+ENDPOINT_QUERY_LIMITS = {
+    'job-list': 6,
+    'job-retrieve': 5,
+    'job-files': 6,
+    'job-create': 8,
+    'job-destroy': 7,
+    'download': 3,
+    'jobs-page': 6,
+    'job-detail-page': 7,
+}
+
+# Object store modules that create their own ObjectStore instance
+OBJECT_STORE_MODULES = ['cutout.tasks', 'cutout.tasks_api', 'cutout.views', 'cutout.workflows', 'cutout.reuse']
+
+
+class MemoryObjectStore:
+    '''In-memory stand-in for the ObjectStore methods used by the API server.'''
+
+    def __init__(self) -> None:
+        self.objects = {}
+        self.modified = {}
+        self.stream_chunk_size = 1024 * 1024
+        # Checked by callers to decide whether an object store is configured
+        self.client = True
+
+    def put_object(self, path="", data="", file_path="", json_output=True):
+        if file_path:
+            with open(file_path, 'rb') as fp:
+                data = fp.read()
+        elif json_output and not isinstance(data, bytes):
+            data = json.dumps(data, indent=2).encode('utf-8')
+        elif not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        self.objects[path.strip('/')] = data
+        self.modified[path.strip('/')] = datetime.now(timezone.utc)
+
+    def put_stream(self, path, stream, length=-1):
+        self.put_object(path=path, data=stream.read(length))
+
+    def store_folder(self, src_dir="", bucket_root_path="", max_workers=None):
+        manifest = []
+        for dirpath, dirnames, filenames in os.walk(src_dir):
+            for filename in filenames:
+                file_path = os.path.join(dirpath, filename)
+                path = os.path.join(bucket_root_path, os.path.relpath(file_path, src_dir))
+                self.put_object(path=path, file_path=file_path)
+                manifest.append({'path': path, 'size': os.path.getsize(file_path), 'etag': ''})
+        return manifest
+
+    def get_object(self, path=""):
+        return self.objects[path.strip('/')]
+
+    def stream_object(self, path="", offset=0, length=0):
+        data = self.objects[path.strip('/')]
+        stream = io.BytesIO(data[offset:offset + length] if length else data[offset:])
+        return iter(lambda: stream.read(self.stream_chunk_size), b'')
+
+    def stat_object(self, path=""):
+        data = self.objects[path.strip('/')]
+        return SimpleNamespace(size=len(data), etag=hashlib.md5(data).hexdigest(),
+                               last_modified=self.modified[path.strip('/')])
+
+    def presigned_get_url(self, path="", expires=300, filename="", external=False):
+        return f'http://object-store/bucket/{path.strip("/")}?X-Amz-Expires={expires}'
+
+    def list_objects(self, root_path, recursive=True):
+        return [SimpleNamespace(object_name=path, size=len(data), last_modified=self.modified[path])
+                for path, data in self.objects.items() if path.startswith(root_path.strip('/'))]
+
+    def list_directory(self, root_path, recursive=True):
+        return [obj.object_name for obj in self.list_objects(root_path, recursive=recursive)]
+
+    def delete_directory(self, root_path):
+        self.delete_objects(self.list_directory(root_path))
+
+    def delete_objects(self, paths):
+        for path in paths:
+            self.objects.pop(path.strip('/'), None)
+
+    def object_exists(self, path):
+        return path.strip('/') in self.objects
+
+    def copy_object(self, src_path, dst_path):
+        self.put_object(path=dst_path, data=self.objects[src_path.strip('/')])
+
+    def copy_objects(self, copies, max_workers=None):
+        for src_path, dst_path in copies:
+            self.copy_object(src_path, dst_path)
+        return len(copies)
+
+
+@contextlib.contextmanager
+def benchmark_environment(store):
+    '''Replace the object stores with "store" and the Celery calls of the endpoints with no-ops.'''
+    with contextlib.ExitStack() as stack:
+        for module in OBJECT_STORE_MODULES:
+            stack.enter_context(mock.patch(f'{module}.s3', store))
+        stack.enter_context(mock.patch('cutout.views.launch_workflow', return_value=None))
+        stack.enter_context(mock.patch('cutout.views.chain'))
+        yield store
+
+
+def seed_jobs(owner, jobs, files_per_job, batch_size=10000):
+    '''Create jobs of "owner" with "files_per_job" files each, in bulk. Returns the jobs.'''
+    config = {'xsize': 1.0, 'ysize': 1.0, 'bands': 'g,r', 'colorset': ['i', 'r', 'g'], 'prefix': 'DES',
+              'input_csv': 'RA,DEC\n46.275669,-34.256\n'}
+    new_jobs = Job.objects.bulk_create([
+        Job(owner=owner, name=f'benchmark-{idx}', status=Job.JobStatus.SUCCESS, config=config)
+        for idx in range(jobs)
+    ], batch_size=batch_size)
+    job_files = []
+    for job in new_jobs:
+        job_files += [JobFile(job=job, path=f'/cutouts/DESJ{idx:06d}_g.fits', size=idx) for idx in range(files_per_job)]
+        if len(job_files) >= batch_size:
+            JobFile.objects.bulk_create(job_files, batch_size=batch_size)
+            job_files = []
+    JobFile.objects.bulk_create(job_files, batch_size=batch_size)
+    return new_jobs
+
+
+def benchmark_requests(job, store):
+    '''Return the (endpoint name, method, URL, data) of the benchmarked requests for one of the seeded jobs.'''
+    job_file = JobFile.objects.filter(job=job).order_by('id').first()
+    obj_key = os.path.join(settings.S3_BASE_DIR, 'jobs', str(job.uuid), job_file.path.strip('/'))
+    if not store.object_exists(obj_key):
+        store.put_object(path=obj_key, data=b'\0' * 2880)
+    return [
+        ('job-list', 'get', '/api/job/', None),
+        ('job-retrieve', 'get', f'/api/job/{job.uuid}/', None),
+        ('job-files', 'get', f'/api/job/{job.uuid}/files/', None),
+        ('job-create', 'post', '/api/job/', {
+            'name': 'benchmark', 'config': {'input_csv': 'RA,DEC\n46.275669,-34.256\n', 'xsize': 1, 'ysize': 1},
+        }),
+        ('download', 'get', f'/download/{job.uuid}{job_file.path}', None),
+        ('jobs-page', 'get', '/jobs/', None),
+        ('job-detail-page', 'get', f'/jobs/{job.uuid}', None),
+        # The deletion tasks do not run, so the job can be deleted repeatedly
+        ('job-destroy', 'delete', f'/api/job/{job.uuid}/', None),
+    ]
+
+
+def percentile(timings, q):
+    return float(np.percentile(timings, q)) if timings else 0.0
+
+
+def measure_request(client, method, url, data=None, repeat=10):
+    '''Send a request "repeat" times and return the largest number of queries and the latencies in ms.'''
+    queries = 0
+    timings = []
+    for idx in range(repeat):
+        # The throttling counters use the cache and would eventually reject the requests
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            t0 = time.perf_counter()
+            response = getattr(client, method)(url, data=data, format='json')
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+            timings.append(1000 * (time.perf_counter() - t0))
+        if response.status_code >= 400:
+            raise AssertionError(f'{method.upper()} {url} returned {response.status_code}')
+        queries = max(queries, len(captured))
+    return {
+        'queries': queries,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+    }
+
+
+def run_benchmark(client, job, store, repeat=10):
+    '''Measure each endpoint with a seeded job of the client user. Returns the results by endpoint name.
+
+    The first request of each endpoint is not measured, so that the results do not include
+    the user permissions and other per-process caches.
+    '''
+    results = {}
+    for name, method, url, data in benchmark_requests(job, store):
+        measure_request(client, method, url, data, repeat=1)
+        results[name] = measure_request(client, method, url, data, repeat=repeat)
+        logger.debug(f'{name}: {results[name]}')
+    return results
+
+
+def query_limit_violations(results):
+    '''Return a message for each endpoint whose number of queries exceeds its limit.'''
+    return [f'{name}: {result["queries"]} queries, limit {ENDPOINT_QUERY_LIMITS[name]}'
+            for name, result in results.items() if result['queries'] > ENDPOINT_QUERY_LIMITS[name]]
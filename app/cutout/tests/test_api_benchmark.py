@@ -0,0 +1,30 @@
+from django.contrib.auth.models import User, Permission
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from .api_benchmark import MemoryObjectStore, benchmark_environment, seed_jobs, run_benchmark
+from .api_benchmark import query_limit_violations
+
+
+# The API throttling uses the cache, so use a local memory cache instead of Redis
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   CUTOUT_FAIR_SHARE_ENABLED=False, CUTOUT_JOB_REUSE_ENABLED=False,
+                   JOB_FILE_DOWNLOAD_MODE='stream')
+class EndpointQueryCountTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='benchmarker')
+        self.user.user_permissions.add(Permission.objects.get(codename='run_job'))
+        self.client = APIClient()
+        self.client.force_login(self.user)
+
+    def test_query_limits(self):
+        store = MemoryObjectStore()
+        with benchmark_environment(store):
+            jobs = seed_jobs(self.user, jobs=3, files_per_job=5)
+            results = run_benchmark(self.client, jobs[0], store, repeat=2)
+            self.assertEqual(query_limit_violations(results), [])
+            # The number of queries does not grow with the number of jobs and files
+            jobs = seed_jobs(self.user, jobs=60, files_per_job=50)
+            larger_results = run_benchmark(self.client, jobs[0], store, repeat=2)
+        self.assertEqual(query_limit_violations(larger_results), [])
+        self.assertEqual({name: result['queries'] for name, result in larger_results.items()},
+                         {name: result['queries'] for name, result in results.items()})
@@ -0,0 +1,116 @@
+import io
+import tarfile
+import time
+import zipfile
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from unittest import mock
+from ..archive import ARCHIVE_PREFETCH, filter_job_files, tar_stream, zip_stream
+from ..models import Job, JobFile
+
+OBJECTS = {f'jobs/x/DESJ{idx}_{band}.fits': f'{idx}{band}'.encode() * (300 * idx + 1)
+           for idx in range(5) for band in 'gr'}
+
+
+def open_stream(path):
+    data = OBJECTS[path]
+    return iter([data[idx:idx + 256] for idx in range(0, len(data), 256)])
+
+
+class ObjectStream:
+    '''Stream of an object that records whether it was closed.'''
+
+    def __init__(self, path):
+        self.chunks = open_stream(path)
+        self.closed = False
+
+    def __iter__(self):
+        return self.chunks
+
+    def close(self):
+        self.closed = True
+
+
+class ArchiveStreamTest(SimpleTestCase):
+    def setUp(self):
+        self.entries = [(path.replace('jobs/', ''), path, len(data)) for path, data in OBJECTS.items()]
+
+    def test_tar_stream(self):
+        with tarfile.open(fileobj=io.BytesIO(b''.join(tar_stream(self.entries, open_stream))), mode='r') as archive:
+            self.assertEqual(archive.getnames(), [name for name, path, size in self.entries])
+            for name, path, size in self.entries:
+                self.assertEqual(archive.extractfile(name).read(), OBJECTS[path])
+
+    def test_zip_stream(self):
+        with zipfile.ZipFile(io.BytesIO(b''.join(zip_stream(self.entries, open_stream)))) as archive:
+            self.assertIsNone(archive.testzip())
+            for name, path, size in self.entries:
+                self.assertEqual(archive.read(name), OBJECTS[path])
+
+    def test_closed_archive_releases_streams(self):
+        for stream in [tar_stream, zip_stream]:
+            with self.subTest(stream=stream.__name__):
+                opened = []
+
+                def open_object(path):
+                    opened.append(ObjectStream(path))
+                    return opened[-1]
+
+                chunks = stream(self.entries, open_object)
+                # The header and the content of the first object
+                next(chunks)
+                next(chunks)
+                # The client disconnects while the first objects are sent
+                chunks.close()
+                deadline = time.monotonic() + 5
+                while not all([object_stream.closed for object_stream in opened]) and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.assertLessEqual(len(opened), ARCHIVE_PREFETCH + 1)
+                self.assertTrue(all([object_stream.closed for object_stream in opened]))
+
+    def test_filter_job_files(self):
+        job_files = [('/DESJ1_g.fits', 1), ('/DESJ1_r.fits', 1), ('/DESJ1.png', 1), ('/cutout.log', 1)]
+        self.assertEqual(filter_job_files(job_files, bands='r'), [('/DESJ1_r.fits', 1)])
+        self.assertEqual(filter_job_files(job_files, file_types='png,log'), [('/DESJ1.png', 1), ('/cutout.log', 1)])
+
+
+# The download throttling uses the cache, so use a local memory cache instead of Redis
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}, S3_BASE_DIR='')
+class JobArchiveTest(TestCase):
+    def setUp(self):
+        self.job = Job.objects.create(owner=User.objects.create(username='archiver'))
+        JobFile.objects.bulk_create([JobFile(job=self.job, path=path.replace('jobs/x', ''), size=len(data))
+                                     for path, data in OBJECTS.items()])
+        self.opened = []
+
+    def open_object(self, path):
+        self.opened.append(path)
+        return open_stream(path.replace(str(self.job.uuid), 'x'))
+
+    @mock.patch('cutout.views.s3')
+    async def test_archive(self, s3):
+        job = self.job
+        s3.stream_object.side_effect = self.open_object
+        response = await self.async_client.get(f'/download/{job.uuid}.zip?band=g')
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        data = b''.join([chunk async for chunk in response.streaming_content])
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertEqual(len(archive.namelist()), 5)
+            self.assertEqual(archive.read(f'{job.uuid}/DESJ2_g.fits'), OBJECTS['jobs/x/DESJ2_g.fits'])
+        self.assertEqual((await self.async_client.get(f'/download/{job.uuid}.rar')).status_code, 404)
+
+    @mock.patch('cutout.views.s3')
+    async def test_archive_asgi(self, s3):
+        s3.stream_object.side_effect = self.open_object
+        response = await self.async_client.get(f'/download/{self.job.uuid}.tar')
+        # The archive is sent while it is generated, not collected before the response starts
+        self.assertTrue(response.is_async)
+        chunks = response.streaming_content
+        data = [await anext(chunks)]
+        self.assertLessEqual(len(self.opened), ARCHIVE_PREFETCH + 1)
+        data += [chunk async for chunk in chunks]
+        self.assertEqual(len(self.opened), len(OBJECTS))
+        with tarfile.open(fileobj=io.BytesIO(b''.join(data)), mode='r') as archive:
+            self.assertEqual(len(archive.getnames()), len(OBJECTS))
+            self.assertEqual(archive.extractfile(f'{self.job.uuid}/DESJ3_r.fits').read(),
+                             OBJECTS['jobs/x/DESJ3_r.fits'])
@@ -0,0 +1,105 @@
+import os
+import tempfile
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User, Permission
+from rest_framework.test import APIClient
+from celery.exceptions import TimeLimitExceeded, WorkerLostError
+from unittest import mock
+from ..models import Job, JobFile, TileCheckpoint
+from ..scratch import ScratchFull
+from ..tasks import skip_completed_tiles
+from ..uploader import JobFileUploader
+from ..workflows import wf_error_handler
+
+
+class TileCheckpointTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='checkpoint')
+        self.job = Job.objects.create(owner=self.user, status=Job.JobStatus.FAILURE)
+
+    def test_checkpoint_and_skip(self):
+        with tempfile.TemporaryDirectory() as outdir:
+            file_paths = []
+            for name in ['a.fits', 'b.fits', 'c.fits']:
+                file_paths.append(os.path.join(outdir, name))
+                with open(file_paths[-1], 'w') as output_file:
+                    output_file.write(name)
+            s3 = mock.MagicMock()
+            s3.put_object.side_effect = lambda path, file_path: None if 'c.fits' not in path else 1 / 0
+            uploader = JobFileUploader(s3, str(self.job.uuid), outdir)
+            uploader.submit(file_paths[:2], checkpoint=('DES0001+0000', ['coadd_g.fits']))
+            # A tile with a failed upload is not checkpointed
+            uploader.submit(file_paths[2:], checkpoint=('DES0002+0000', ['coadd_r.fits']))
+            with self.assertRaises(ZeroDivisionError):
+                uploader.close()
+        self.assertEqual(JobFile.objects.filter(job=self.job).count(), 2)
+        self.assertEqual(list(TileCheckpoint.objects.values_list('tilename', flat=True)), ['DES0001+0000'])
+
+        tiles, files_used = skip_completed_tiles(str(self.job.uuid), [
+            {'tilename': 'DES0001+0000'}, {'tilename': 'DES0002+0000'}])
+        self.assertEqual(tiles, [{'tilename': 'DES0002+0000'}])
+        self.assertEqual(files_used, ['coadd_g.fits'])
+
+    def test_checkpoint_prefix(self):
+        # The checkpoints of a pass over the tiles only skip the tiles in that pass
+        TileCheckpoint.objects.create(job=self.job, tilename='bands:DES0001+0000', files_used=['coadd_r.fits'])
+        tiles = [{'tilename': 'DES0001+0000'}, {'tilename': 'DES0002+0000'}]
+        self.assertEqual(skip_completed_tiles(str(self.job.uuid), tiles), (tiles, []))
+        self.assertEqual(skip_completed_tiles(str(self.job.uuid), tiles, checkpoint_prefix='bands:'),
+                         (tiles[1:], ['coadd_r.fits']))
+
+
+# The API throttling uses the cache, so use a local memory cache instead of Redis
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   CUTOUT_FAIR_SHARE_ENABLED=False)
+class ResumeJobTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='resumer')
+        self.user.user_permissions.add(Permission.objects.get(codename='run_job'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    @mock.patch('cutout.workflows.run_workflow')
+    def test_resume(self, run_workflow):
+        job = Job.objects.create(owner=self.user, status=Job.JobStatus.FAILURE, error_info='Worker lost',
+                                 config={'bands': 'all'})
+        response = self.client.post(f'/api/job/{job.uuid}/resume/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['resume_count'], 1)
+        self.assertEqual(response.data['error_info'], '')
+        run_workflow.assert_called_once_with(str(job.uuid), {'bands': 'all'})
+        # Only failed jobs can be resumed
+        job = Job.objects.create(owner=self.user, status=Job.JobStatus.SUCCESS)
+        response = self.client.post(f'/api/job/{job.uuid}/resume/')
+        self.assertEqual(response.status_code, 409)
+
+
+@override_settings(CUTOUT_JOB_AUTO_RESUMES=1)
+@mock.patch('cutout.workflows.ScratchSpace')
+@mock.patch('cutout.workflows.auto_resume_job')
+class AutoResumeTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='autoresumer')
+        self.job = Job.objects.create(owner=self.user, status=Job.JobStatus.FAILURE)
+
+    def test_transient_errors(self, auto_resume_job, scratch_space):
+        for exc in [WorkerLostError('Worker exited'), TimeLimitExceeded(3600), ConnectionError('Connection reset')]:
+            with self.subTest(exc=exc):
+                auto_resume_job.reset_mock()
+                wf_error_handler(mock.Mock(id='task'), exc, '', job_id=str(self.job.uuid))
+                auto_resume_job.apply_async.assert_called_once()
+        # Jobs that ran out of automatic resumes are left failed
+        Job.objects.filter(uuid=self.job.uuid).update(resume_count=1)
+        auto_resume_job.reset_mock()
+        wf_error_handler(mock.Mock(id='task'), WorkerLostError('Worker exited'), '', job_id=str(self.job.uuid))
+        auto_resume_job.apply_async.assert_not_called()
+
+    def test_job_errors(self, auto_resume_job, scratch_space):
+        # Running the job again would fail in the same way
+        for exc in [ValueError('The parent job table does not match the job table'), KeyError('bands'),
+                    ScratchFull('Insufficient scratch space to start the job')]:
+            with self.subTest(exc=exc):
+                wf_error_handler(mock.Mock(id='task'), exc, '', job_id=str(self.job.uuid))
+        auto_resume_job.apply_async.assert_not_called()
+        # The scratch space of the job is still released
+        self.assertEqual(scratch_space.return_value.cleanup.call_count, 3)
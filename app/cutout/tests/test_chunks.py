@@ -0,0 +1,18 @@
+from django.test import SimpleTestCase
+from ..tasks import split_table_chunks
+
+
+class TableChunkTest(SimpleTestCase):
+    def test_split_table_chunks(self):
+        tilenames = ['B', 'A', False, 'C', 'A', 'B', 'C', 'C', 'D']
+        chunks = split_table_chunks(tilenames, 3)
+        # Every row is in exactly one chunk
+        self.assertEqual(sorted([row for rows in chunks for row in rows]), list(range(len(tilenames))))
+        # Chunks do not share tiles
+        chunk_tiles = [{tilenames[row] for row in rows} for rows in chunks]
+        for i, tiles in enumerate(chunk_tiles):
+            for other_tiles in chunk_tiles[i + 1:]:
+                self.assertFalse(tiles & other_tiles)
+        # A tile with more rows than the chunk size forms a chunk of its own
+        self.assertEqual([len(rows) for rows in split_table_chunks(['A'] * 5 + ['B'], 2)], [5, 1])
+        self.assertEqual(split_table_chunks([], 2), [])
@@ -0,0 +1,32 @@
+import duckdb
+from django.test import SimpleTestCase
+from ..coadd_files import CoaddFileResolver
+
+
+class CoaddFileResolverTest(SimpleTestCase):
+    def setUp(self):
+        self.dbh = duckdb.connect(':memory:')
+        self.dbh.execute('''
+            CREATE TABLE COADD_FILES (TILENAME VARCHAR, PATH VARCHAR, FILENAME VARCHAR,
+                                      COMPRESSION VARCHAR, BAND VARCHAR)
+        ''')
+        for tilename in ['DES0001+0000', 'DES0002+0000', 'DES0003+0000']:
+            for band in ['g', 'r', 'i']:
+                self.dbh.execute('INSERT INTO COADD_FILES VALUES (?, ?, ?, ?, ?)',
+                                 [tilename, f'coadd/{tilename}', f'{tilename}_{band}.fits', '.fz', band])
+
+    def tearDown(self):
+        self.dbh.close()
+
+    def test_resolve(self):
+        resolver = CoaddFileResolver(table='', max_entries=2)
+        filenames = resolver.resolve(['DES0001+0000', 'DES9999+0000'], self.dbh, bands='g,r')
+        self.assertEqual(resolver.table, 'COADD_FILES')
+        self.assertEqual(list(filenames['DES0001+0000'].BAND), ['g', 'r'])
+        self.assertEqual(filenames['DES0001+0000'].PATH[0], 'coadd/DES0001+0000')
+        self.assertIs(filenames['DES9999+0000'], False)
+        # All bands are cached separately and the least recently used entries are evicted
+        filenames = resolver.resolve(['DES0002+0000'], self.dbh, bands='all')
+        # The records are ordered by band, not by their order in the table
+        self.assertEqual(list(filenames['DES0002+0000'].BAND), ['g', 'i', 'r'])
+        self.assertEqual(list(resolver.entries), [('DES9999+0000', 'g,r'), ('DES0002+0000', 'all')])
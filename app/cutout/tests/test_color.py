@@ -0,0 +1,84 @@
+import os
+import tempfile
+import threading
+from unittest import mock
+import numpy as np
+from dotmap import DotMap
+from django.test import SimpleTestCase, override_settings
+from ..tasks import cut_tiles
+
+
+def coadd_records(tilename, bands):
+    return np.rec.fromrecords([(band, f'{tilename}/{tilename}_{band}.fits') for band in bands], names='BAND,PATH')
+
+
+def thumbname(ra):
+    return f'DESJ{ra:05.2f}'
+
+
+def fitscutter(filename, ra, dec, outdir='', **kwargs):
+    '''Stand-in for run_fitscutter that writes the cutout of every position in the band of the coadd file.'''
+    band = os.path.splitext(filename)[0].split('_')[-1]
+    for value in ra:
+        with open(os.path.join(outdir, f'{thumbname(value)}_{band}.fits'), 'w') as output_file:
+            output_file.write(filename)
+    return 0.0
+
+
+@override_settings(CUTOUT_COLOR_WORKERS=3)
+class ColorImageTest(SimpleTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.tiles = [{
+            'tilename': tilename,
+            'ra': np.array(ra),
+            'dec': np.zeros(len(ra)),
+            'xsize': np.ones(len(ra)),
+            'ysize': np.ones(len(ra)),
+            'thumbname': np.array([thumbname(value) for value in ra]),
+        } for tilename, ra in [('DES0001+0000', [1.0, 2.0, 3.0]), ('DES0002+0000', [10.0])]]
+
+    def cut(self):
+        config = DotMap({
+            'MP': False, 'verbose': False, 'verb': False, 'prefix': 'DES', 'bands': 'g,r,i',
+            'colorset': ['i', 'r', 'g'], 'outdir': self.tmpdir.name,
+            'logfile': os.path.join(self.tmpdir.name, 'cutout.log'),
+            'reportfile': os.path.join(self.tmpdir.name, 'cutter_report.csv'),
+        })
+        # The color images of the first tile only get past the barrier if they are made concurrently
+        barrier = threading.Barrier(3, timeout=10)
+
+        def color_radec(ra, dec, avail_bands, outdir='', **kwargs):
+            if ra < 10:
+                barrier.wait()
+            if ra == 2:
+                raise ValueError('STIFF failed')
+            with open(os.path.join(outdir, f'{thumbname(ra)}.png'), 'w') as output_file:
+                output_file.write(','.join(avail_bands))
+            return 0.0
+
+        uploader = mock.Mock()
+        coadd_files = {tile['tilename']: coadd_records(tile['tilename'], ['g', 'r', 'i']) for tile in self.tiles}
+        with mock.patch('cutout.tasks.coadd_file_resolver.resolve', return_value=coadd_files), \
+                mock.patch('cutout.tasks.run_fitscutter', fitscutter), \
+                mock.patch('cutout.tasks.run_color_radec', side_effect=color_radec):
+            files_used, report = cut_tiles(self.tiles, config, None, '/archive', uploader=uploader)
+        return report, uploader
+
+    def test_concurrent_color_images(self):
+        for pipeline in [False, True]:
+            with self.subTest(pipeline=pipeline), self.settings(CUTOUT_COLOR_PIPELINE=pipeline):
+                report, uploader = self.cut()
+                color = report[report.STAGE == 'color'].set_index('ITEM')
+                self.assertEqual(list(color.STATUS), ['SUCCESS', 'FAILURE', 'SUCCESS', 'SUCCESS'])
+                self.assertEqual(color.loc['2.0,0.0'].ERROR, 'STIFF failed')
+                self.assertEqual(set(report[report.STAGE == 'fits'].STATUS), {'SUCCESS'})
+                # The tile with the failed color image is uploaded, but not checkpointed
+                (first_files,), first_kwargs = uploader.submit.call_args_list[0]
+                self.assertEqual(sorted([os.path.basename(path) for path in first_files]), [
+                    'DESJ01.00.png', 'DESJ01.00_g.fits', 'DESJ01.00_i.fits', 'DESJ01.00_r.fits',
+                    'DESJ02.00_g.fits', 'DESJ02.00_i.fits', 'DESJ02.00_r.fits',
+                    'DESJ03.00.png', 'DESJ03.00_g.fits', 'DESJ03.00_i.fits', 'DESJ03.00_r.fits'])
+                self.assertIsNone(first_kwargs['checkpoint'])
+                self.assertEqual(uploader.submit.call_args_list[1].kwargs['checkpoint'][0], 'DES0002+0000')
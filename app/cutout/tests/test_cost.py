@@ -0,0 +1,47 @@
+import numpy as np
+import pandas
+from django.test import SimpleTestCase, override_settings
+from unittest import mock
+from ..cost import estimate_job_cost, job_estimate
+
+
+@override_settings(CUTOUT_COST_SECONDS_OVERHEAD=5, CUTOUT_COST_SECONDS_PER_BAND_FILE=1,
+                   CUTOUT_COST_SECONDS_PER_MPIXEL=0, CUTOUT_COST_SECONDS_PER_POSITION=1,
+                   CUTOUT_QUEUE_FAST_MAX_RUNTIME=60, CUTOUT_QUEUE_BULK_MIN_RUNTIME=3600,
+                   CUTOUT_TILE_INDEX_ENABLED=True)
+@mock.patch('cutout.cost.duckdb.connect')
+class JobCostTest(SimpleTestCase):
+    def estimate(self, df, config, tilenames_matched):
+        tilenames = sorted(set([tilename for tilename in tilenames_matched if tilename]))
+        indices = {tilename: [idx for idx, matched in enumerate(tilenames_matched) if matched == tilename]
+                   for tilename in tilenames}
+        with mock.patch('cutout.cost.tile_index.find_tilenames_radec',
+                        return_value=(tilenames, indices, tilenames_matched)):
+            return estimate_job_cost(config, df=df)
+
+    def test_estimate(self, connect):
+        df = pandas.DataFrame({'RA': [1, 2, 3], 'DEC': [0, 0, 0], 'XSIZE': [1, 1, 2], 'YSIZE': [1, 1, 2]})
+        estimate = self.estimate(df, {'bands': 'g,r'}, ['A', 'A', False])
+        self.assertEqual(estimate['positions'], 3)
+        self.assertEqual(estimate['tiles'], 1)
+        self.assertEqual(estimate['band_files'], 2)
+        self.assertAlmostEqual(estimate['output_pixels'], 2 * 2 * (60 / 0.263) ** 2, delta=1)
+        self.assertEqual(estimate['runtime'], 5 + 2 + 2)
+        self.assertEqual(estimate['queue'], 'jobs-fast')
+
+    def test_queue_routing(self, connect):
+        positions = 5000
+        df = pandas.DataFrame({'RA': np.zeros(positions), 'DEC': np.zeros(positions)})
+        tilenames_matched = [f'T{idx % 100}' for idx in range(positions)]
+        self.assertEqual(self.estimate(df, {'bands': 'all', 'xsize': 1, 'ysize': 1}, tilenames_matched)['queue'],
+                         'jobs-bulk')
+        self.assertEqual(self.estimate(df[:100], {'bands': 'all'}, tilenames_matched[:100])['queue'], 'jobs')
+
+    def test_without_tile_index(self, connect):
+        df = pandas.DataFrame({'RA': [1], 'DEC': [0]})
+        # The positions are never matched by database queries in the request
+        with mock.patch('cutout.cost.tile_index.find_tilenames_radec', side_effect=LookupError('no table')):
+            self.assertEqual(job_estimate({'bands': 'all'}, df=df), {'queue': 'jobs'})
+        with self.settings(CUTOUT_TILE_INDEX_ENABLED=False), mock.patch('cutout.tasks.fitsfinder') as fitsfinder:
+            self.assertEqual(job_estimate({'bands': 'all'}, df=df), {'queue': 'jobs'})
+        fitsfinder.find_tilenames_radec.assert_not_called()
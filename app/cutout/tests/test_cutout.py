@@ -9,7 +9,7 @@ class GenerateCutout(TestCase):
         import logging
         logging.basicConfig(level=logging.DEBUG)
         job_id = str(uuid4())
-        config, err_msg = process_config({
+        config, err_msg, df = process_config({
             'input_csv': '''
                 RA,DEC,XSIZE,YSIZE
                 49.9208333333, -19.4166666667, 6.6, 6.6
@@ -0,0 +1,93 @@
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+import numpy as np
+from dotmap import DotMap
+from django.test import SimpleTestCase, override_settings
+from .. import tasks
+from ..tasks import cut_tiles, get_cutter_pool, reset_cutter_pool, run_fitscutter
+
+
+def coadd_records(tilename, bands):
+    return np.rec.fromrecords([(band, f'{tilename}/{tilename}_{band}.fits') for band in bands], names='BAND,PATH')
+
+
+def cut_or_crash(filename, ra, dec, log_config=None, outdir='', **kwargs):
+    '''Stand-in for run_fitscutter that kills the pool process for the files of "BAD" tiles.'''
+    if 'BAD' in filename:
+        os._exit(1)
+    with open(os.path.join(outdir, os.path.basename(filename)), 'w') as output_file:
+        output_file.write(filename)
+    return 0.0
+
+
+def log_cut(filename, ra, dec, **kwargs):
+    logging.getLogger('cutter').warning(f'Cutting {filename} in process {os.getpid()}')
+
+
+@override_settings(CUTOUT_CUTTER_POOL_SIZE=1)
+class CutterPoolTest(SimpleTestCase):
+    def setUp(self):
+        reset_cutter_pool()
+        self.addCleanup(reset_cutter_pool)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def config(self):
+        return DotMap({
+            'MP': True, 'verbose': False, 'verb': False, 'prefix': 'DES', 'bands': 'g,r',
+            'outdir': self.tmpdir.name,
+            'logfile': os.path.join(self.tmpdir.name, 'cutout.log'),
+            'reportfile': os.path.join(self.tmpdir.name, 'cutter_report.csv'),
+        })
+
+    def test_pool_lifetime(self):
+        pool = get_cutter_pool()
+        # The pool is reused by later tasks until it is reset
+        self.assertIs(get_cutter_pool(), pool)
+        self.assertEqual(pool.submit(sum, [1, 2]).result(), 3)
+        reset_cutter_pool()
+        self.assertIsNone(tasks.cutter_pool)
+        self.assertIsNot(get_cutter_pool(), pool)
+
+    @mock.patch('cutout.tasks.run_fitscutter', cut_or_crash)
+    def test_recovery_after_broken_pool(self):
+        tiles = [{'tilename': tilename, 'ra': np.array([1.0]), 'dec': np.array([0.0]), 'xsize': np.ones(1),
+                  'ysize': np.ones(1), 'thumbname': np.array(['DESJ1'])} for tilename in ['BAD0001', 'DES0002']]
+        with mock.patch('cutout.tasks.coadd_file_resolver.resolve', return_value={
+                tile['tilename']: coadd_records(tile['tilename'], ['g', 'r']) for tile in tiles}):
+            files_used, report = cut_tiles(tiles, self.config(), None, '/archive', color=False)
+            # The work items fail and are recorded, without aborting the task
+            self.assertEqual(set(report.STATUS), {'FAILURE'})
+            self.assertTrue(report.ERROR.str.len().all())
+            self.assertIsNone(tasks.cutter_pool)
+            # The next task cuts with a new pool
+            files_used, report = cut_tiles(tiles[1:], self.config(), None, '/archive', color=False)
+        self.assertEqual(list(report.STATUS), ['SUCCESS', 'SUCCESS'])
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)),
+                         ['DES0002_g.fits', 'DES0002_r.fits', 'cutter_report.csv'])
+        with self.assertRaises(BrokenProcessPool):
+            get_cutter_pool().submit(cut_or_crash, 'BAD', 0, 0).result()
+
+    @mock.patch('cutout.tasks.thumbslib.fitscutter', log_cut)
+    def test_logfile_reinitialisation(self):
+        # Pool processes outlive jobs, so each work item logs to the log file of its own job
+        logfiles = [os.path.join(self.tmpdir.name, f'cutout-{idx}.log') for idx in range(2)]
+        pool = get_cutter_pool()
+        for logfile in logfiles + logfiles[:1]:
+            pool.submit(run_fitscutter, logfile, 0, 0, log_config={'logfile': logfile, 'verbose': False}).result()
+        contents = []
+        for logfile in logfiles:
+            with open(logfile) as log:
+                contents.append(log.read())
+        self.assertEqual(contents[0].count(f'Cutting {logfiles[0]}'), 2)
+        self.assertNotIn(logfiles[1], contents[0])
+        self.assertEqual(contents[1].count(f'Cutting {logfiles[1]}'), 1)
+        self.assertNotIn(logfiles[0], contents[1])
+        # The work items ran in the same pool process, not in the task process
+        pids = set(re.findall(r'in process (\d+)', contents[0] + contents[1]))
+        self.assertEqual(len(pids), 1)
+        self.assertNotIn(str(os.getpid()), pids)
@@ -0,0 +1,110 @@
+import contextlib
+import io
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from unittest import mock
+from ..derive import derive_job_config, parent_output_copies
+from ..models import Job, JobFile, TileCheckpoint
+from ..scratch import ScratchSpace
+from ..tasks import DERIVED_BANDS_CHECKPOINT, generate_derived_cutouts
+from .api_benchmark import MemoryObjectStore
+
+
+class DeriveJobTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='deriver')
+        self.parent = Job.objects.create(owner=self.user, status=Job.JobStatus.SUCCESS, config={
+            'input_csv': 'RA,DEC\n46.275669,-34.256\n', 'xsize': 1, 'ysize': 1, 'bands': 'g,r',
+            'prefix': 'DES', 'colorset': ['i', 'r', 'g']})
+        JobFile.objects.create(job=self.parent, path='/DESJ030506.16-341521.60_g.fits', size=1)
+
+    def test_derive_job_config(self):
+        s3 = mock.MagicMock()
+        delta = {'bands': 'g r i', 'input_csv': 'RA,DEC\n10.0,-20.5\n'}
+        config, err_msg, df = derive_job_config(s3, self.parent, delta, 'derived')
+        self.assertEqual(err_msg, '')
+        self.assertEqual(config['bands'], 'g r i')
+        self.assertEqual(config['derived_from'], {'job': str(self.parent.uuid), 'positions': 1, 'bands': 'g,r'})
+        stored = pd.read_parquet(io.BytesIO(s3.put_object.call_args.kwargs['data']))
+        self.assertEqual(stored.RA.tolist(), [46.275669, 10.0])
+        # The table is returned for the cost estimate of the job
+        self.assertEqual(df.RA.tolist(), [46.275669, 10.0])
+        # Only the bands and the positions can change, and the sizes must follow the parent table
+        for delta in [{'xsize': 2}, {'bands': 'r,g'}, {'bands': 'g,q'}, {'input_csv': 'RA,DEC,XSIZE,YSIZE\n1,1,2,2\n'}]:
+            self.assertNotEqual(derive_job_config(s3, self.parent, delta, 'derived')[1], '')
+
+    def test_parent_output_copies(self):
+        paths = ['/DESJ1_g.fits', '/DESJ1_r.fits', '/DESJ1.png', '/DESJ2_g.fits', '/matched.csv']
+        copies = parent_output_copies(paths, ['DESJ1'], {'g', 'i'}, True, 'jobs/parent', 'jobs/child')
+        self.assertEqual(copies, [('jobs/parent/DESJ1_g.fits', 'jobs/child/DESJ1_g.fits'),
+                                  ('jobs/parent/DESJ1.png', 'jobs/child/DESJ1.png')])
+        self.assertEqual(len(parent_output_copies(paths, ['DESJ1'], {'g', 'i'}, False, 'jobs/parent', 'jobs/child')), 1)
+
+
+def cut_tiles(tiles, config, dbh, archive_root, uploader=None, color=True, checkpoint_prefix=''):
+    '''Stand-in for the FITS cutter that only reports the coadd files of the tiles.'''
+    bands = config.bands.split(',') if isinstance(config.bands, str) else config.bands
+    files_used = [f'''{tile['tilename']}_{band}.fits.fz''' for tile in tiles for band in bands]
+    return files_used, pd.DataFrame([], columns=['STAGE', 'TILENAME', 'ITEM', 'STATUS', 'ELAPSED', 'ERROR'])
+
+
+@override_settings(CUTOUT_STREAMING_UPLOAD=False, CUTOUT_RESULT_CACHE_ENABLED=False)
+class DerivedCutoutsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='deriver')
+        self.parent = Job.objects.create(owner=self.user, status=Job.JobStatus.SUCCESS)
+        self.job = Job.objects.create(owner=self.user, status=Job.JobStatus.STARTED)
+        self.job_id = str(self.job.uuid)
+        self.store = MemoryObjectStore()
+        # The two parent positions are in tiles 1 and 2
+        self.store.put_object(
+            path=os.path.join(settings.S3_BASE_DIR, f'jobs/{self.parent.uuid}/matched.csv'),
+            data='RA,DEC,TILENAME\n1.5,0.0,DES0001+0000\n2.5,0.0,DES0002+0000\n', json_output=False)
+        scratch_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch_dir.cleanup)
+        self.scratch_dir = scratch_dir.name
+        self.cut_tiles = mock.Mock(side_effect=cut_tiles)
+        fitsfinder = mock.Mock()
+        fitsfinder.check_xysize.side_effect = lambda df, config, nobj: (np.ones(nobj), np.ones(nobj))
+        thumbslib = mock.Mock()
+        thumbslib.get_base_names.side_effect = lambda tilenames, ra, dec, prefix: [
+            f'{prefix}J{idx:05d}' for idx in range(len(ra))]
+        stack = contextlib.ExitStack()
+        self.addCleanup(stack.close)
+        for patcher in [
+            self.settings(JOB_SCRATCH_DIR=self.scratch_dir),
+            mock.patch('cutout.tasks.s3', self.store),
+            mock.patch('cutout.tasks.duckdb.connect'),
+            mock.patch('cutout.tasks.fitsfinder', fitsfinder),
+            mock.patch('cutout.tasks.thumbslib', thumbslib),
+            mock.patch('cutout.tasks.find_tilenames_radec', return_value=([], {}, ['DES0001+0000'])),
+            mock.patch('cutout.tasks.cut_tiles', self.cut_tiles),
+        ]:
+            stack.enter_context(patcher)
+
+    def test_resume_skips_checkpointed_tiles(self):
+        # The added band of both parent tiles and the added position in tile 1 are cut, and the
+        # interrupted run completed the added band of tile 1
+        TileCheckpoint.objects.create(job=self.job, tilename=f'{DERIVED_BANDS_CHECKPOINT}DES0001+0000',
+                                      files_used=['DES0001+0000_r.fits.fz'])
+        config = dict(settings.DEFAULT_CONFIG, bands='g,r', colorset=['i'],
+                      input_csv='RA,DEC\n1.5,0.0\n2.5,0.0\n1.6,0.0\n',
+                      derived_from={'job': str(self.parent.uuid), 'positions': 2, 'bands': 'g'})
+        generate_derived_cutouts.apply(kwargs={'job_id': self.job_id, 'config': config}).get()
+        band_pass, tile_pass = self.cut_tiles.call_args_list
+        self.assertEqual([tile['tilename'] for tile in band_pass.args[0]], ['DES0002+0000'])
+        self.assertEqual(band_pass.kwargs['checkpoint_prefix'], DERIVED_BANDS_CHECKPOINT)
+        # The checkpoint of the band pass does not apply to the pass that cuts the added position
+        self.assertEqual([tile['tilename'] for tile in tile_pass.args[0]], ['DES0001+0000'])
+        self.assertEqual(tile_pass.args[0][0]['thumbname'].tolist(), ['DESJ00002'])
+        files_used = self.store.get_object(os.path.join(settings.S3_BASE_DIR, f'jobs/{self.job_id}/files_used.csv'))
+        self.assertEqual(files_used.decode().split('\n'), [
+            'DES0001+0000_r.fits.fz', 'DES0002+0000_r.fits.fz', 'DES0001+0000_g.fits.fz', 'DES0001+0000_r.fits.fz'])
+        # The task removes its scratch directory and frees its scratch space
+        self.assertFalse(os.path.exists(os.path.join(self.scratch_dir, self.job_id)))
+        self.assertEqual(ScratchSpace(root=self.scratch_dir).reservations(), {})
@@ -0,0 +1,115 @@
+import contextlib
+import io
+import os
+import tempfile
+from unittest import mock
+import numpy as np
+import pandas
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from ..models import Job, JobFile
+from ..scratch import ScratchSpace
+from ..tasks import plan_cutouts, finalize_cutouts, CHUNK_ROW_COLUMN
+from .api_benchmark import MemoryObjectStore
+
+
+def cut_tiles(tiles, config, dbh, archive_root, uploader=None, color=True):
+    '''Stand-in for the FITS cutter that writes one file per position and band.'''
+    files_used = []
+    report = []
+    for tile in tiles:
+        for band in config.bands.split(','):
+            files_used.append(f'''{tile['tilename']}_{band}.fits.fz''')
+            for thumbname in tile['thumbname']:
+                with open(os.path.join(config.outdir, f'{thumbname}_{band}.fits'), 'w') as output_file:
+                    output_file.write(thumbname)
+                report.append(['fits', tile['tilename'], thumbname, 'SUCCESS', 0.0, ''])
+    return files_used, pandas.DataFrame(report, columns=['STAGE', 'TILENAME', 'ITEM', 'STATUS', 'ELAPSED', 'ERROR'])
+
+
+def find_tilenames_radec(ra, dec, dbh):
+    '''Match each position to the tile named by its integer RA, or to no tile if RA is negative.'''
+    tilenames_matched = [f'DES{int(value):04d}+0000' if value >= 0 else False for value in ra]
+    tilenames = list(dict.fromkeys([tilename for tilename in tilenames_matched if tilename]))
+    indices = {tilename: [idx for idx, matched in enumerate(tilenames_matched) if matched == tilename]
+               for tilename in tilenames}
+    return tilenames, indices, tilenames_matched
+
+
+@override_settings(CUTOUT_TILES_PER_TASK=2, CUTOUT_STREAMING_UPLOAD=False, CUTOUT_RESULT_CACHE_ENABLED=False)
+class FanoutWorkflowTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='fanout')
+        self.job = Job.objects.create(owner=self.user, status=Job.JobStatus.STARTED)
+        self.job_id = str(self.job.uuid)
+        self.store = MemoryObjectStore()
+        self.s3_basepath = os.path.join(settings.S3_BASE_DIR, f'jobs/{self.job_id}').strip('/')
+        scratch_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch_dir.cleanup)
+        self.scratch_dir = scratch_dir.name
+        self.cut_tiles = mock.Mock(side_effect=cut_tiles)
+        fitsfinder = mock.Mock()
+        fitsfinder.check_xysize.side_effect = lambda df, config, nobj: (np.ones(nobj), np.ones(nobj))
+        thumbslib = mock.Mock()
+        thumbslib.get_base_names.side_effect = lambda tilenames, ra, dec, prefix: [
+            f'{prefix}J{idx:05d}' for idx in range(len(ra))]
+        stack = contextlib.ExitStack()
+        self.addCleanup(stack.close)
+        for patcher in [
+            self.settings(JOB_SCRATCH_DIR=self.scratch_dir),
+            mock.patch('cutout.tasks.s3', self.store),
+            mock.patch('cutout.tasks.duckdb.connect'),
+            mock.patch('cutout.tasks.fitsfinder', fitsfinder),
+            mock.patch('cutout.tasks.thumbslib', thumbslib),
+            mock.patch('cutout.tasks.find_tilenames_radec', side_effect=find_tilenames_radec),
+            mock.patch('cutout.tasks.cut_tiles', self.cut_tiles),
+        ]:
+            stack.enter_context(patcher)
+
+    def config(self, ra):
+        coords = '\n'.join([f'{value},-34.25' for value in ra])
+        return dict(settings.DEFAULT_CONFIG, bands='g,r', input_csv=f'RA,DEC\n{coords}\n')
+
+    def test_fanout(self):
+        # Five positions in three tiles and one position without a tile
+        plan_cutouts.apply(kwargs={'job_id': self.job_id, 'config': self.config([1, 2, 1, 3, -1])}).get()
+        # The tiles are cut in batches of CUTOUT_TILES_PER_TASK tiles
+        batches = [[tile['tilename'] for tile in call.args[0]] for call in self.cut_tiles.call_args_list]
+        self.assertEqual(batches, [['DES0001+0000', 'DES0002+0000'], ['DES0003+0000']])
+        self.assertEqual(self.cut_tiles.call_args_list[0].args[0][0]['thumbname'].tolist(), ['DESJ00000', 'DESJ00002'])
+        # The finalize callback merges the coadd files used by all batches
+        self.assertEqual(self.store.get_object(f'{self.s3_basepath}/files_used.csv').decode().split('\n'), [
+            'DES0001+0000_g.fits.fz', 'DES0001+0000_r.fits.fz', 'DES0002+0000_g.fits.fz', 'DES0002+0000_r.fits.fz',
+            'DES0003+0000_g.fits.fz', 'DES0003+0000_r.fits.fz'])
+        paths = set(JobFile.objects.filter(job=self.job).values_list('path', flat=True))
+        for idx in range(4):
+            self.assertIn(f'/DESJ{idx:05d}_g.fits', paths)
+        self.assertIn('/matched.csv', paths)
+        self.assertIn('/logs/cutout-00001.log', paths)
+        # The batch tasks and the callback are recorded with the job, and the scratch space is freed
+        self.assertEqual(len(Job.objects.get(uuid=self.job_id).task_ids), 3)
+        self.assertEqual(ScratchSpace(root=self.scratch_dir).reservations(), {})
+        self.assertFalse(os.path.exists(os.path.join(self.scratch_dir, self.job_id, 'batch-00000')))
+
+    def test_no_matched_tiles(self):
+        plan_cutouts.apply(kwargs={'job_id': self.job_id, 'config': self.config([-1, -2])}).get()
+        self.cut_tiles.assert_not_called()
+        self.assertEqual(self.store.get_object(f'{self.s3_basepath}/files_used.csv'), b'')
+        self.assertEqual(Job.objects.get(uuid=self.job_id).task_ids, [])
+        self.assertIn('/matched.csv', JobFile.objects.filter(job=self.job).values_list('path', flat=True))
+
+    def test_finalize_merges_chunk_tables(self):
+        for chunk_id, rows in enumerate([[1, 3], [0, 2]]):
+            df = pandas.DataFrame({'RA': [float(row) for row in rows], CHUNK_ROW_COLUMN: rows})
+            self.store.put_object(path=f'{self.s3_basepath}/logs/matched-{chunk_id:05d}.csv',
+                                  data=df.to_csv(index=False), json_output=False)
+        self.store.put_object(path=f'{self.s3_basepath}/chunks/chunk-00000.parquet', data=b'PAR1')
+        finalize_cutouts([['a.fits'], ['b.fits', 'c.fits']], job_id=self.job_id, merge_matched=True)
+        self.assertEqual(self.store.get_object(f'{self.s3_basepath}/files_used.csv'), b'a.fits\nb.fits\nc.fits')
+        matched = pandas.read_csv(io.BytesIO(self.store.get_object(f'{self.s3_basepath}/matched.csv')))
+        self.assertEqual(matched.RA.tolist(), [0.0, 1.0, 2.0, 3.0])
+        self.assertNotIn(CHUNK_ROW_COLUMN, matched)
+        # The chunk tables and matched tables of the chunks are removed
+        self.assertEqual(sorted(JobFile.objects.filter(job=self.job).values_list('path', flat=True)),
+                         ['/files_used.csv', '/matched.csv'])
@@ -0,0 +1,62 @@
+import io
+import numpy as np
+import pandas
+from django.test import SimpleTestCase
+from unittest import mock
+from ..forms import CutoutForm
+from ..input_table import read_input_table, validate_input_table, input_table_path, read_table_preview
+from .api_benchmark import MemoryObjectStore
+from ..tasks import process_config
+
+
+class InputTableTest(SimpleTestCase):
+    def test_validate(self):
+        self.assertEqual(validate_input_table(read_input_table('RA,DEC\n10,-20.5\n11.5,-21\n')), '')
+        self.assertIn('one or more', validate_input_table(read_input_table('RA,DEC\n')))
+        self.assertIn('numeric', validate_input_table(read_input_table('RA,DEC\n10,abc\n11,-21\n')))
+        self.assertIn('numeric', validate_input_table(read_input_table('RA,DEC\n10,\n11,-21\n')))
+        self.assertIn('between', validate_input_table(read_input_table('RA,DEC\n10,-95\n')))
+        self.assertIn('greater than zero', validate_input_table(read_input_table(
+            'RA,DEC,XSIZE,YSIZE\n10,-20,1,0\n')))
+
+    def test_process_config_stores_table(self):
+        objects = {}
+        with mock.patch('cutout.tasks.s3') as s3:
+            s3.put_object.side_effect = lambda path, data: objects.update({path: data})
+            config, err_msg, df = process_config({'input_csv': 'RA,DEC\n10,-20\n11,-21\n'}, job_id='abc')
+        self.assertEqual(err_msg, '')
+        self.assertEqual(config['input_table'], {'path': input_table_path('abc'), 'rows': 2})
+        self.assertEqual(config['input_csv'], '')
+        self.assertIn(input_table_path('abc'), objects)
+
+    def test_form_table_parsed_once(self):
+        form = CutoutForm({'xsize': 1, 'ysize': 1, 'bands': 'all', 'input_csv': 'RA,DEC\r\n10,-20\r\n11,-21\r\n'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['input_df'].RA.tolist(), [10, 11])
+        # The table parsed by the form is processed with the config, without parsing the CSV text again
+        with mock.patch('cutout.tasks.read_input_table') as read_table:
+            config, err_msg, df = process_config({'input_csv': form.cleaned_data['input_csv']},
+                                                 df=form.cleaned_data['input_df'])
+        read_table.assert_not_called()
+        self.assertEqual(err_msg, '')
+        self.assertIs(df, form.cleaned_data['input_df'])
+        form = CutoutForm({'xsize': 1, 'ysize': 1, 'bands': 'all', 'input_csv': 'RA,DEC\n10,-95\n'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('between', form.errors['input_csv'][0])
+
+    def test_table_preview(self):
+        store = MemoryObjectStore()
+        df = pandas.DataFrame({'RA': np.arange(100000, dtype=float), 'DEC': np.zeros(100000)})
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False, row_group_size=10000)
+        store.put_object(path='table.parquet', data=buffer.getvalue())
+        ranges = []
+        stream_object = store.stream_object
+        store.stream_object = lambda path, offset=0, length=0: ranges.append(length) or stream_object(
+            path, offset=offset, length=length)
+        preview, rows = read_table_preview(store, 'table.parquet', 5)
+        self.assertEqual(rows, 100000)
+        self.assertEqual(preview.RA.tolist(), [0, 1, 2, 3, 4])
+        # Only the footer and the first row group are downloaded
+        self.assertTrue(all(ranges))
+        self.assertLess(sum(ranges), len(buffer.getvalue()) / 4)
@@ -0,0 +1,92 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User, Permission
+from rest_framework.test import APIClient
+from types import SimpleNamespace
+from unittest import mock
+from ..models import InputTable
+from ..tasks import process_config
+
+
+class MemoryObjectStore:
+    '''Minimal in-memory stand-in for the object store operations used by table uploads.'''
+
+    def __init__(self):
+        self.client = True
+        self.objects = {}
+
+    def put_stream(self, path, stream, length=-1):
+        self.objects[path] = stream.read(length)
+
+    def put_object(self, path='', data='', **kwargs):
+        self.objects[path] = data
+
+    def get_object(self, path=''):
+        return self.objects[path]
+
+    def stream_object(self, path=''):
+        return iter([self.objects[path]])
+
+    def list_objects(self, root_path, recursive=True):
+        return [SimpleNamespace(object_name=path) for path in self.objects if path.startswith(root_path)]
+
+    def delete_objects(self, paths):
+        for path in paths:
+            self.objects.pop(path)
+
+    def copy_object(self, src_path, dst_path):
+        self.objects[dst_path] = self.objects[src_path]
+
+
+# The API throttling uses the cache, so use a local memory cache instead of Redis
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class InputTableUploadTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='uploader')
+        self.user.user_permissions.add(Permission.objects.get(codename='run_job'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.s3 = MemoryObjectStore()
+        for module in ['cutout.views', 'cutout.tasks']:
+            patcher = mock.patch(f'{module}.s3', self.s3)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_resumable_upload(self):
+        data = b'RA,DEC\n10.0,-20.0\n11.0,-21.0\n12.0,-22.0\n'
+        response = self.client.post('/api/table/', {'name': 'positions.csv'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        table_id = response.data['uuid']
+        url = f'/api/table/{table_id}/'
+        response = self.client.put(url, data[:20], content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE=f'bytes 0-19/{len(data)}')
+        self.assertEqual(response.data['size'], 20)
+        # A chunk that does not start at the received size is rejected with the offset to resume from
+        response = self.client.put(url, data[10:], content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE=f'bytes 10-{len(data) - 1}/{len(data)}')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['size'], 20)
+        response = self.client.put(url, data[20:], content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE=f'bytes 20-{len(data) - 1}/{len(data)}')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], InputTable.TableStatus.READY)
+        self.assertEqual(response.data['rows'], 3)
+
+        config, err_msg, df = process_config({'input_table': table_id}, job_id='abc', owner=self.user)
+        self.assertEqual(err_msg, '')
+        self.assertEqual(config['input_table']['rows'], 3)
+        self.assertEqual(config['input_table']['checksum'], response.data['checksum'])
+        self.assertIn(config['input_table']['path'], self.s3.objects)
+        # Other users cannot use the table
+        other_user = User.objects.create(username='other')
+        config, err_msg, df = process_config({'input_table': table_id}, job_id='def', owner=other_user)
+        self.assertIn('not available', err_msg)
+
+    def test_invalid_table(self):
+        response = self.client.post('/api/table/', {'name': 'positions.csv'}, format='json')
+        data = b'RA,DEC\n10.0,abc\n'
+        response = self.client.put(f'''/api/table/{response.data['uuid']}/''', data,
+                                   content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE=f'bytes 0-{len(data) - 1}/{len(data)}')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['status'], InputTable.TableStatus.FAILURE)
+        self.assertIn('numeric', response.data['error_info'])
@@ -0,0 +1,160 @@
+from django.test import TestCase, override_settings
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User, Permission
+from rest_framework.test import APIClient
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+from uuid import uuid4
+import os
+from ..models import Job, JobFile, FileMetric
+from ..tasks import create_job_file_objects
+
+
+class CreateJobFileObjects(TestCase):
+    def setUp(self):
+        self.job = Job.objects.create(uuid=uuid4(), owner=User.objects.create(username='owner'))
+        s3_basepath = os.path.join(settings.S3_BASE_DIR, f'''jobs/{self.job.uuid}''')
+        self.objects = [SimpleNamespace(object_name=f'{s3_basepath}/cutout_{idx}.fits', size=idx)
+                        for idx in range(2500)]
+
+    def test_bulk_registration(self):
+        JobFile.objects.create(job=self.job, path='/cutout_0.fits', size=0)
+        with mock.patch('cutout.tasks.s3.list_objects', return_value=self.objects):
+            # The number of queries depends on the batch size, not on the number of files
+            with CaptureQueriesContext(connection) as queries:
+                create_job_file_objects(str(self.job.uuid))
+        self.assertLess(len(queries), 50)
+        self.assertEqual(JobFile.objects.filter(job=self.job).count(), 2500)
+        self.assertEqual(JobFile.objects.get(job=self.job, path='/cutout_42.fits').size, 42)
+        self.assertEqual(FileMetric.objects.filter(owner=self.job.owner).count(), 2499)
+
+    def test_registration_is_idempotent(self):
+        with mock.patch('cutout.tasks.s3.list_objects', return_value=self.objects):
+            create_job_file_objects(str(self.job.uuid))
+            create_job_file_objects(str(self.job.uuid))
+        self.assertEqual(JobFile.objects.filter(job=self.job).count(), 2500)
+
+
+# The download throttling uses the cache, so use a local memory cache instead of Redis
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class JobFileDownloadTest(TestCase):
+    def setUp(self):
+        self.job = Job.objects.create(uuid=uuid4(), owner=User.objects.create(username='downloader'))
+        JobFile.objects.create(job=self.job, path='/cutout_0.fits', size=10)
+        self.url = f'/download/{self.job.uuid}/cutout_0.fits'
+        self.presigned_url = 'http://object-store:9000/bucket/jobs/cutout_0.fits?X-Amz-Signature=abc'
+
+    @mock.patch('cutout.views.s3')
+    def test_download_modes(self, s3):
+        s3.presigned_get_url.return_value = self.presigned_url
+        with override_settings(JOB_FILE_DOWNLOAD_MODE='accel'):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/_object_store/bucket/jobs/cutout_0.fits?X-Amz-Signature=abc')
+        self.assertFalse(s3.presigned_get_url.call_args.kwargs['external'])
+        with override_settings(JOB_FILE_DOWNLOAD_MODE='presigned'):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], self.presigned_url)
+        self.assertTrue(s3.presigned_get_url.call_args.kwargs['external'])
+        s3.stream_object.assert_not_called()
+        self.assertEqual(self.client.get(f'/download/{self.job.uuid}/missing.fits').status_code, 404)
+
+    def test_download_script(self):
+        JobFile.objects.create(job=self.job, path='/DES0001+0000/cutout_1.fits', size=10)
+        Job.objects.filter(uuid=self.job.uuid).update(config={'prefix': 'DES', 'coords': ''})
+        self.client.force_login(self.job.owner)
+        url = f'/download/{self.job.uuid}'
+        # The proxy or the object store serves each file
+        for mode in ['accel', 'presigned']:
+            with override_settings(JOB_FILE_DOWNLOAD_MODE=mode):
+                script = self.client.get(f'/jobs/{self.job.uuid}').context['jobfile_download_script']
+            self.assertIn(f'{url}/${{path}}', script)
+            self.assertIn('\ncutout_0.fits\nDES0001+0000/cutout_1.fits\n', script)
+            self.assertNotIn('.tar', script)
+        # The API server streams the files, so they are downloaded in a single archive
+        with override_settings(JOB_FILE_DOWNLOAD_MODE='stream'):
+            script = self.client.get(f'/jobs/{self.job.uuid}').context['jobfile_download_script']
+        self.assertIn(f'{url}.tar', script)
+        self.assertNotIn('cutout_0.fits', script)
+
+    @mock.patch('cutout.views.s3')
+    def test_conditional_and_range_requests(self, s3):
+        Job.objects.filter(uuid=self.job.uuid).update(status=Job.JobStatus.SUCCESS)
+        s3.stat_object.return_value = SimpleNamespace(
+            size=10, etag='0123abcd', last_modified=datetime(2025, 1, 1, tzinfo=timezone.utc))
+        s3.stream_object.side_effect = lambda path, offset=0, length=0: [b'0123456789'[offset:offset + (length or 10)]]
+        with override_settings(JOB_FILE_DOWNLOAD_MODE='stream'):
+            response = self.client.get(self.url)
+            self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+            self.assertEqual(response['Content-Length'], '10')
+            self.assertEqual(response['ETag'], '"0123abcd"')
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"0123abcd"').status_code, 304)
+            self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+                             304)
+            response = self.client.get(self.url, HTTP_RANGE='bytes=2-4')
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+            self.assertEqual(b''.join(response.streaming_content), b'234')
+            response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+            self.assertEqual(b''.join(response.streaming_content), b'789')
+            self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=20-').status_code, 416)
+            # A range of a changed file is answered with the whole file
+            self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"old"').status_code, 200)
+
+
+# The API throttling uses the cache, so use a local memory cache instead of Redis
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class JobFileListingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='lister')
+        self.user.user_permissions.add(Permission.objects.get(codename='run_job'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create_jobs(self, jobs, files):
+        for idx in range(jobs):
+            job = Job.objects.create(owner=self.user)
+            JobFile.objects.bulk_create([JobFile(job=job, path=f'/cutout_{idx}.fits', size=idx)
+                                         for idx in range(files)])
+        return job
+
+    def test_job_list_query_count(self):
+        self.create_jobs(2, 3)
+        # The first request caches the permissions of the user
+        self.client.get('/api/job/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/job/')
+        query_count = len(queries)
+        self.assertEqual(response.data['results'][0]['file_count'], 3)
+        self.assertEqual(response.data['results'][0]['total_size'], 3)
+        # The number of queries does not depend on the number of jobs or files
+        self.create_jobs(20, 30)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/job/')
+        self.assertEqual(len(queries), query_count)
+        self.assertEqual(response.data['count'], 22)
+
+    def test_file_listing(self):
+        job = self.create_jobs(1, 25)
+        response = self.client.get(f'/api/job/{job.uuid}/')
+        self.assertEqual(response.data['file_count'], 25)
+        self.assertTrue(response.data['files'].endswith(f'/api/job/{job.uuid}/files/'))
+        paths = []
+        url = f'/api/job/{job.uuid}/files/?page_size=10'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            paths += [jobfile['path'] for jobfile in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(paths, [f'/cutout_{idx}.fits' for idx in range(25)])
+        # Other users cannot list the files
+        other_client = APIClient()
+        other_user = User.objects.create(username='other')
+        other_user.user_permissions.add(Permission.objects.get(codename='run_job'))
+        other_client.force_authenticate(user=other_user)
+        self.assertEqual(other_client.get(f'/api/job/{job.uuid}/files/').status_code, 404)
@@ -0,0 +1,106 @@
+import os
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+import numpy as np
+import pandas
+from django.conf import settings
+from django.test import TestCase, override_settings
+from ..models import CacheMetric
+from ..result_cache import ResultCache, ACCESS_MARKER
+from ..tasks import restore_cached_results, store_cached_results
+from .api_benchmark import MemoryObjectStore
+
+CONFIG = {'bands': 'g,r', 'prefix': 'DES', 'colorset': ['i', 'r', 'g']}
+
+
+@override_settings(CUTOUT_RESULT_CACHE_ENABLED=True, CUTOUT_RESULT_CACHE_TTL=30, CUTOUT_RESULT_CACHE_WORKERS=2)
+class ResultCacheTest(TestCase):
+    def setUp(self):
+        self.store = MemoryObjectStore()
+        self.cache = ResultCache(self.store)
+        patcher = mock.patch('cutout.tasks.result_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_entry(self, key, names, age_days=0):
+        for name in names:
+            path = os.path.join(self.cache.entry_path(key), name)
+            self.store.put_object(path=path, data=b'SIMPLE')
+            self.store.modified[path.strip('/')] -= timedelta(days=age_days)
+
+    def age(self, key, days):
+        '''Make every object of a cache entry "days" days old.'''
+        for path in self.store.list_directory(f'{self.cache.entry_path(key)}/'):
+            self.store.modified[path] = datetime.now(timezone.utc) - timedelta(days=days)
+
+    def test_key(self):
+        key = self.cache.key('DES0305-3415', 46.275669, -34.256, 1, 1, CONFIG)
+        self.assertEqual(len(key), 64)
+        # Positions are rounded, so that the same position in another table has the same key
+        self.assertEqual(self.cache.key('DES0305-3415', 46.2756690000001, -34.256, 1.0, 1.0, CONFIG), key)
+        self.assertNotEqual(self.cache.key('DES0305-3415', 46.275669, -34.256, 2, 1, CONFIG), key)
+        self.assertNotEqual(self.cache.key('DES0305-3415', 46.275669, -34.256, 1, 1, dict(CONFIG, bands='g')), key)
+        with mock.patch('cutout.result_cache.cutter_version', return_value='99.0'):
+            self.assertNotEqual(self.cache.key('DES0305-3415', 46.275669, -34.256, 1, 1, CONFIG), key)
+        self.assertEqual(self.cache.entry_path(key), os.path.join(settings.S3_BASE_DIR, 'cache', 'cutouts',
+                                                                  key[:2], key))
+
+    def test_lookup_many(self):
+        self.add_entry('aa01', ['DESJ1_g.fits', 'DESJ1_r.fits'])
+        self.add_entry('aa02', ['DESJ2_g.fits'], age_days=31)
+        found = self.cache.lookup_many(['aa01', 'aa02', 'aa03'])
+        self.assertEqual(sorted([os.path.basename(path) for path in found['aa01']]), ['DESJ1_g.fits', 'DESJ1_r.fits'])
+        # Expired and missing entries are misses
+        self.assertEqual(found['aa02'], [])
+        self.assertEqual(found['aa03'], [])
+
+    def test_hit_refreshes_entry(self):
+        self.add_entry('aa01', ['DESJ1_g.fits'], age_days=20)
+        self.add_entry('aa02', ['DESJ2_g.fits'], age_days=20)
+        self.assertTrue(self.cache.lookup('aa01'))
+        self.assertIn(os.path.join(self.cache.entry_path('aa01'), ACCESS_MARKER).strip('/'), self.store.objects)
+        # The cutouts were written more than the TTL ago, but the entry was hit recently
+        for key in ['aa01', 'aa02']:
+            for path in self.store.list_directory(f'{self.cache.entry_path(key)}/'):
+                if not path.endswith(ACCESS_MARKER):
+                    self.store.modified[path] -= timedelta(days=20)
+        self.assertEqual([os.path.basename(path) for path in self.cache.lookup('aa01')], ['DESJ1_g.fits'])
+        self.assertEqual(self.cache.lookup('aa02'), [])
+        self.assertEqual(self.cache.prune(), 1)
+        self.assertEqual(self.store.list_directory(f'{self.cache.entry_path("aa02")}/'), [])
+        self.age('aa01', 31)
+        self.assertEqual(self.cache.prune(), 2)
+
+    def test_restore_cached_results(self):
+        tile = {
+            'tilename': 'DES0305-3415',
+            'ra': np.array([46.1, 46.2, 46.3]),
+            'dec': np.array([-34.1, -34.2, -34.3]),
+            'xsize': np.ones(3),
+            'ysize': np.ones(3),
+            'thumbname': np.array(['DESJ1', 'DESJ2', 'DESJ3']),
+        }
+        key = self.cache.key('DES0305-3415', 46.2, -34.2, 1.0, 1.0, CONFIG)
+        self.add_entry(key, ['DESJ2_g.fits', 'DESJ2_r.fits'])
+        tiles, missed = restore_cached_results('job', [tile], CONFIG)
+        # The cached position is copied into the job folder and only the other positions are cut
+        job_path = os.path.join(settings.S3_BASE_DIR, 'jobs', 'job').strip('/')
+        self.assertEqual(sorted(self.store.list_directory(job_path)),
+                         [f'{job_path}/DESJ2_g.fits', f'{job_path}/DESJ2_r.fits'])
+        self.assertEqual(tiles[0]['thumbname'].tolist(), ['DESJ1', 'DESJ3'])
+        self.assertEqual(sorted([thumbname for tilename, thumbname in missed.values()]), ['DESJ1', 'DESJ3'])
+        metric = CacheMetric.objects.get()
+        self.assertEqual((metric.hits, metric.misses), (1, 2))
+
+    def test_store_cached_results(self):
+        missed = {'aa01': ('DES0305-3415', 'DESJ1'), 'aa02': ('DES0001-0001', 'DESJ2')}
+        report = pandas.DataFrame({'TILENAME': ['DES0305-3415', 'DES0001-0001'], 'STATUS': ['SUCCESS', 'FAILURE']})
+        job_path = os.path.join(settings.S3_BASE_DIR, 'jobs', 'job')
+        rel_paths = ['DES0305-3415/DESJ1_g.fits', 'DES0305-3415/DESJ1.png', 'DES0001-0001/DESJ2_g.fits']
+        for rel_path in rel_paths:
+            self.store.put_object(path=os.path.join(job_path, rel_path), data=b'SIMPLE')
+        store_cached_results('job', missed, report, rel_paths)
+        self.assertEqual(sorted([os.path.basename(path) for path in self.cache.lookup('aa01')]),
+                         ['DESJ1.png', 'DESJ1_g.fits'])
+        # Positions in tiles with failed work items are not cached
+        self.assertEqual(self.cache.lookup('aa02'), [])
@@ -0,0 +1,67 @@
+import pandas as pd
+from django.contrib.auth.models import User
+from django.test import TestCase
+from unittest import mock
+from ..models import Job, JobFile
+from ..reuse import copy_job_results, job_config_hash, prepare_job, reuse_job_results
+
+
+class ReuseJobTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reuser')
+        self.df = pd.DataFrame({'RA': [46.275669, 10.0], 'DEC': [-34.256000, -20.5]})
+        self.config = {'xsize': 1.0, 'ysize': 1.0, 'bands': 'g,r', 'colorset': ['i', 'r', 'g']}
+
+    def test_config_hash(self):
+        config_hash = job_config_hash(self.config, self.df)
+        # Rounding noise in the coordinates and the order of the bands do not change the hash
+        df = pd.DataFrame({'RA': [46.2756690000001, 10.0], 'DEC': [-34.256, -20.5]})
+        self.assertEqual(job_config_hash(dict(self.config, bands='r g'), df), config_hash)
+        self.assertNotEqual(job_config_hash(dict(self.config, bands='g'), self.df), config_hash)
+        self.assertNotEqual(job_config_hash(self.config, self.df.iloc[::-1]), config_hash)
+
+    @mock.patch('cutout.reuse.load_input_table')
+    def test_prepare_job(self, load_input_table):
+        job = Job(owner=self.user)
+        prepare_job(job, self.config, df=self.df)
+        # The table parsed with the config is not read again from the job folder
+        load_input_table.assert_not_called()
+        self.assertEqual(job.config_hash, job_config_hash(self.config, self.df))
+
+    @mock.patch('cutout.reuse.launch_workflow')
+    @mock.patch('cutout.reuse.write_job_metadata')
+    @mock.patch('cutout.reuse.s3')
+    def test_reuse(self, s3, write_job_metadata, launch_workflow):
+        config_hash = job_config_hash(self.config, self.df)
+        src_job = Job.objects.create(owner=self.user, status=Job.JobStatus.SUCCESS, config_hash=config_hash)
+        JobFile.objects.bulk_create([JobFile(job=src_job, path=f'/cutouts/{idx}.fits', size=idx)
+                                     for idx in range(3)])
+        job = Job.objects.create(owner=self.user, config=self.config, config_hash='other')
+        self.assertFalse(reuse_job_results(job))
+        job.config_hash = config_hash
+        with mock.patch('cutout.reuse.copy_job_results.apply_async') as apply_async:
+            apply_async.return_value.id = 'copy-task'
+            self.assertTrue(reuse_job_results(job))
+        # The outputs are copied by a task, not by the request
+        s3.copy_directory.assert_not_called()
+        self.assertEqual(apply_async.call_args.kwargs['args'], [str(job.uuid), str(src_job.uuid)])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.JobStatus.STARTED)
+        self.assertEqual(job.task_ids, ['copy-task'])
+        copy_job_results(str(job.uuid), str(src_job.uuid))
+        s3.copy_directory.assert_called_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.JobStatus.SUCCESS)
+        self.assertEqual(sorted(JobFile.objects.filter(job=job).values_list('size', flat=True)), [0, 1, 2])
+        launch_workflow.assert_not_called()
+
+    @mock.patch('cutout.reuse.launch_workflow')
+    @mock.patch('cutout.reuse.s3')
+    def test_failed_copy(self, s3, launch_workflow):
+        src_job = Job.objects.create(owner=self.user, status=Job.JobStatus.SUCCESS)
+        job = Job.objects.create(owner=self.user, config=self.config, status=Job.JobStatus.STARTED)
+        s3.copy_directory.side_effect = ConnectionError('Object store unavailable')
+        copy_job_results(str(job.uuid), str(src_job.uuid))
+        # The job runs its workflow instead
+        launch_workflow.assert_called_once_with(str(job.uuid), self.config)
+        self.assertFalse(JobFile.objects.filter(job=job).exists())
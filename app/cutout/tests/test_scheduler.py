@@ -0,0 +1,59 @@
+from datetime import timedelta
+from django.contrib.auth.models import User, Group
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from unittest import mock
+from ..models import Job, FairShareWeight
+from ..scheduler import select_jobs, dispatch_jobs
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   CUTOUT_FAIR_SHARE_USER_MAX_RUNNING=2, CUTOUT_FAIR_SHARE_MAX_RUNNING=3)
+class FairShareTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.heavy = User.objects.create(username='heavy')
+        self.light = User.objects.create(username='light')
+        # The heavy user recently ran a long job
+        Job.objects.create(owner=self.heavy, status=Job.JobStatus.SUCCESS, estimate={'runtime': 1000},
+                           started=now - timedelta(minutes=30))
+        self.jobs = {}
+        for owner, count, offset in [(self.heavy, 4, 0), (self.light, 2, 10)]:
+            self.jobs[owner.username] = [
+                Job.objects.create(owner=owner, estimate={'runtime': 10},
+                                   queued=now - timedelta(minutes=20 - offset - idx)).uuid
+                for idx in range(count)]
+
+    def test_least_recent_usage_first(self):
+        heavy, light = self.jobs['heavy'], self.jobs['light']
+        # The light user is served first although the heavy user queued earlier
+        self.assertEqual(select_jobs(), [light[0], light[1], heavy[0]])
+
+    def test_weights(self):
+        heavy, light = self.jobs['heavy'], self.jobs['light']
+        group = Group.objects.create(name='survey')
+        self.heavy.groups.add(group)
+        FairShareWeight.objects.create(group=group, weight=1000)
+        # The heavy user's usage per weight is now about one second, but the running job limit applies
+        self.assertEqual(select_jobs(), [light[0], heavy[0], heavy[1]])
+        FairShareWeight.objects.create(user=self.heavy, weight=1, max_running_jobs=1)
+        self.assertEqual(select_jobs(), [light[0], light[1], heavy[0]])
+
+    @mock.patch('cutout.scheduler.launch_workflow')
+    def test_dispatch(self, launch_workflow):
+        self.assertEqual(dispatch_jobs(), 3)
+        self.assertEqual(launch_workflow.call_count, 3)
+        self.assertEqual(Job.objects.filter(status=Job.JobStatus.STARTED).count(), 3)
+        # No capacity is left for the remaining queued jobs
+        self.assertEqual(dispatch_jobs(), 0)
+
+    @override_settings(CUTOUT_FAIR_SHARE_MAX_RUNNING=0, CUTOUT_FAIR_SHARE_STALE_AFTER=3600)
+    def test_stale_running_jobs(self):
+        light = self.jobs['light']
+        running = [Job.objects.create(owner=self.light, status=Job.JobStatus.STARTED).uuid for idx in range(2)]
+        # The light user has no free running slot
+        self.assertNotIn(light[0], select_jobs())
+        # A started job that was not updated for an hour lost its workflow and does not take a slot
+        Job.objects.filter(uuid=running[0]).update(modified=timezone.now() - timedelta(hours=2))
+        self.assertIn(light[0], select_jobs())
+        self.assertNotIn(light[1], select_jobs())
@@ -0,0 +1,68 @@
+import os
+import tempfile
+from unittest import mock
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from ..models import Job
+from ..scratch import ScratchSpace, ScratchFull, admit_task, check_job_scratch
+
+
+@override_settings(JOB_SCRATCH_MAX_SIZE=1000, JOB_SCRATCH_FREE_SPACE=100, JOB_SCRATCH_JOB_MAX_SIZE=500)
+class ScratchSpaceTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.scratch = ScratchSpace(root=self.tmpdir.name)
+        owner = User.objects.create(username='scratch')
+        self.jobs = [str(Job.objects.create(owner=owner, status=Job.JobStatus.STARTED).uuid) for idx in range(3)]
+
+    def write(self, job_id, size):
+        os.makedirs(os.path.join(self.tmpdir.name, job_id), exist_ok=True)
+        with open(os.path.join(self.tmpdir.name, job_id, 'cutout.fits'), 'wb') as output_file:
+            output_file.write(b'0' * size)
+
+    def test_reservations(self):
+        self.assertTrue(self.scratch.reserve(self.jobs[0], 600))
+        # 1000 bytes less the 100 bytes margin and the 600 bytes reserved
+        self.assertFalse(self.scratch.reserve(self.jobs[1], 400))
+        self.assertTrue(self.scratch.reserve(self.jobs[1], 300))
+        # Space written by a job counts once, against its reservation
+        self.write(self.jobs[0], 600)
+        self.assertEqual(self.scratch.available(), 0)
+        self.assertEqual(self.scratch.stats(), {'capacity': 1000, 'used': 600, 'reserved': 900, 'reservations': 2})
+        # Cleaning up a job frees its space, and the reservations of jobs that are not running are removed
+        self.scratch.cleanup(self.jobs[0])
+        Job.objects.filter(uuid=self.jobs[1]).update(status=Job.JobStatus.FAILURE)
+        self.assertTrue(self.scratch.reserve(self.jobs[2], 900))
+
+    def test_job_cap(self):
+        self.write(self.jobs[0], 400)
+        check_job_scratch(os.path.join(self.tmpdir.name, self.jobs[0]))
+        self.write(self.jobs[0], 600)
+        with self.assertRaises(ScratchFull):
+            check_job_scratch(os.path.join(self.tmpdir.name, self.jobs[0]))
+
+    def test_task_reservations(self):
+        job = Job.objects.get(uuid=self.jobs[0])
+        job.estimate = {'positions': 4, 'output_pixels': 0}
+        job.save()
+        task = mock.Mock()
+        task.retry.return_value = ScratchFull('retry')
+        with self.settings(JOB_SCRATCH_DIR=self.tmpdir.name, JOB_SCRATCH_BYTES_PER_POSITION=100):
+            # Each batch reserves the share of its positions in its own output folder
+            admit_task(task, self.jobs[0], name='batch-00000', positions=3)
+            admit_task(task, self.jobs[0], name='batch-00001', positions=2)
+            self.assertEqual(self.scratch.reservations(), {f'{self.jobs[0]}.batch-00000': 300,
+                                                           f'{self.jobs[0]}.batch-00001': 200})
+            self.write(os.path.join(self.jobs[0], 'batch-00000'), 300)
+            self.assertEqual(self.scratch.available(), 400)
+            # A serial job that waits for space does not count as running
+            Job.objects.filter(uuid=self.jobs[1]).update(estimate={'positions': 7, 'output_pixels': 0})
+            with self.assertRaises(ScratchFull):
+                admit_task(task, self.jobs[1])
+            job = Job.objects.get(uuid=self.jobs[1])
+            self.assertEqual((job.status, job.queued), (Job.JobStatus.PENDING, None))
+            self.scratch.cleanup(self.jobs[0])
+            self.assertEqual(self.scratch.reservations(), {})
+            admit_task(task, self.jobs[1])
+        self.assertEqual(Job.objects.get(uuid=self.jobs[1]).status, Job.JobStatus.STARTED)
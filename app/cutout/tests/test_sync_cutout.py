@@ -0,0 +1,77 @@
+from django.contrib.auth.models import User, Permission
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from unittest import mock
+from ..models import Job
+
+
+def task_result(ready=(True,), failed=False, result=''):
+    return mock.Mock(ready=mock.Mock(side_effect=list(ready)), failed=mock.Mock(return_value=failed), result=result)
+
+
+# The API throttling uses the cache, so use a local memory cache instead of Redis
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   CUTOUT_SYNC_ENABLED=True, CUTOUT_SYNC_MAX_SIZE=2.0, CUTOUT_SYNC_POLL_INTERVAL=0.25)
+class SyncCutoutTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='stamper')
+        self.user.user_permissions.add(Permission.objects.get(codename='run_job'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = '/api/cutout?ra=46.275669&dec=-34.256&size=0.5&band=g'
+        cache.clear()
+
+    @mock.patch('cutout.views.asyncio.sleep', new_callable=mock.AsyncMock)
+    @mock.patch('cutout.views.cut_position')
+    def test_cutout(self, cut_position, sleep):
+        def cut(key, ra, dec, size, bands, image_format):
+            cache.set(key, ('DESJ030506.16-341521.60_g.fits', b'SIMPLE'))
+            return task_result(ready=[False, True])
+        cut_position.delay.side_effect = cut
+        for attempt in range(2):
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, b'SIMPLE')
+            self.assertEqual(response['Content-Type'], 'application/fits')
+        # The second request is served from the cache
+        self.assertEqual(cut_position.delay.call_count, 1)
+        # The result backend is polled at the configured interval
+        sleep.assert_awaited_once_with(0.25)
+        # A client with the cutout revalidates it without a download
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get('/api/cutout?ra=46.27&dec=-95').status_code, 400)
+        self.assertEqual(self.client.get('/api/cutout?ra=46.27&dec=-34.25&band=q').status_code, 400)
+
+    @override_settings(CUTOUT_SYNC_TIMEOUT=0)
+    @mock.patch('cutout.views.cut_position')
+    def test_failed_cutout(self, cut_position):
+        # The task raised an exception
+        cut_position.delay.return_value = task_result(failed=True, result=OSError('Coadd file not found'))
+        self.assertEqual(self.client.get(self.url).status_code, 503)
+        # The task returned an error message
+        cut_position.delay.return_value = task_result(result='No tile covers the position')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.content, b'No tile covers the position')
+        # The task did not finish in time
+        cut_position.delay.return_value = task_result(ready=[False])
+        self.assertEqual(self.client.get(self.url).status_code, 503)
+
+    @mock.patch('cutout.views.start_job', return_value=None)
+    @mock.patch('cutout.views.cut_position')
+    def test_cutout_job(self, cut_position, start_job):
+        # A GET request does not create a job
+        self.assertEqual(self.client.get('/api/cutout?ra=46.275669&dec=-34.256&size=5&band=g').status_code, 400)
+        with self.settings(CUTOUT_SYNC_ENABLED=False):
+            self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertFalse(Job.objects.exists())
+        response = self.client.post('/api/cutout', {'ra': 46.275669, 'dec': -34.256, 'size': 5, 'band': 'g'},
+                                    format='json')
+        self.assertEqual(response.status_code, 202)
+        cut_position.delay.assert_not_called()
+        job = Job.objects.get(uuid=response.data['uuid'])
+        self.assertEqual(start_job.call_args.args[1]['bands'], 'g')
+        self.assertEqual(job.owner, self.user)
@@ -0,0 +1,83 @@
+import fcntl
+import os
+import tempfile
+from django.test import SimpleTestCase
+from ..tile_cache import TileCache
+
+
+class TileCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.tiles = []
+        for idx in range(3):
+            path = os.path.join(self.archive_dir.name, f'tile{idx}', f'tile{idx}_g.fits.fz')
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as tile_file:
+                tile_file.write(b'x' * 100)
+            self.tiles.append(path)
+
+    def tearDown(self):
+        self.archive_dir.cleanup()
+        self.cache_dir.cleanup()
+
+    def fetch(self, cache, path):
+        with cache.pinned(path) as local_path:
+            return local_path
+
+    def test_fetch_hit_and_miss(self):
+        cache = TileCache(cache_dir=self.cache_dir.name, max_size=1000)
+        local_path = self.fetch(cache, self.tiles[0])
+        self.assertNotEqual(local_path, self.tiles[0])
+        self.assertEqual(os.path.basename(local_path), os.path.basename(self.tiles[0]))
+        self.assertEqual(self.fetch(cache, self.tiles[0]), local_path)
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['files'], 1)
+        # The counters of each process are kept in a file of its own
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir.name, 'stats')), [f'{os.getpid()}.json'])
+        self.assertEqual(TileCache(cache_dir=self.cache_dir.name, max_size=1000).stats()['hits'], 1)
+
+    def test_lru_eviction(self):
+        cache = TileCache(cache_dir=self.cache_dir.name, max_size=250)
+        first_path = self.fetch(cache, self.tiles[0])
+        second_path = self.fetch(cache, self.tiles[1])
+        # Use the first tile so that the second tile is the least recently used
+        os.utime(second_path, (0, 0))
+        self.fetch(cache, self.tiles[0])
+        self.fetch(cache, self.tiles[2])
+        self.assertTrue(os.path.exists(first_path))
+        self.assertFalse(os.path.exists(second_path))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_pinned_files_are_not_evicted(self):
+        cache = TileCache(cache_dir=self.cache_dir.name, max_size=250)
+        with cache.pinned(self.tiles[0]) as first_path, cache.pinned(self.tiles[1]) as second_path:
+            # The cache is full of files in use, so the third tile is read from the archive
+            self.assertEqual(self.fetch(cache, self.tiles[2]), self.tiles[2])
+            self.assertTrue(os.path.exists(first_path) and os.path.exists(second_path))
+        self.assertNotEqual(self.fetch(cache, self.tiles[2]), self.tiles[2])
+        self.assertEqual(cache.stats()['files'], 2)
+
+    def test_fills_in_progress(self):
+        cache = TileCache(cache_dir=self.cache_dir.name, max_size=250)
+        self.fetch(cache, self.tiles[0])
+        # Another process is filling the cache with a file of 100 bytes
+        partial_path = cache.local_path(self.tiles[1]) + '.1.tmp'
+        os.makedirs(os.path.dirname(partial_path))
+        with open(partial_path, 'wb') as partial_file:
+            fcntl.flock(partial_file, fcntl.LOCK_EX)
+            os.truncate(partial_file.fileno(), 100)
+            # The space of the fill is taken, so the least recently used file is evicted
+            self.assertNotEqual(self.fetch(cache, self.tiles[2]), self.tiles[2])
+            self.assertEqual(cache.stats()['evictions'], 1)
+            self.assertTrue(os.path.exists(partial_path))
+        # The partial file of a process that died is deleted when space is needed
+        self.assertNotEqual(self.fetch(cache, self.tiles[0]), self.tiles[0])
+        self.assertFalse(os.path.exists(partial_path))
+        self.assertEqual(cache.stats()['files'], 2)
+
+    def test_disabled(self):
+        cache = TileCache(cache_dir='', max_size=1000)
+        self.assertEqual(self.fetch(cache, self.tiles[0]), self.tiles[0])
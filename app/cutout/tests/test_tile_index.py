@@ -0,0 +1,52 @@
+import duckdb
+import numpy as np
+from django.test import SimpleTestCase
+from ..tile_index import TileIndex
+
+
+class TileIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.dbh = duckdb.connect(':memory:')
+        self.dbh.execute('''
+            CREATE TABLE COADDTILE_GEOM (TILENAME VARCHAR, RACMIN DOUBLE, RACMAX DOUBLE,
+                                         DECCMIN DOUBLE, DECCMAX DOUBLE, CROSSRA0 VARCHAR)
+        ''')
+        self.dbh.execute('''
+            INSERT INTO COADDTILE_GEOM VALUES
+                ('DES0000+0000', 359.635, 0.365, -0.365, 0.365, 'Y'),
+                ('DES0001+0000', 0.365, 1.095, -0.365, 0.365, 'N'),
+                ('DES0320-1916', 49.55, 50.33, -19.78, -19.05, 'N'),
+                ('DES0000-8000', 356.0, 4.0, -80.3, -79.7, 'Y')
+        ''')
+
+    def tearDown(self):
+        self.dbh.close()
+
+    def test_match(self):
+        index = TileIndex(cell_size=0.5)
+        ra = np.array([49.92, 359.8, 0.1, 0.7, 180.0, 358.0, 359.5, 2.0])
+        dec = np.array([-19.42, 0.0, 0.2, -0.1, 0.0, -80.0, 0.0, -79.8])
+        tilenames, indices, tilenames_matched = index.find_tilenames_radec(ra, dec, self.dbh)
+        self.assertEqual(tilenames, ['DES0320-1916', 'DES0000+0000', 'DES0001+0000', 'DES0000-8000'])
+        self.assertEqual(indices, {
+            'DES0320-1916': [0],
+            'DES0000+0000': [1, 2],
+            'DES0001+0000': [3],
+            'DES0000-8000': [5, 7],
+        })
+        self.assertEqual(tilenames_matched, [
+            'DES0320-1916', 'DES0000+0000', 'DES0000+0000', 'DES0001+0000',
+            False, 'DES0000-8000', False, 'DES0000-8000'])
+
+    def test_matches_brute_force(self):
+        index = TileIndex(cell_size=0.25)
+        rng = np.random.default_rng(1)
+        ra = rng.uniform(-2, 6, 2000) % 360
+        dec = rng.uniform(-81, 1, 2000)
+        index.load(self.dbh)
+        matched = index.match(ra, dec)
+        for k in range(len(ra)):
+            ra_test = ra[k] - 360 if ra[k] > 180 else ra[k]
+            inside = np.flatnonzero((ra_test >= index.racmin) & (ra_test <= index.racmax)
+                                    & (dec[k] >= index.decmin) & (dec[k] <= index.decmax))
+            self.assertEqual(matched[k], inside[0] if len(inside) else -1)
@@ -0,0 +1,65 @@
+import os
+import tempfile
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase
+from ..models import Job, JobFile, FileMetric
+from ..uploader import JobFileUploader
+from .api_benchmark import MemoryObjectStore
+
+
+class FailingObjectStore(MemoryObjectStore):
+    '''Object store whose uploads of files named "bad" fail.'''
+
+    def put_object(self, path="", data="", file_path="", json_output=True):
+        if 'bad' in os.path.basename(path):
+            raise ConnectionError(f'Upload of "{path}" failed')
+        return super().put_object(path=path, data=data, file_path=file_path, json_output=json_output)
+
+
+class JobFileUploaderTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='uploader')
+        self.job = Job.objects.create(owner=self.user, status=Job.JobStatus.STARTED)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.s3_basepath = os.path.join(settings.S3_BASE_DIR, f'jobs/{self.job.uuid}').strip('/')
+
+    def write(self, *names):
+        file_paths = []
+        for name in names:
+            file_paths.append(os.path.join(self.tmpdir.name, name))
+            os.makedirs(os.path.dirname(file_paths[-1]), exist_ok=True)
+            with open(file_paths[-1], 'w') as output_file:
+                output_file.write(name)
+        return file_paths
+
+    def test_upload_then_delete(self):
+        store = MemoryObjectStore()
+        uploader = JobFileUploader(store, str(self.job.uuid), self.tmpdir.name, max_workers=2)
+        file_paths = self.write('DES0001+0000/DESJ1_g.fits', 'DES0001+0000/DESJ1.png', 'cutout.log')
+        uploader.submit(file_paths[:2])
+        uploader.flush()
+        # The uploaded files are in the job folder and their local copies are deleted
+        self.assertEqual(store.objects[f'{self.s3_basepath}/DES0001+0000/DESJ1_g.fits'],
+                         b'DES0001+0000/DESJ1_g.fits')
+        self.assertFalse(any([os.path.exists(file_path) for file_path in file_paths[:2]]))
+        self.assertTrue(os.path.exists(file_paths[2]))
+        uploader.submit(file_paths[2:])
+        uploader.close()
+        self.assertEqual(sorted(uploader.uploaded_paths()),
+                         ['DES0001+0000/DESJ1.png', 'DES0001+0000/DESJ1_g.fits', 'cutout.log'])
+        self.assertEqual(sorted(JobFile.objects.filter(job=self.job).values_list('path', flat=True)),
+                         ['/DES0001+0000/DESJ1.png', '/DES0001+0000/DESJ1_g.fits', '/cutout.log'])
+        self.assertEqual(FileMetric.objects.filter(owner=self.user).count(), 3)
+
+    def test_close_raises_upload_error(self):
+        uploader = JobFileUploader(FailingObjectStore(), str(self.job.uuid), self.tmpdir.name, max_workers=2)
+        file_paths = self.write('DESJ1_g.fits', 'DESJ1_bad.fits')
+        uploader.submit(file_paths)
+        with self.assertRaises(ConnectionError):
+            uploader.close()
+        # The successful upload is registered, and the failed file is kept for a later attempt
+        self.assertEqual(uploader.uploaded_paths(), ['DESJ1_g.fits'])
+        self.assertEqual(list(JobFile.objects.filter(job=self.job).values_list('path', flat=True)), ['/DESJ1_g.fits'])
+        self.assertTrue(os.path.exists(file_paths[1]))
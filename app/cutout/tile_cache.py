@@ -0,0 +1,252 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from celery.worker.control import inspect_command
+from django.conf import settings
+from .log import get_logger
+logger = get_logger(__name__)
+
+
+# Seconds between writes of the cache counters of a process to its counter file
+STATS_FLUSH_INTERVAL = 10
+
+
+class TileCache:
+    '''Node-local LRU cache of coadd tile files.
+
+    Cached files are keyed by their full archive path, which includes the compression suffix.
+    Fills are serialized across processes on the node with file locks, so that concurrent
+    requests for the same tile copy it from the archive only once. A file is read while it holds
+    a shared lock, which keeps it from being evicted. Each process counts hits, misses and
+    evictions in its own counter file, and the counters of all the processes using the same
+    cache directory are added up.
+    '''
+
+    def __init__(self, cache_dir=None, max_size=None) -> None:
+        self.cache_dir = settings.TILE_CACHE_DIR if cache_dir is None else cache_dir
+        self.max_size = settings.TILE_CACHE_MAX_SIZE if max_size is None else max_size
+        self.tiles_dir = os.path.join(self.cache_dir, 'tiles')
+        self.locks_dir = os.path.join(self.cache_dir, 'locks')
+        self.stats_dir = os.path.join(self.cache_dir, 'stats')
+        self.counters = Counter()
+        self.counters_pid = None
+        self.counters_flushed = 0
+        self.counters_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.cache_dir) and self.max_size > 0
+
+    def key(self, path):
+        return hashlib.sha256(path.encode('utf-8')).hexdigest()
+
+    def local_path(self, path):
+        '''Return the cache location of an archive file. The file basename is preserved.'''
+        key = self.key(path)
+        return os.path.join(self.tiles_dir, key[:2], key, os.path.basename(path))
+
+    @contextlib.contextmanager
+    def lock(self, name):
+        os.makedirs(self.locks_dir, exist_ok=True)
+        with open(os.path.join(self.locks_dir, f'{name}.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def pinned(self, path):
+        '''Yield the path of a local copy of the archive file, which is not evicted until the context exits.
+
+        The file is copied into the cache on a miss. If the cache is disabled or the file cannot
+        be cached, the archive path is yielded.
+        '''
+        pin = None
+        if self.enabled:
+            local_path = self.local_path(path)
+            try:
+                pin = self.pin(local_path)
+                if not pin:
+                    with self.lock(self.key(path)):
+                        # Another process may have filled the cache while this one waited for the lock
+                        pin = self.pin(local_path)
+                        if not pin:
+                            self.count('misses')
+                            if self.fill(path, local_path):
+                                pin = self.pin(local_path)
+                        else:
+                            self.count('hits')
+                else:
+                    self.count('hits')
+            except Exception as err:
+                logger.warning(f'''Tile cache error for "{path}": {err}''')
+        if not pin:
+            yield path
+            return
+        try:
+            yield local_path
+        finally:
+            pin.close()
+
+    def pin(self, local_path):
+        '''Open a cached file with a shared lock and mark it as recently used. Return None if it is not cached.'''
+        try:
+            pin_file = open(local_path, 'rb')
+        except FileNotFoundError:
+            return None
+        fcntl.flock(pin_file, fcntl.LOCK_SH)
+        # The file may have been evicted while this process waited for the lock
+        if os.fstat(pin_file.fileno()).st_nlink == 0:
+            pin_file.close()
+            return None
+        os.utime(local_path)
+        return pin_file
+
+    def fill(self, path, local_path):
+        '''Copy an archive file into the cache. Return False if there is no room for it.
+
+        The space is claimed under the eviction lock by creating the temporary copy at its full
+        size, so that concurrent fills cannot overshoot the size limit. The temporary copy holds
+        an exclusive lock until it is complete.
+        '''
+        file_size = os.path.getsize(path)
+        if file_size > self.max_size:
+            logger.warning(f'''File is larger than the tile cache: "{path}"''')
+            return False
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        tmp_path = f'{local_path}.{os.getpid()}.tmp'
+        with self.lock('evict'):
+            if not self.evict(file_size):
+                logger.warning(f'''The tile cache files are in use, not caching "{path}"''')
+                return False
+            tmp_file = open(tmp_path, 'wb')
+            fcntl.flock(tmp_file, fcntl.LOCK_EX)
+            os.truncate(tmp_file.fileno(), file_size)
+        try:
+            with open(path, 'rb') as archive_file:
+                shutil.copyfileobj(archive_file, tmp_file)
+            tmp_file.flush()
+            os.replace(tmp_path, local_path)
+        except Exception:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+        finally:
+            tmp_file.close()
+        return True
+
+    def entries(self):
+        '''Return the (modification time, size, path) of every cached file and every file being filled.'''
+        entries = []
+        for dirpath, dirnames, filenames in os.walk(self.tiles_dir):
+            for filename in filenames:
+                file_path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, file_path))
+        return entries
+
+    def remove_unused(self, file_path):
+        '''Delete a file unless another process holds a lock on it. Return True if it was deleted.'''
+        try:
+            with open(file_path, 'rb') as cached_file:
+                fcntl.flock(cached_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.remove(file_path)
+        except BlockingIOError:
+            return False
+        except FileNotFoundError:
+            pass
+        with contextlib.suppress(OSError):
+            os.rmdir(os.path.dirname(file_path))
+        return True
+
+    def evict(self, incoming_size=0):
+        '''Delete the least recently used files until the incoming file fits within the size limit.
+
+        Must be called with the eviction lock held. Files that are read or being filled are
+        skipped, and the temporary copies left by processes that died are deleted. Returns
+        False if the incoming file does not fit.
+        '''
+        entries = sorted(self.entries())
+        total_size = sum([entry[1] for entry in entries])
+        evicted = 0
+        for mtime, size, file_path in entries:
+            if total_size + incoming_size <= self.max_size:
+                break
+            if self.remove_unused(file_path):
+                logger.debug(f'''Evicted cached tile file "{file_path}"''')
+                total_size -= size
+                evicted += not file_path.endswith('.tmp')
+        if evicted:
+            self.count('evictions', evicted)
+        return total_size + incoming_size <= self.max_size
+
+    def counter_path(self):
+        return os.path.join(self.stats_dir, f'{os.getpid()}.json')
+
+    def read_counter_file(self, file_path):
+        try:
+            with open(file_path) as stats_file:
+                return Counter(json.load(stats_file))
+        except (FileNotFoundError, ValueError):
+            return Counter()
+
+    def count(self, counter, count=1):
+        '''Add to a counter of this process, which is written to its counter file every STATS_FLUSH_INTERVAL seconds.'''
+        with self.counters_lock:
+            if self.counters_pid != os.getpid():
+                # A new process continues the counters of an earlier process with the same PID
+                self.counters_pid = os.getpid()
+                self.counters = self.read_counter_file(self.counter_path())
+                self.counters_flushed = time.monotonic()
+            self.counters[counter] += count
+            if time.monotonic() - self.counters_flushed >= STATS_FLUSH_INTERVAL:
+                self.flush_counters()
+
+    def flush_counters(self):
+        if self.counters_pid != os.getpid():
+            return
+        os.makedirs(self.stats_dir, exist_ok=True)
+        file_path = self.counter_path()
+        with open(f'{file_path}.tmp', 'w') as stats_file:
+            json.dump(self.counters, stats_file)
+        os.replace(f'{file_path}.tmp', file_path)
+        self.counters_flushed = time.monotonic()
+
+    def read_counters(self):
+        '''Add up the counters of all the processes using the cache.'''
+        with self.counters_lock:
+            self.flush_counters()
+        counters = Counter({'hits': 0, 'misses': 0, 'evictions': 0})
+        with contextlib.suppress(FileNotFoundError):
+            for filename in os.listdir(self.stats_dir):
+                if filename.endswith('.json'):
+                    counters.update(self.read_counter_file(os.path.join(self.stats_dir, filename)))
+        return dict(counters)
+
+    def stats(self):
+        if not self.enabled:
+            return {'enabled': False}
+        entries = [entry for entry in self.entries() if not entry[2].endswith('.tmp')]
+        return {
+            'enabled': True,
+            'max_size': self.max_size,
+            'size': sum([entry[1] for entry in entries]),
+            'files': len(entries),
+            **self.read_counters(),
+        }
+
+
+# Expose the cache counters of each worker node with "celery -A cutout inspect tile_cache_stats"
+@inspect_command()
+def tile_cache_stats(state):
+    return TileCache().stats()
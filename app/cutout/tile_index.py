@@ -0,0 +1,114 @@
+import math
+import numpy as np
+from django.conf import settings
+from .log import get_logger
+logger = get_logger(__name__)
+
+
+class TileIndex:
+    '''In-memory spatial index of the coadd tile footprints for matching positions to tiles.
+
+    The unique area of each tile (RACMIN/RACMAX, DECCMIN/DECCMAX) is loaded once from the
+    metadata database and binned on a regular RA/DEC grid. A position is matched by testing
+    only the tiles overlapping its grid cell, for all positions at once. Tiles that cross
+    RA=0 are matched on both sides of the boundary.
+    '''
+
+    def __init__(self, table=None, cell_size=0.5) -> None:
+        self.table = settings.CUTOUT_TILE_GEOM_TABLE if table is None else table
+        self.cell_size = cell_size
+        self.ncols = int(math.ceil(360 / cell_size))
+        self.nrows = int(math.ceil(180 / cell_size)) + 1
+        self.tilenames = None
+
+    @property
+    def loaded(self):
+        return self.tilenames is not None
+
+    def find_table(self, dbh):
+        '''Return the configured tile geometry table, or the first table with tile footprint columns.'''
+        if self.table:
+            return self.table
+        tables = dbh.execute('''
+            SELECT table_name FROM information_schema.columns
+            WHERE upper(column_name) = 'CROSSRA0' ORDER BY table_name
+        ''').fetchall()
+        if not tables:
+            raise LookupError('No tile geometry table found in the metadata database')
+        return tables[0][0]
+
+    def load(self, dbh):
+        '''Read the tile footprints from the database and build the grid.'''
+        self.table = self.find_table(dbh)
+        rows = dbh.execute(f'''
+            SELECT TILENAME, RACMIN, RACMAX, DECCMIN, DECCMAX, CROSSRA0 FROM {self.table}
+        ''').fetchall()
+        self.tilenames = np.array([row[0] for row in rows], dtype=object)
+        self.racmin = np.array([row[1] for row in rows], dtype=float)
+        self.racmax = np.array([row[2] for row in rows], dtype=float)
+        self.decmin = np.array([row[3] for row in rows], dtype=float)
+        self.decmax = np.array([row[4] for row in rows], dtype=float)
+        self.crossra0 = np.array([row[5] == 'Y' for row in rows], dtype=bool)
+        # Tiles crossing RA=0 span [RACMIN - 360, RACMAX]
+        self.racmin[self.crossra0] -= 360
+        cells = []
+        tiles = []
+        for idx in range(len(rows)):
+            rows_idx = np.arange(self.row(self.decmin[idx]), self.row(self.decmax[idx]) + 1)
+            cols_idx = np.arange(math.floor(self.racmin[idx] / self.cell_size),
+                                 math.floor(self.racmax[idx] / self.cell_size) + 1) % self.ncols
+            tile_cells = np.unique((rows_idx[:, None] * self.ncols + cols_idx[None, :]).ravel())
+            cells.append(tile_cells)
+            tiles.append(np.full(len(tile_cells), idx))
+        cells = np.concatenate(cells) if cells else np.array([], dtype=int)
+        tiles = np.concatenate(tiles) if tiles else np.array([], dtype=int)
+        # Candidate tiles of each cell, in table order
+        order = np.lexsort((tiles, cells))
+        self.cell_tiles = tiles[order]
+        self.cell_start = np.searchsorted(cells[order], np.arange(self.nrows * self.ncols + 1))
+        logger.info(f'Loaded {len(rows)} tile footprints from "{self.table}" into the tile index.')
+
+    def row(self, dec):
+        return np.clip(np.floor((np.asarray(dec) + 90) / self.cell_size).astype(int), 0, self.nrows - 1)
+
+    def match(self, ra, dec):
+        '''Return the index of the tile containing each position, or -1 where there is none.'''
+        ra = np.mod(np.asarray(ra, dtype=float), 360)
+        dec = np.asarray(dec, dtype=float)
+        cols = np.floor(ra / self.cell_size).astype(int) % self.ncols
+        cells = self.row(dec) * self.ncols + cols
+        start = self.cell_start[cells]
+        count = self.cell_start[cells + 1] - start
+        matched = np.full(len(ra), -1)
+        for k in range(count.max() if len(count) else 0):
+            pending = np.flatnonzero((matched < 0) & (count > k))
+            candidates = self.cell_tiles[start[pending] + k]
+            # Compare positions to RA=0 crossing tiles on the negative side of the boundary
+            ra_test = np.where(self.crossra0[candidates] & (ra[pending] > 180), ra[pending] - 360, ra[pending])
+            inside = ((ra_test >= self.racmin[candidates]) & (ra_test <= self.racmax[candidates])
+                      & (dec[pending] >= self.decmin[candidates]) & (dec[pending] <= self.decmax[candidates]))
+            matched[pending[inside]] = candidates[inside]
+        return matched
+
+    def find_tilenames_radec(self, ra, dec, dbh):
+        '''Match positions to tiles like fitsfinder.find_tilenames_radec.
+
+        Returns the list of unique matched tilenames in order of first appearance, a dict with
+        the list of position indices of each tilename, and the tilename matched to each
+        position, which is False for positions outside the footprint.
+        '''
+        if not self.loaded:
+            self.load(dbh)
+        matched = self.match(ra, dec)
+        found = np.flatnonzero(matched >= 0)
+        if len(found) < len(matched):
+            logger.warning(f'No tile found for {len(matched) - len(found)} positions.')
+        # Group the position indices by tile, ordering the tiles by their first position
+        order = found[np.argsort(matched[found], kind='stable')]
+        tile_ids, group_start = np.unique(matched[order], return_index=True)
+        groups = np.split(order, group_start[1:]) if len(order) else []
+        groups.sort(key=lambda group: group[0])
+        tilenames = [self.tilenames[matched[group[0]]] for group in groups]
+        indices = {tilename: group.tolist() for tilename, group in zip(tilenames, groups)}
+        tilenames_matched = np.where(matched >= 0, self.tilenames[matched], False).tolist()
+        return tilenames, indices, tilenames_matched
@@ -0,0 +1,109 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.conf import settings
+from .models import Job, JobFile, FileMetric, TileCheckpoint
+from .log import get_logger
+logger = get_logger(__name__)
+
+
+class JobFileUploader:
+    '''Upload finished job output files in the background while the job is still cutting.
+
+    Files are uploaded by a bounded pool of threads and each local copy is deleted once
+    uploaded, which caps the scratch space used by the job. The JobFile records of the uploaded
+    files are created by calling register() from the task thread, because Django database
+    connections are not shared between threads. A tile submitted with a checkpoint is recorded
+    as a TileCheckpoint once all of its files are uploaded and registered.
+    '''
+
+    def __init__(self, s3, job_id, outdir, max_workers=None) -> None:
+        self.s3 = s3
+        self.job_id = job_id
+        self.outdir = outdir
+        self.s3_basepath = os.path.join(settings.S3_BASE_DIR, f'''jobs/{job_id}''')
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or settings.CUTOUT_UPLOAD_WORKERS)
+        self.futures = []
+        self.lock = threading.Lock()
+        # Relative paths and sizes of uploaded files, and the subset not yet registered
+        self.uploaded = []
+        self.unregistered = []
+        # Checkpoints of the submitted tiles whose uploads are not all registered yet
+        self.checkpoints = []
+
+    def submit(self, file_paths, checkpoint=None):
+        '''Upload the files in the background. The checkpoint is a (tilename, files_used) tuple.'''
+        futures = [self.executor.submit(self.upload, file_path) for file_path in file_paths]
+        self.futures.extend(futures)
+        if checkpoint:
+            self.checkpoints.append((checkpoint, futures))
+
+    def upload(self, file_path):
+        rel_path = os.path.relpath(file_path, self.outdir)
+        file_size = os.path.getsize(file_path)
+        self.s3.put_object(path=os.path.join(self.s3_basepath, rel_path), file_path=file_path)
+        os.remove(file_path)
+        with self.lock:
+            self.uploaded.append((rel_path, file_size))
+            self.unregistered.append((rel_path, file_size))
+
+    def register(self):
+        '''Create the JobFile records of the files uploaded since the last call.
+
+        The checkpoints of the tiles whose uploads have all succeeded are recorded afterwards.
+        '''
+        # Find the finished tiles first, so that all of their files are registered below
+        checkpoints = []
+        pending = []
+        for checkpoint, futures in self.checkpoints:
+            if not all([future.done() for future in futures]):
+                pending.append((checkpoint, futures))
+            elif not any([future.exception() for future in futures]):
+                checkpoints.append(checkpoint)
+        self.checkpoints = pending
+        with self.lock:
+            files, self.unregistered = self.unregistered, []
+        if not files and not checkpoints:
+            return
+        job = Job.objects.get(uuid__exact=self.job_id)
+        if files:
+            self.register_files(job, files)
+        if checkpoints:
+            TileCheckpoint.objects.bulk_create([
+                TileCheckpoint(job=job, tilename=tilename, files_used=files_used)
+                for tilename, files_used in checkpoints
+            ], batch_size=settings.JOB_FILE_BATCH_SIZE, ignore_conflicts=True)
+
+    def register_files(self, job, files):
+        # A resumed job may upload again the files of tiles that were not checkpointed
+        if job.resume_count:
+            paths = [os.path.join('/', rel_path) for rel_path, file_size in files]
+            existing = set(JobFile.objects.filter(job=job, path__in=paths).values_list('path', flat=True))
+            files = [(rel_path, file_size) for rel_path, file_size in files
+                     if os.path.join('/', rel_path) not in existing]
+        JobFile.objects.bulk_create([
+            JobFile(job=job, path=os.path.join('/', rel_path), size=file_size)
+            for rel_path, file_size in files
+        ], batch_size=settings.JOB_FILE_BATCH_SIZE)
+        # Record the job file metadata for metrics collection
+        if job.owner:
+            FileMetric.objects.bulk_create([
+                FileMetric(size=file_size, owner=job.owner, file_type=FileMetric.FileType.JOB)
+                for rel_path, file_size in files
+            ], batch_size=settings.JOB_FILE_BATCH_SIZE)
+        logger.debug(f'''Registered {len(files)} uploaded files for job "{self.job_id}"''')
+
+    def flush(self):
+        '''Wait for the submitted uploads to finish, which frees their scratch space.'''
+        wait(self.futures)
+
+    def close(self):
+        '''Wait for all uploads to finish and register them. Raises the first upload error.'''
+        self.executor.shutdown(wait=True)
+        self.register()
+        for future in self.futures:
+            future.result()
+
+    def uploaded_paths(self):
+        with self.lock:
+            return [rel_path for rel_path, file_size in self.uploaded]
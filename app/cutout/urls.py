@@ -13,18 +13,25 @@ handler403 = "cutout.views.error_view"
 
 job_api_router = routers.DefaultRouter()
 job_api_router.register('', views.JobViewSet, basename='job')
+table_api_router = routers.DefaultRouter()
+table_api_router.register('', views.InputTableViewSet, basename='table')
 user_api_router = routers.DefaultRouter()
 user_api_router.register('', views.UserViewSet, basename='user')
 
 api_urlpatterns = [
     path('job/', include(job_api_router.urls)),
+    path('table/', include(table_api_router.urls)),
     path('token/', views.get_token, name='token-api'),
+    re_path(r'^cutout/?$', views.cutout, name='cutout-api'),
 ]
 
 jobfile_detail = views.JobFileDownloadViewSet.as_view({
     'get': 'download',
     'post': 'download',
 })
+job_archive = views.JobFileDownloadViewSet.as_view({
+    'get': 'archive',
+})
 
 urlpatterns = [
     path('', views.HomePageView, name='home'),
@@ -34,6 +41,7 @@ urlpatterns = [
     path('jobs/', login_required(views.job_list), name='jobs-page'),
     path('jobs/<uuid:pk>', login_required(views.JobDetailView.as_view()), name='job-detail-page'),
     path('download/<uuid:job_id>/<path:file_path>', jobfile_detail, name='download-job-file'),
+    path('download/<uuid:job_id>.<str:archive_format>', job_archive, name='download-job-archive'),
     re_path(r"^accounts/", include("django.contrib.auth.urls")),
     path('oidc/', include("mozilla_django_oidc.urls")),
     path('token/', views.CustomAuthToken.as_view(), name='token'),
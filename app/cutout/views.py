@@ -1,12 +1,16 @@
+import asyncio
+import time
 import yaml
 import os
+import re
+import urllib.parse
 from django.http import StreamingHttpResponse
 from django.contrib.auth.decorators import permission_required
 from django.contrib.auth.mixins import UserPassesTestMixin
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, action, permission_classes
 from rest_framework import permissions
 from django.shortcuts import render
 from django.conf import settings
@@ -14,16 +18,29 @@ from django.views.generic import DetailView, ListView
 from rest_framework.permissions import BasePermission
 from django.http import HttpResponseForbidden
 from rest_framework import viewsets, status
-from .models import Job, JobFile
-from .workflows import launch_workflow
-from .serializers import JobSerializer, UserSerializer
+from .models import Job, JobFile, InputTable
+from .workflows import launch_workflow, resume_job
+from .serializers import JobSerializer, JobFileSerializer, UserSerializer, InputTableSerializer
+from .serializers import annotate_file_summary
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 from .object_store import ObjectStore
 from .tasks import process_config
+from .reuse import prepare_job, reuse_job_results
+from .derive import derive_job_config
+from .archive import ARCHIVE_FORMATS, async_stream, filter_job_files, tar_stream, zip_stream
+from .input_table import read_table_preview, table_format_from_name, complete_table_upload
+from .input_table import upload_part_path, uploaded_table_path
 from .tasks_api import revoke_job, delete_job, delete_job_files
 from celery import chain, group
 from .forms import CutoutForm
-from django.http import HttpResponseRedirect, HttpResponseBadRequest
+from django.http import HttpResponseRedirect, HttpResponseBadRequest, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe, parse_etags, quote_etag
+from django.core.cache import cache
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from .coadd_files import DES_BANDS
+from .tasks_sync import cut_position, sync_cutout_key
 from .log import get_logger
 logger = get_logger(__name__)
 
@@ -65,6 +82,21 @@ def get_token(request, format=None):
     return Response(data={'token': token.key})
 
 
+def start_job(new_job, config, df=None):
+    '''Save the processed config of a new job and run it.
+
+    "df" is the coordinate table parsed with the config. The job is completed with the outputs
+    of an identical earlier job if there is one, and otherwise its workflow is launched. Returns
+    an error response if the launch failed.
+    '''
+    new_job.config = config
+    prepare_job(new_job, config, df=df)
+    new_job.save()
+    if reuse_job_results(new_job):
+        return None
+    return launch_workflow(str(new_job.uuid), config)
+
+
 def HomePageView(request):
     context = {
         'title': 'Cutout Service',
@@ -110,6 +142,131 @@ class UserViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdmin]
 
 
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdmin | IsStaff | RunJob])
+def cutout_request(request, format=None):
+    '''Validate a single cutout request and answer it if it does not wait for a worker.
+
+    A POST request is submitted as a job, and the response is the new job with status 202. A
+    GET request is answered with 304 if the "If-None-Match" header has the ETag of the cutout,
+    and otherwise from the cache. If the cutout is not cached, it is requested from a worker of
+    the "sync" queue, and the response carries the pending task as "sync_cutout" for the
+    cutout view to wait for.
+    '''
+    params = request.query_params.copy()
+    if request.method == 'POST':
+        params.update(request.data)
+    image_format = str(params.get('format', 'fits')).lower()
+    try:
+        ra = float(params['ra'])
+        dec = float(params['dec'])
+        size = float(params.get('size', 1))
+        assert -90 <= dec <= 90 and size > 0
+    except (KeyError, ValueError, AssertionError):
+        return Response(status=status.HTTP_400_BAD_REQUEST,
+                        data='Parameters "ra" and "dec" are required, with "dec" between -90 and 90 and "size" > 0')
+    if image_format == 'png':
+        bands = list(params.get('band', ''.join(settings.DEFAULT_CONFIG['colorset'])))
+    else:
+        bands = [params.get('band', 'i')]
+    if image_format not in ['fits', 'png'] or not bands or not set(bands).issubset(DES_BANDS):
+        return Response(status=status.HTTP_400_BAD_REQUEST,
+                        data=f'''"format" must be fits or png, and "band" one of {', '.join(DES_BANDS)}''')
+
+    if request.method == 'POST':
+        new_job = Job.objects.create(name='cutout', owner=request.user)
+        job_id = str(new_job.uuid)
+        config, err_msg, df = process_config({
+            'input_csv': f'RA,DEC,XSIZE,YSIZE\n{ra},{dec},{size},{size}\n',
+            'bands': ','.join(bands),
+        }, job_id=job_id, owner=request.user)
+        if err_msg:
+            new_job.delete()
+            return Response(status=status.HTTP_400_BAD_REQUEST, data=f'''Invalid config: {err_msg}''')
+        response = start_job(new_job, config, df)
+        if response:
+            return response
+        new_job.refresh_from_db()
+        return Response(status=status.HTTP_202_ACCEPTED, data=JobSerializer(new_job, context={'request': request}).data,
+                        headers={'Location': f'/api/job/{job_id}/'})
+    # A GET request has no side effects besides filling the cache
+    if not settings.CUTOUT_SYNC_ENABLED:
+        return Response(status=status.HTTP_400_BAD_REQUEST,
+                        data='Synchronous cutouts are disabled. Submit the cutout as a job with a POST request.')
+    if size > settings.CUTOUT_SYNC_MAX_SIZE:
+        return Response(status=status.HTTP_400_BAD_REQUEST,
+                        data=f'''Cutouts larger than {settings.CUTOUT_SYNC_MAX_SIZE} arcmin must be submitted as '''
+                             '''a job with a POST request.''')
+
+    key = sync_cutout_key(ra, dec, size, bands, image_format)
+    # The key covers the cutter version, so the cutout of a key does not change
+    headers = {
+        'Cache-Control': f'private, max-age={settings.CUTOUT_SYNC_CACHE_TTL}',
+        'ETag': quote_etag(key.split(':')[-1]),
+    }
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (headers['ETag'] in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        return HttpResponseNotModified(headers=headers)
+    cached = cache.get(key)
+    if cached is not None:
+        return sync_cutout_response(cached, image_format, headers)
+    response = Response(status=status.HTTP_202_ACCEPTED)
+    response.sync_cutout = (key, image_format, headers, cut_position.delay(key, ra, dec, size, bands, image_format))
+    return response
+
+
+def sync_cutout_response(cached, image_format, headers):
+    filename, content = cached
+    response = HttpResponse(content, content_type='image/png' if image_format == 'png' else 'application/fits',
+                            headers=headers)
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    return response
+
+
+@csrf_exempt
+async def cutout(request, format=None):
+    '''Return a single cutout of at most CUTOUT_SYNC_MAX_SIZE arcmin, or submit a cutout as a job.
+
+    Query parameters are "ra", "dec", "size" in arcmin (default 1), "band" (default "i") and
+    "format", either "fits" or "png". A color image uses the bands of "band" as the color set,
+    for example "irg". A GET request returns the cutout, which is created by a worker of the
+    "sync" queue or found in the cache. A POST request with the same parameters submits the
+    cutout as a job, and the response is the new job with status 202.
+
+    The request is authorized and validated by cutout_request. The task result is then polled
+    without holding a thread, so that waiting requests do not block the API server.
+    '''
+    response = await sync_to_async(cutout_request)(request, format=format)
+    if not hasattr(response, 'sync_cutout'):
+        return response
+    key, image_format, headers, result = response.sync_cutout
+    deadline = time.monotonic() + settings.CUTOUT_SYNC_TIMEOUT
+    while not await sync_to_async(result.ready, thread_sensitive=False)():
+        if time.monotonic() >= deadline:
+            return HttpResponse(status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                content='The cutout was not created in time. Try again or submit a job.')
+        await asyncio.sleep(settings.CUTOUT_SYNC_POLL_INTERVAL)
+    if await sync_to_async(result.failed, thread_sensitive=False)():
+        logger.error(f'''Synchronous cutout task {result.id} failed: {result.result!r}''')
+        return HttpResponse(status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            content='The cutout could not be created. Try again or submit a job.')
+    err_msg = result.result
+    if err_msg:
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND, content=err_msg)
+    cached = await cache.aget(key)
+    if cached is None:
+        return HttpResponse(status=status.HTTP_503_SERVICE_UNAVAILABLE, content='The cutout is not available.')
+    return sync_cutout_response(cached, image_format, headers)
+
+
+class JobFilePagination(CursorPagination):
+    '''Cursor pagination of job files, which reads each page with an index range scan however deep it is.'''
+    ordering = 'id'
+    page_size = settings.JOB_FILE_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.JOB_FILE_MAX_PAGE_SIZE
+
+
 class JobViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows jobs to be viewed or edited.
@@ -120,7 +277,9 @@ class JobViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         queryset = Job.objects.filter(owner__exact=self.request.user)
-        return queryset
+        if self.action == 'files':
+            return queryset
+        return annotate_file_summary(queryset)
 
     def perform_create(self, serializer):
         serializer.is_valid(raise_exception=True)
@@ -135,7 +294,7 @@ class JobViewSet(viewsets.ModelViewSet):
         job_name = new_job_data['name']
         new_job = Job.objects.get(uuid__exact=job_id)
         # Process the config and update the job record
-        config, err_msg = process_config(new_job_data['config'])
+        config, err_msg, df = process_config(new_job_data['config'], job_id=job_id, owner=request.user)
         try:
             assert not err_msg
         except AssertionError:
@@ -146,14 +305,12 @@ class JobViewSet(viewsets.ModelViewSet):
             )
             new_job.delete()
             return response
-        new_job.config = config
-        new_job.save()
-        # Launch workflow as async Celery tasks
-        logger.debug(f'''Job info: {response.data}''')
         logger.debug(f'''Launching Celery task for workflow "{job_name}"...''')
-        updated_response = launch_workflow(job_id, config)
+        updated_response = start_job(new_job, config, df)
         if updated_response:
-            response = updated_response
+            return updated_response
+        response.data['estimate'] = new_job.estimate
+        response.data['status'] = new_job.status
         return response
 
     def destroy(self, request, pk=None, *args, **kwargs):
@@ -174,6 +331,8 @@ class JobViewSet(viewsets.ModelViewSet):
                 response.status_code = status.HTTP_403_FORBIDDEN
                 return response
         logger.info(f'''Deleting job "{job_id}"...''')
+        # Mark the job as revoked, so that the failure of its terminated tasks does not resume it
+        job.update(status=Job.JobStatus.REVOKED, error_info='Job deleted.')
         # Delete job record from database and delete job files
         # after revoking workflow tasks using async Celery tasks
         delete_chain = chain(
@@ -186,11 +345,140 @@ class JobViewSet(viewsets.ModelViewSet):
         delete_chain.delay()
         return response
 
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        '''Resume a failed job, skipping the tiles it completed before it was interrupted.'''
+        job = self.get_object()
+        err_msg = resume_job(str(job.uuid))
+        if err_msg:
+            return Response(status=status.HTTP_409_CONFLICT, data=err_msg)
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data)
+
+    @action(detail=True, methods=['post'])
+    def derive(self, request, pk=None):
+        '''Create a job from a finished job and a config delta that changes the bands or adds positions.
+
+        The derived job reuses the tile assignments and the outputs of the parent job, and only
+        cuts the new combinations of position and band.
+        '''
+        parent = self.get_object()
+        if parent.status != Job.JobStatus.SUCCESS:
+            return Response(status=status.HTTP_409_CONFLICT,
+                            data=f'Only successful jobs can be derived. Job status: {parent.status}')
+        new_job = Job.objects.create(
+            name=request.data.get('name', parent.name),
+            description=request.data.get('description', parent.description),
+            owner=request.user,
+        )
+        job_id = str(new_job.uuid)
+        config, err_msg, df = derive_job_config(s3, parent, request.data.get('config', {}), job_id)
+        if err_msg:
+            logger.error(f'''Invalid config delta: {err_msg}''')
+            new_job.delete()
+            return Response(status=status.HTTP_400_BAD_REQUEST, data=f'''Invalid config delta: {err_msg}''')
+        logger.debug(f'''Launching Celery task for job "{job_id}" derived from job "{parent.uuid}"...''')
+        response = start_job(new_job, config, df)
+        if response:
+            return response
+        new_job.refresh_from_db()
+        return Response(status=status.HTTP_201_CREATED, data=self.get_serializer(new_job).data)
+
+    @action(detail=True, methods=['get'], serializer_class=JobFileSerializer, pagination_class=JobFilePagination)
+    def files(self, request, pk=None):
+        '''List the paths and sizes of the files of a job, in pages linked by "next" cursors.'''
+        job = self.get_object()
+        page = self.paginate_queryset(JobFile.objects.filter(job=job))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+
+class InputTableViewSet(viewsets.ModelViewSet):
+    """
+    API endpoint for uploading coordinate tables (CSV, FITS or Parquet) used by cutout jobs.
+
+    POST a multipart "file" to upload a table in one request, or POST only the "name" and
+    "format" to start a resumable upload. Send the table in chunks with PUT requests whose
+    "Content-Range: bytes START-END/TOTAL" header starts at the "size" already received, and
+    the upload completes with the final chunk (or a POST to "complete/" if the total is "*").
+    A job references a ready table with {"input_table": "<uuid>"} in its config.
+    """
+    serializer_class = InputTableSerializer
+    permission_classes = [IsAdmin | IsStaff | RunJob]
+    http_method_names = ['get', 'post', 'put', 'delete', 'head', 'options']
+
+    def get_queryset(self):
+        return InputTable.objects.filter(owner__exact=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        name = request.data.get('name', upload.name if upload else '')
+        table = InputTable.objects.create(
+            owner=request.user,
+            name=name,
+            format=request.data.get('format', table_format_from_name(name)),
+        )
+        if upload:
+            if upload.size > settings.INPUT_TABLE_MAX_SIZE:
+                table.delete()
+                return Response(status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                data=f'Table size exceeds {settings.INPUT_TABLE_MAX_SIZE} bytes.')
+            s3.put_stream(upload_part_path(table.uuid, 0), upload, upload.size)
+            table.size = upload.size
+            table.save()
+            return self.complete_upload(table, request.data.get('checksum', ''))
+        return Response(status=status.HTTP_201_CREATED, data=self.get_serializer(table).data)
+
+    def update(self, request, pk=None, *args, **kwargs):
+        table = self.get_object()
+        match = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+|\*)', request.headers.get('Content-Range', ''))
+        if not match:
+            return Response(status=status.HTTP_400_BAD_REQUEST,
+                            data='A "Content-Range: bytes START-END/TOTAL" header is required.')
+        start, end = int(match.group(1)), int(match.group(2))
+        total = None if match.group(3) == '*' else int(match.group(3))
+        length = end - start + 1
+        if table.status != InputTable.TableStatus.UPLOADING or start != table.size:
+            # The client resumes from the size already received
+            return Response(status=status.HTTP_409_CONFLICT, data=self.get_serializer(table).data)
+        if length <= 0 or length != int(request.headers.get('Content-Length', 0)):
+            return Response(status=status.HTTP_400_BAD_REQUEST,
+                            data='The Content-Range does not match the Content-Length.')
+        if end >= settings.INPUT_TABLE_MAX_SIZE:
+            return Response(status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            data=f'Table size exceeds {settings.INPUT_TABLE_MAX_SIZE} bytes.')
+        s3.put_stream(upload_part_path(table.uuid, start), request.stream, length)
+        # Only one of concurrent requests for the same chunk advances the upload
+        if not InputTable.objects.filter(uuid__exact=table.uuid, size=start).update(size=end + 1):
+            table.refresh_from_db()
+            return Response(status=status.HTTP_409_CONFLICT, data=self.get_serializer(table).data)
+        table.refresh_from_db()
+        if total is not None and end + 1 >= total:
+            return self.complete_upload(table, request.headers.get('Upload-Checksum', ''))
+        return Response(data=self.get_serializer(table).data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        table = self.get_object()
+        if table.status != InputTable.TableStatus.UPLOADING:
+            return Response(status=status.HTTP_409_CONFLICT, data=self.get_serializer(table).data)
+        return self.complete_upload(table, request.data.get('checksum', ''))
+
+    def complete_upload(self, table, checksum):
+        err_msg = complete_table_upload(s3, table, checksum=checksum)
+        if err_msg:
+            return Response(status=status.HTTP_400_BAD_REQUEST, data=self.get_serializer(table).data)
+        return Response(status=status.HTTP_201_CREATED, data=self.get_serializer(table).data)
+
+    def destroy(self, request, pk=None, *args, **kwargs):
+        table = self.get_object()
+        s3.delete_directory(uploaded_table_path(table.uuid))
+        table.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 @permission_required("cutout.run_job", raise_exception=True)
 def job_list(request):
-    jobs = Job.objects.filter(owner__exact=request.user)
-    logger.debug(jobs)
+    jobs = Job.objects.filter(owner__exact=request.user).select_related('owner')
     token, created = Token.objects.get_or_create(user=request.user)
     context = {
         'job_list': jobs,
@@ -218,29 +506,27 @@ def cutout_form(request):
                 owner=request.user,
             )
             job_id = str(new_job.uuid)
-            input_csv = form.cleaned_data['input_csv'].replace('\r\n', '\n')
+            input_csv = form.cleaned_data['input_csv']
             xsize = form.cleaned_data['xsize']
             ysize = form.cleaned_data['ysize']
             bands = form.cleaned_data['bands']
             # colorset = form.cleaned_data['colorset']
-            config, err_msg = process_config(config={
+            config, err_msg, df = process_config(config={
                 'input_csv': input_csv,
                 'xsize': xsize,
                 'ysize': ysize,
                 'bands': bands,
                 # 'colorset': colorset,
-            })
+            }, job_id=job_id, df=form.cleaned_data['input_df'])
             try:
                 assert not err_msg
             except AssertionError:
                 logger.error(f'''Invalid config: {err_msg}''')
                 new_job.delete()
                 return HttpResponseBadRequest(content=f'''Invalid config: {err_msg}''')
-            new_job.config = config
-            new_job.save()
             # Launch workflow as async Celery tasks
             logger.debug(f'''Launching Celery task for workflow "{name}"...''')
-            response = launch_workflow(job_id, config)
+            response = start_job(new_job, config, df)
             if response:
                 return HttpResponseBadRequest(content=response.data)
             return HttpResponseRedirect(f'''/jobs/{job_id}''')
@@ -266,26 +552,38 @@ class JobDetailView(DetailView):
         job_id = self.kwargs['pk']
         # context["files"] = JobFile.objects.filter(job__owner__exact=self.request.user,
         #                                           job__uuid__exact=self.kwargs['pk'])
-        context["files"] = JobFile.objects.filter(job__uuid__exact=job_id)
-        # Construct bulk download script
-        file_info = []
+        # Only list the first files of large jobs, which are downloaded as an archive
+        job_files = JobFile.objects.filter(job__uuid__exact=job_id)
+        context["file_count"] = job_files.count()
+        context["files"] = job_files.order_by('id')[:settings.JOB_DETAIL_MAX_FILES]
+        # Construct bulk download script. If the proxy or the object store serves the job files, the
+        # script downloads each file, so that no API server worker is busy for the whole download.
+        # Otherwise it downloads all the job files in a single archive.
         port = '' if settings.HOSTNAMES[0] != 'localhost' else f':{settings.API_PROXY_PORT}'
         protocol = 'https' if settings.HOSTNAMES[0] != 'localhost' else 'http'
-        for file in context["files"]:
-            file_info.append({
-                'url': f'''{protocol}://{settings.HOSTNAMES[0]}{port}/download/{job_id}/{file.path.strip('/')}''',
-                'path': file.path.strip('/'),
-            })
         script_context = {
             'job_id': job_id,
-            'file_info': file_info,
+            'download_url': f'''{protocol}://{settings.HOSTNAMES[0]}{port}/download/{job_id}''',
         }
+        if settings.JOB_FILE_DOWNLOAD_MODE in ['accel', 'presigned']:
+            script_context['file_paths'] = [path.strip('/') for path in job_files.order_by('id').values_list(
+                'path', flat=True).iterator()]
         from django.template.loader import render_to_string
         jobfile_download_script = render_to_string('cutout/jobfile_download.sh', script_context, request=None)
         context['jobfile_download_script'] = jobfile_download_script
         # The apparent double-newline in the CSV text rendering is not actually a bug;
         # this is how a single newline renders when using single-quotes.
-        context["coords"] = self.object.config.pop('coords')
+        context["coords"] = self.object.config.pop('coords', '')
+        if self.object.config.get('input_table'):
+            # Show the start of the stored coordinate table
+            try:
+                df, rows = read_table_preview(s3, self.object.config['input_table']['path'],
+                                              settings.JOB_DETAIL_MAX_COORDS)
+                context["coords"] = df.to_csv(index=False)
+                if rows > settings.JOB_DETAIL_MAX_COORDS:
+                    context["coords"] += f'... ({rows} rows)\n'
+            except Exception as err:
+                logger.error(f'''Error reading coordinate table: {err}''')
         for filtered_key in ['prefix']:
             self.object.config.pop(filtered_key)
         self.object.config['logfile'] = '/cutout.log'
@@ -294,6 +592,26 @@ class JobDetailView(DetailView):
         return context
 
 
+def parse_byte_range(header, size):
+    '''Return the first and last byte of a single byte range "Range" header.
+
+    Returns None if the header is not a single byte range, which is answered with the whole
+    file, and False if the range cannot be satisfied.
+    '''
+    match = re.fullmatch(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*', header)
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    if match.group(1) == '':
+        # The last bytes of the file
+        start, end = max(0, size - int(match.group(2))), size - 1
+    else:
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
 class JobFileDownloadViewSet(viewsets.ViewSet):
 
     # permission_classes = [IsAdmin | IsStaff | RunJob]
@@ -306,13 +624,83 @@ class JobFileDownloadViewSet(viewsets.ViewSet):
         file_path = os.path.join('/', file_path)
         response = Response()
         job_file = JobFile.objects.filter(job__uuid__exact=job_id,
-                                          path__exact=file_path)
+                                          path__exact=file_path).select_related('job')
         if not job_file:
             response.data = f'File "{file_path}" not found for job {job_id}.'
             response.status_code = status.HTTP_404_NOT_FOUND
             return response
         job_file = job_file[0]
-        obj_stream = s3.stream_object(obj_key)
-        response = StreamingHttpResponse(streaming_content=obj_stream)
-        response['Content-Disposition'] = 'attachment; filename="%s"' % os.path.basename(file_path)
+        filename = os.path.basename(file_path)
+        # The outputs of a finished job do not change
+        cache_control = ('private, max-age=31536000, immutable' if job_file.job.status == Job.JobStatus.SUCCESS
+                         else 'private, no-cache')
+        # Only authorize the download and let the proxy or the object store serve the file
+        if settings.JOB_FILE_DOWNLOAD_MODE in ['accel', 'presigned']:
+            url = s3.presigned_get_url(obj_key, expires=settings.JOB_FILE_DOWNLOAD_URL_EXPIRES, filename=filename,
+                                       external=settings.JOB_FILE_DOWNLOAD_MODE == 'presigned')
+            if settings.JOB_FILE_DOWNLOAD_MODE == 'presigned':
+                return HttpResponseRedirect(url)
+            url = urllib.parse.urlsplit(url)
+            response = HttpResponse(content_type='application/octet-stream')
+            response['X-Accel-Redirect'] = f'{settings.JOB_FILE_ACCEL_LOCATION}{url.path}?{url.query}'
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            response['Cache-Control'] = cache_control
+            return response
+        # Answer conditional and range requests with the object metadata
+        stat = s3.stat_object(obj_key)
+        etag = quote_etag(stat.etag)
+        last_modified = int(stat.last_modified.timestamp())
+        headers = {
+            'ETag': etag,
+            'Last-Modified': http_date(last_modified),
+            'Accept-Ranges': 'bytes',
+            'Cache-Control': cache_control,
+        }
+        if_none_match = request.headers.get('If-None-Match')
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        if ((if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'))
+                or (not if_none_match and if_modified_since and last_modified <= if_modified_since)):
+            return HttpResponseNotModified(headers=headers)
+        byte_range = None
+        if_range = request.headers.get('If-Range', etag)
+        if request.headers.get('Range') and if_range in [etag, headers['Last-Modified']]:
+            byte_range = parse_byte_range(request.headers['Range'], stat.size)
+            if byte_range is False:
+                return HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                                    headers={'Content-Range': f'bytes */{stat.size}'})
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(streaming_content=s3.stream_object(obj_key, offset=start,
+                                                                                length=end - start + 1),
+                                             status=status.HTTP_206_PARTIAL_CONTENT, headers=headers)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.size}'
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            response = StreamingHttpResponse(streaming_content=s3.stream_object(obj_key), headers=headers)
+            response['Content-Length'] = str(stat.size)
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+        return response
+
+    def archive(self, request, job_id=None, archive_format='tar', *args, **kwargs):
+        '''Stream the job files, or those selected by the "band" and "type" parameters, as a tar or zip archive.
+
+        The archive is assembled from the object store streams while it is sent, and the files
+        are in a folder named after the job.
+        '''
+        job_id = str(job_id)
+        job = Job.objects.filter(uuid__exact=job_id).first()
+        if not job or archive_format not in ARCHIVE_FORMATS:
+            return Response(status=status.HTTP_404_NOT_FOUND, data=f'Job {job_id} archive not found.')
+        job_files = filter_job_files(JobFile.objects.filter(job=job).order_by('path').values_list('path', 'size'),
+                                     bands=request.query_params.get('band', ''),
+                                     file_types=request.query_params.get('type', ''))
+        s3_basepath = os.path.join(settings.S3_BASE_DIR, 'jobs', job_id)
+        entries = [(os.path.join(job_id, path.strip('/')), os.path.join(s3_basepath, path.strip('/')), size)
+                   for path, size in job_files]
+        stream = tar_stream if archive_format == 'tar' else zip_stream
+        # The API server runs under ASGI, which sends asynchronous content as it is generated
+        response = StreamingHttpResponse(
+            streaming_content=async_stream(stream(entries, s3.stream_object, mtime=int(job.modified.timestamp()))),
+            content_type='application/x-tar' if archive_format == 'tar' else 'application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{job_id}.{archive_format}"'
         return response
@@ -5,9 +5,14 @@ import yaml
 from .models import Job, JobMetric
 from .models import update_job_state
 from celery import shared_task
-from .tasks import generate_cutouts
+from celery.exceptions import SoftTimeLimitExceeded, TimeLimitExceeded, WorkerLostError
+from django.db import OperationalError
+import urllib3
+from django.db.models import F
+from .tasks import generate_cutouts, generate_derived_cutouts, plan_cutouts, plan_cutout_chunks
 from django.conf import settings
 from .object_store import ObjectStore
+from .scratch import ScratchSpace
 from datetime import datetime, timezone
 from rest_framework.response import Response
 from rest_framework import status
@@ -17,11 +22,20 @@ logger = get_logger(__name__)
 s3 = ObjectStore()
 
 
-def launch_workflow(job_id, config):
+def launch_workflow(job_id, config, dispatch=False):
+    '''Start the job workflow, or queue the job for the fair-share dispatcher if it is enabled.
+
+    The dispatcher starts the queued jobs with dispatch set.
+    '''
     response = None
     try:
-        # Launch workflow with validated config
-        run_workflow(job_id, config)
+        if settings.CUTOUT_FAIR_SHARE_ENABLED and not dispatch:
+            Job.objects.filter(uuid__exact=job_id).update(
+                status=Job.JobStatus.PENDING, queued=datetime.now(timezone.utc))
+            dispatch_queued_jobs()
+        else:
+            # Launch workflow with validated config
+            run_workflow(job_id, config)
     except Exception as err:
         err_msg = f'Failed to launch workflow: {err}'
         logger.error(err_msg)
@@ -34,6 +48,32 @@ def launch_workflow(job_id, config):
     return response
 
 
+def dispatch_queued_jobs():
+    '''Trigger the fair-share dispatcher, which starts queued jobs if there is capacity.'''
+    if settings.CUTOUT_FAIR_SHARE_ENABLED:
+        # Imported here because the dispatcher depends on this module
+        from .tasks_system import dispatch_jobs
+        dispatch_jobs.delay()
+
+
+def resume_job(job_id):
+    '''Run the workflow of a failed job again, skipping the tiles it has already completed.
+
+    Returns an error message, which is empty if the job was resumed.
+    '''
+    # Claim the failed job atomically, so that it is resumed only once
+    job = Job.objects.filter(uuid__exact=job_id).first()
+    if not job:
+        return f'Job {job_id} not found.'
+    resumed = Job.objects.filter(uuid__exact=job_id, status=Job.JobStatus.FAILURE).update(
+        resume_count=F('resume_count') + 1, error_info='')
+    if not resumed:
+        return f'Only failed jobs can be resumed. Job status: {job.status}'
+    logger.info(f'''Resuming job "{job_id}"...''')
+    response = launch_workflow(job_id, job.config)
+    return response.data if response else ''
+
+
 def run_workflow(job_id, config) -> None:
     def find_task_ids(tasks_obj, task_ids=None):
         if task_ids is None:
@@ -51,10 +91,25 @@ def run_workflow(job_id, config) -> None:
 
     # Define workflow
     logger.debug(f'job_id: {job_id}')
+    # Send the job tasks to the queue selected by the job cost estimate
+    job = Job.objects.get(uuid__exact=job_id)
+    queue = job.estimate.get('queue', settings.CUTOUT_QUEUE_STANDARD)
+    input_rows = (config.get('input_table') or {}).get('rows', 0)
+    if config.get('derived_from'):
+        # Reuse the tile assignments and outputs of the parent job
+        cutout_task = generate_derived_cutouts.si(job_id=job_id, config=config).set(task_id=job_id, queue=queue)
+    elif settings.CUTOUT_CHUNK_ROWS and input_rows > settings.CUTOUT_CHUNK_ROWS:
+        # Split the oversized table into chunks of whole tiles processed in parallel subtasks
+        cutout_task = plan_cutout_chunks.si(job_id=job_id, config=config).set(task_id=job_id, queue=queue)
+    elif settings.CUTOUT_WORKFLOW_MODE == 'fanout':
+        # Plan the tiles and process them in parallel subtasks
+        cutout_task = plan_cutouts.si(job_id=job_id, config=config).set(task_id=job_id, queue=queue)
+    else:
+        cutout_task = generate_cutouts.si(job_id=job_id, config=config).set(task_id=job_id, queue=queue)
     workflow = chain(
-        workflow_init.si(job_id=job_id, config=config),
-        generate_cutouts.si(job_id=job_id, config=config).set(task_id=job_id),
-        workflow_complete.si(job_id=job_id),
+        workflow_init.si(job_id=job_id, config=config).set(queue=queue),
+        cutout_task,
+        workflow_complete.si(job_id=job_id).set(queue=queue),
     )
     # Mark job status as STARTED
     update_job_state(job_id, Job.JobStatus.STARTED)
@@ -67,16 +122,20 @@ def run_workflow(job_id, config) -> None:
     workflow_task_ids = find_task_ids(workflow.tasks)
     logger.debug('Workflow task_ids:')
     logger.debug(json.dumps(workflow_task_ids, indent=2))
-    job = Job.objects.get(uuid__exact=job_id)
+    job.refresh_from_db()
     job.task_ids = workflow_task_ids
+    job.started = datetime.now(timezone.utc)
     job.save()
 
 
 @shared_task(name='Workflow Init')
 def workflow_init(job_id: str = '', config: dict = {}):
-    # wait_for_free_space()
-    # If enough scratch space is available, mark job status as STARTED
+    # Scratch space is reserved by the tasks that write the job output, on the node where they run
     update_job_state(job_id, Job.JobStatus.STARTED)
+    write_job_metadata(job_id, config)
+
+
+def write_job_metadata(job_id, config):
     # Write workflow config to output folder
     s3_basepath = os.path.join(
         settings.S3_BASE_DIR,
@@ -102,6 +161,7 @@ def workflow_init(job_id: str = '', config: dict = {}):
 @shared_task(name='Workflow Complete')
 def workflow_complete(job_id=''):
     logger.info(f'''Workflow for job "{job_id}" completed successfully.''')
+    ScratchSpace().cleanup(job_id)
     # Set workflow status to success
     update_job_state(job_id, Job.JobStatus.SUCCESS)
     # Record the job metadata for metrics collection
@@ -111,6 +171,18 @@ def workflow_complete(job_id=''):
         owner=job.owner,
         config=job.config,
     )
+    # Start the next queued jobs now that this one is done
+    dispatch_queued_jobs()
+
+
+def is_transient_error(exc):
+    '''Return True if a task failed because of its environment rather than its job.
+
+    Running the job again may succeed after a lost worker, a time limit or a connection error,
+    but not after an invalid config, invalid job data or a scratch volume that stayed full.
+    '''
+    return isinstance(exc, (WorkerLostError, TimeLimitExceeded, SoftTimeLimitExceeded, ConnectionError, TimeoutError,
+                            urllib3.exceptions.HTTPError, OperationalError))
 
 
 @shared_task(name='Workflow Job Error Handler')
@@ -118,3 +190,19 @@ def wf_error_handler(request, exc, traceback, job_id):
     logger.error(f'''Workflow error! Celery task ID: {request.id}, job ID: {job_id}''')
     logger.error(f'''exc: {exc}''')
     logger.error(f'''traceback: {traceback}''')
+    ScratchSpace().cleanup(job_id)
+    dispatch_queued_jobs()
+    # Resume jobs interrupted by a lost worker, a time limit or another transient error
+    if not is_transient_error(exc):
+        return
+    job = Job.objects.filter(uuid__exact=job_id).first()
+    if job and job.resume_count < settings.CUTOUT_JOB_AUTO_RESUMES:
+        logger.info(f'''Resuming job "{job_id}" in {settings.CUTOUT_JOB_RESUME_DELAY} seconds...''')
+        auto_resume_job.apply_async(args=[job_id], countdown=settings.CUTOUT_JOB_RESUME_DELAY)
+
+
+@shared_task(name='Auto Resume Job')
+def auto_resume_job(job_id):
+    err_msg = resume_job(job_id)
+    if err_msg:
+        logger.info(f'''Job "{job_id}" was not resumed: {err_msg}''')
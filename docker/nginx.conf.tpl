@@ -20,6 +20,17 @@ http {
       # Use the Docker embedded DNS server:
       resolver 127.0.0.11;
     }
+    # Job files authorized by the API server with an X-Accel-Redirect to a presigned object URL
+    location /_object_store/ {
+      internal;
+      proxy_pass ${S3_ENDPOINT_URL}/;
+      proxy_http_version 1.1;
+      proxy_ssl_server_name on;
+      # The presigned URL is the only credential sent to the object store
+      proxy_set_header Authorization "";
+      proxy_set_header Cookie "";
+      proxy_buffering off;
+    }
     location / {
       proxy_pass http://${API_SERVER_HOST}:${API_SERVER_PORT}/;
       # Set `proxy_set_header Host` so that the OIDC callback will look like 
@@ -0,0 +1,97 @@
+'''Benchmark the database cost and latency of the hot API endpoints and web pages.
+
+Seeds a user with realistic numbers of jobs and job files into a new test database, sends each
+request repeatedly with an in-memory object store and without Celery, and reports the largest
+number of SQL queries and the p50 and p95 latencies of each endpoint. Exits with an error if an
+endpoint exceeds its query limit, or with "--baseline" if it is slower than the given earlier
+results by more than "--tolerance". Run it with the database settings of the deployment under
+test, for example a local PostgreSQL server:
+
+    DATABASE_HOST=127.0.0.1 python scripts/benchmark_api.py --jobs 2000 --files 200 --output results.json
+    DATABASE_HOST=127.0.0.1 python scripts/benchmark_api.py --jobs 2000 --files 200 --baseline results.json
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+# Append the Cutout API module to the Python path for import
+sys.path.append(os.path.join(str(Path(__file__).resolve().parent.parent), 'app'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cutout.settings')
+import django  # noqa: E402
+django.setup()
+from django.contrib.auth.models import User, Permission  # noqa: E402
+from django.test.utils import setup_test_environment, override_settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+from cutout.tests.api_benchmark import MemoryObjectStore, benchmark_environment, seed_jobs  # noqa: E402
+from cutout.tests.api_benchmark import run_benchmark, query_limit_violations, ENDPOINT_QUERY_LIMITS  # noqa: E402
+
+
+def latency_regressions(results, baseline, tolerance):
+    '''Return a message for each endpoint whose p95 latency exceeds the baseline by more than "tolerance".'''
+    return [f'{name}: p95 {result["p95_ms"]:.1f} ms, baseline {baseline[name]["p95_ms"]:.1f} ms'
+            for name, result in results.items()
+            if name in baseline and result['p95_ms'] > (1 + tolerance) * baseline[name]['p95_ms']]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the query counts and latencies of the API endpoints.')
+    parser.add_argument('--jobs', type=int, default=2000, help='number of jobs of the benchmark user')
+    parser.add_argument('--files', type=int, default=200, help='number of files of each job')
+    parser.add_argument('--repeat', type=int, default=20, help='number of requests per endpoint')
+    parser.add_argument('--output', default='', help='JSON file to write the results to')
+    parser.add_argument('--baseline', default='', help='JSON file of earlier results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='allowed relative increase of the p95 latencies over the baseline')
+    parser.add_argument('--keepdb', action='store_true', help='keep the test database and its seeded data')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    # Never seed the data into the database of a deployment
+    db_name = connection.creation.create_test_db(verbosity=0, keepdb=args.keepdb)
+    try:
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                               CUTOUT_FAIR_SHARE_ENABLED=False, CUTOUT_JOB_REUSE_ENABLED=False,
+                               JOB_FILE_DOWNLOAD_MODE='stream'):
+            store = MemoryObjectStore()
+            with benchmark_environment(store):
+                user, created = User.objects.get_or_create(username='benchmark')
+                user.user_permissions.add(Permission.objects.get(codename='run_job'))
+                jobs = list(user.job_set.all())
+                if not jobs:
+                    t0 = time.time()
+                    jobs = seed_jobs(user, args.jobs, args.files)
+                    print(f'Seeded {len(jobs)} jobs with {len(jobs) * args.files} files in {time.time() - t0:.1f} s')
+                client = APIClient()
+                client.force_login(user)
+                results = run_benchmark(client, jobs[0], store, repeat=args.repeat)
+    finally:
+        connection.creation.destroy_test_db(db_name, verbosity=0, keepdb=args.keepdb)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)['results']
+    print(f'{"endpoint":16s} {"queries":>8s} {"limit":>6s} {"p50 ms":>9s} {"p95 ms":>9s} {"baseline p95":>13s}')
+    for name, result in results.items():
+        baseline_p95 = f'{baseline[name]["p95_ms"]:13.1f}' if name in baseline else f'{"":13s}'
+        print(f'{name:16s} {result["queries"]:8d} {ENDPOINT_QUERY_LIMITS[name]:6d} '
+              f'{result["p50_ms"]:9.1f} {result["p95_ms"]:9.1f} {baseline_p95}')
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump({
+                'jobs': args.jobs,
+                'files': args.files,
+                'database': connection.vendor,
+                'results': results,
+            }, fp, indent=2)
+    errors = query_limit_violations(results) + latency_regressions(results, baseline, args.tolerance)
+    if errors:
+        sys.exit('\n'.join(errors))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+'''Benchmark ObjectStore.store_folder against an S3-compatible server.
+
+Creates a folder of random files that resembles a job output folder and uploads it with
+increasing numbers of concurrent uploads. Point the S3_ENDPOINT_URL, AWS_S3_ACCESS_KEY_ID,
+AWS_S3_SECRET_ACCESS_KEY and S3_BUCKET environment variables at a disposable bucket, for
+example a local MinIO server or "moto_server":
+
+    moto_server -p 9000 &
+    S3_ENDPOINT_URL=http://127.0.0.1:9000 AWS_S3_ACCESS_KEY_ID=test \\
+        AWS_S3_SECRET_ACCESS_KEY=test python scripts/benchmark_store_folder.py
+
+A local server answers each request in well under a millisecond, so uploads one at a time
+are nearly as fast as concurrent ones. Each request is therefore delayed by "--latency"
+milliseconds (default 20), like the round trip to a remote object store. Set it to 0 to
+measure the server as it is.
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+# Append the Cutout API module to the Python path for import
+sys.path.append(os.path.join(str(Path(__file__).resolve().parent.parent), 'app'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+from cutout.object_store import ObjectStore  # pyright: ignore[reportMissingImports]
+
+
+def inject_latency(s3, latency):
+    '''Delay every request of the object store client by "latency" seconds.'''
+    http_client = s3.client._http
+    urlopen = http_client.urlopen
+
+    def delayed_urlopen(*args, **kwargs):
+        time.sleep(latency)
+        return urlopen(*args, **kwargs)
+    http_client.urlopen = delayed_urlopen
+
+
+def create_files(src_dir, num_files, file_size, num_large, large_file_size):
+    for idx in range(num_files):
+        with open(os.path.join(src_dir, f'DES0000+0000_{idx:05d}_g.fits'), 'wb') as fp:
+            fp.write(os.urandom(file_size))
+    for idx in range(num_large):
+        with open(os.path.join(src_dir, f'DES0000+0000_{idx:05d}_large.fits'), 'wb') as fp:
+            fp.write(os.urandom(large_file_size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark concurrent uploads of a job folder.')
+    parser.add_argument('--files', type=int, default=500, help='number of small files')
+    parser.add_argument('--file-size', type=int, default=256 * 1024, help='size of the small files in bytes')
+    parser.add_argument('--large-files', type=int, default=2, help='number of multipart files')
+    parser.add_argument('--large-file-size', type=int, default=64 * 1024 * 1024,
+                        help='size of the multipart files in bytes')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16],
+                        help='numbers of concurrent uploads to compare')
+    parser.add_argument('--latency', type=float, default=20, help='delay added to each request in milliseconds')
+    args = parser.parse_args()
+
+    if not ObjectStore().client:
+        sys.exit('The object store endpoint is not configured.')
+    with tempfile.TemporaryDirectory() as src_dir:
+        create_files(src_dir, args.files, args.file_size, args.large_files, args.large_file_size)
+        total_size = sum([entry.stat().st_size for entry in os.scandir(src_dir)])
+        print(f'{args.files + args.large_files} files, {total_size / 1024**2:.1f} MiB, '
+              f'{args.latency:.0f} ms latency per request')
+        baseline = None
+        for max_workers in args.workers:
+            # Multipart uploads use the same number of parallel parts as concurrent files
+            os.environ['S3_UPLOAD_CONCURRENCY'] = str(max_workers)
+            s3 = ObjectStore()
+            inject_latency(s3, args.latency / 1000)
+            bucket_root_path = f'benchmark/store_folder/{max_workers}'
+            t0 = time.time()
+            manifest = s3.store_folder(src_dir=src_dir, bucket_root_path=bucket_root_path, max_workers=max_workers)
+            elapsed = time.time() - t0
+            assert len(manifest) == args.files + args.large_files
+            baseline = baseline or elapsed
+            print(f'workers: {max_workers:3d}  time: {elapsed:7.2f} s  '
+                  f'throughput: {total_size / 1024**2 / elapsed:7.1f} MiB/s  speedup: {baseline / elapsed:5.1f}x')
+            s3.delete_directory(bucket_root_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+'''Benchmark matching positions to tiles with the tile index against fitsfinder.
+
+Draws random positions inside the tile footprints of a DES metadata database and matches them
+with fitsfinder.find_tilenames_radec (one query per position) and with the in-memory tile
+index, then reports the timings and any positions matched differently:
+
+    python scripts/benchmark_tile_index.py --db /data/db/des_metadata.duckdb --positions 1000 100000
+'''
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+import duckdb
+import numpy as np
+# Append the Cutout API module to the Python path for import
+sys.path.append(os.path.join(str(Path(__file__).resolve().parent.parent), 'app'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+from cutout.tile_index import TileIndex  # pyright: ignore[reportMissingImports]
+
+
+def random_positions(index, num_positions, rng):
+    '''Return random positions inside randomly chosen tiles.'''
+    tiles = rng.integers(0, len(index.tilenames), num_positions)
+    ra = rng.uniform(index.racmin[tiles], index.racmax[tiles]) % 360
+    dec = rng.uniform(index.decmin[tiles], index.decmax[tiles])
+    return ra, dec
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark matching positions to tiles.')
+    parser.add_argument('--db', default='/data/db/des_metadata.duckdb', help='DES metadata database')
+    parser.add_argument('--table', default='', help='tile geometry table (found automatically if empty)')
+    parser.add_argument('--positions', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help='numbers of positions to match')
+    parser.add_argument('--query-limit', type=int, default=10000,
+                        help='largest number of positions to match with one query per position')
+    args = parser.parse_args()
+
+    dbh = duckdb.connect(args.db, read_only=True)
+    index = TileIndex(table=args.table)
+    t0 = time.time()
+    index.load(dbh)
+    print(f'Built index of {len(index.tilenames)} tiles in {time.time() - t0:.2f} s')
+    rng = np.random.default_rng(0)
+    for num_positions in args.positions:
+        ra, dec = random_positions(index, num_positions, rng)
+        t0 = time.time()
+        tilenames, indices, tilenames_matched = index.find_tilenames_radec(ra, dec, dbh)
+        elapsed_index = time.time() - t0
+        line = f'positions: {num_positions:8d}  index: {elapsed_index:8.3f} s'
+        if num_positions <= args.query_limit:
+            from des_cutter import fitsfinder
+            t0 = time.time()
+            query_matched = fitsfinder.find_tilenames_radec(ra, dec, dbh)[2]
+            elapsed_query = time.time() - t0
+            mismatches = sum([a != b for a, b in zip(tilenames_matched, query_matched)])
+            line += (f'  query: {elapsed_query:8.3f} s  speedup: {elapsed_query / elapsed_index:8.1f}x'
+                     f'  mismatches: {mismatches}')
+        print(line)
+    dbh.close()
+
+
+if __name__ == '__main__':
+    main()